@@ -0,0 +1,182 @@
+import os
+import warnings
+
+import numpy as np
+import pandas as pd
+
+PARAMETRI_ANOMALIE = {'finestra_mesi': 12, 'soglia': 3.5, 'min_mesi': 3}
+
+# MAD / 0.6745 stima la deviazione standard per dati normali; se la MAD è zero si usa
+# lo scarto medio assoluto * 1.2533 (punteggio z modificato)
+_SCALA_MAD = 0.6745
+_SCALA_SCARTO_MEDIO = 1.253314
+
+
+def parametri_anomalie(config):
+    """Parametri del motore dalla sezione 'anomalie' di config.yaml, con i valori predefiniti."""
+    parametri = dict(PARAMETRI_ANOMALIE)
+    parametri.update({k: v for k, v in ((config or {}).get('anomalie') or {}).items() if k in parametri})
+    return parametri
+
+
+def serie_consumo_per_pezzo(df, macchina, periodo, consumo, pezzi):
+    """Serie (macchina, periodo, valore) del consumo per pezzo; NaN se produzione o consumo non sono positivi."""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        valore = df[consumo].to_numpy(dtype='float64') / df[pezzi].to_numpy(dtype='float64')
+        valore[~(np.isfinite(valore) & (valore > 0))] = np.nan
+    return pd.DataFrame({'macchina': df[macchina].astype(object).to_numpy(),
+                         'periodo': df[periodo].to_numpy(),
+                         'valore': valore})
+
+
+def _punteggi(serie, finestra, soglia, min_mesi):
+    """
+    Mediana e MAD mobili dei `finestra` valori precedenti della stessa macchina e punteggio robusto.
+
+    `serie` deve essere ordinata per macchina e periodo. I mesi senza valore non entrano
+    nella finestra e non ricevono un punteggio. Il calcolo è vettoriale su tutte le
+    macchine insieme: si costruisce la matrice (righe x finestra) dei valori precedenti.
+    """
+    valori = serie['valore'].to_numpy(dtype='float64')
+    validi = np.flatnonzero(np.isfinite(valori))
+    v = valori[validi]
+    gruppi = pd.factorize(serie['macchina'].to_numpy()[validi])[0]
+
+    # Posizione di ogni valore all'interno della propria macchina
+    inizi = np.flatnonzero(np.r_[True, gruppi[1:] != gruppi[:-1]]) if len(v) else np.array([], dtype='int64')
+    posizione = np.arange(len(v)) - np.repeat(inizi, np.diff(np.r_[inizi, len(v)]))
+
+    precedenti = np.full((len(v), finestra), np.nan)
+    for k in range(1, finestra + 1):
+        righe = np.flatnonzero(posizione >= k)
+        precedenti[righe, k - 1] = v[righe - k]
+
+    with warnings.catch_warnings():
+        # Righe senza storia: nanmedian/nanmean segnalano le finestre tutte NaN
+        warnings.simplefilter('ignore', RuntimeWarning)
+        mediana = np.nanmedian(precedenti, axis=1)
+        scarti = np.abs(precedenti - mediana[:, None])
+        mad = np.nanmedian(scarti, axis=1)
+        scala = np.where(mad > 0, mad / _SCALA_MAD, np.nanmean(scarti, axis=1) * _SCALA_SCARTO_MEDIO)
+
+    storia = np.minimum(posizione, finestra)
+    con_punteggio = (storia >= min_mesi) & (scala > 0)
+    punteggio = np.full(len(v), np.nan)
+    punteggio[con_punteggio] = (v[con_punteggio] - mediana[con_punteggio]) / scala[con_punteggio]
+
+    risultato = serie.copy()
+    for nome, colonna in (('mediana', mediana), ('mad', mad), ('punteggio', punteggio)):
+        completa = np.full(len(valori), np.nan)
+        completa[validi] = colonna
+        risultato[nome] = completa
+    esito = np.full(len(valori), None, dtype=object)
+    esito[risultato['punteggio'].to_numpy() > soglia] = 'ALTO'
+    esito[risultato['punteggio'].to_numpy() < -soglia] = 'BASSO'
+    risultato['anomalia'] = esito
+    return risultato
+
+
+class MotoreAnomalie:
+    """
+    Anomalie del consumo per pezzo rispetto alla storia recente di ogni macchina.
+
+    Per ogni mese si confronta il valore con mediana e MAD dei `finestra_mesi` mesi
+    precedenti (con un valore) della stessa macchina: il punteggio robusto è
+    (valore - mediana) / (MAD / 0.6745) e oltre ±`soglia` il mese è anomalo. Servono
+    almeno `min_mesi` mesi di storia. Con aggiorna() i mesi nuovi vengono valutati
+    usando solo la coda della storia già calcolata.
+    """
+
+    def __init__(self, finestra_mesi=12, soglia=3.5, min_mesi=3):
+        self.finestra_mesi = int(finestra_mesi)
+        self.soglia = float(soglia)
+        self.min_mesi = int(min_mesi)
+        self.risultati = None
+        self.righe_calcolate = 0
+
+    @property
+    def parametri(self):
+        return {'finestra_mesi': self.finestra_mesi, 'soglia': self.soglia, 'min_mesi': self.min_mesi}
+
+    def _calcola_ordinati(self, serie):
+        return _punteggi(serie, self.finestra_mesi, self.soglia, self.min_mesi)
+
+    def calcola(self, serie):
+        """Ricalcola i punteggi di tutta la serie (macchina, periodo, valore)."""
+        serie = serie.sort_values(['macchina', 'periodo'], kind='stable').reset_index(drop=True)
+        self.risultati = self._calcola_ordinati(serie)
+        self.righe_calcolate = len(serie)
+        return self.risultati
+
+    def _storia_invariata(self, serie):
+        """True se i mesi già calcolati sono ancora tutti presenti con lo stesso valore."""
+        unione = self.risultati[['macchina', 'periodo', 'valore']].merge(
+            serie, on=['macchina', 'periodo'], how='left', suffixes=('', '_nuovo'), indicator=True)
+        if (unione['_merge'] != 'both').any():
+            return False
+        prima, dopo = unione['valore'].to_numpy(), unione['valore_nuovo'].to_numpy(dtype='float64')
+        return bool(np.all((prima == dopo) | (np.isnan(prima) & np.isnan(dopo))))
+
+    def aggiorna(self, serie):
+        """
+        Valuta solo i mesi successivi all'ultimo già calcolato per ogni macchina.
+
+        Se la storia è cambiata (valori corretti, mesi rimossi o inseriti in mezzo) i
+        punteggi vengono ricalcolati da capo.
+        """
+        if self.risultati is None or not self._storia_invariata(serie):
+            return self.calcola(serie)
+
+        ultimo = self.risultati.groupby('macchina', sort=False)['periodo'].max()
+        noti = serie['macchina'].map(ultimo)
+        successivi = noti.isna().to_numpy().copy()
+        presenti = ~successivi
+        successivi[presenti] = serie['periodo'].to_numpy()[presenti] > noti.to_numpy()[presenti]
+        nuovi = serie[successivi]
+        gia_calcolati = len(serie) - len(nuovi)
+        if gia_calcolati != len(self.risultati):
+            # Mesi ripetuti o non successivi all'ultimo: la storia non è una semplice coda
+            return self.calcola(serie)
+        if nuovi.empty:
+            self.righe_calcolate = 0
+            return self.risultati
+
+        # Coda della storia (ultimi valori validi) delle macchine con mesi nuovi
+        storia = self.risultati[self.risultati['macchina'].isin(nuovi['macchina'].unique())
+                                & self.risultati['valore'].notna()]
+        coda = storia.groupby('macchina', sort=False).tail(self.finestra_mesi)[['macchina', 'periodo', 'valore']]
+        blocco = pd.concat([coda.assign(_nuovo=False), nuovi.assign(_nuovo=True)], ignore_index=True)
+        blocco = blocco.sort_values(['macchina', 'periodo'], kind='stable').reset_index(drop=True)
+        calcolati = self._calcola_ordinati(blocco)
+        calcolati = calcolati[calcolati.pop('_nuovo').to_numpy(dtype=bool)]
+
+        self.risultati = (pd.concat([self.risultati, calcolati], ignore_index=True)
+                          .sort_values(['macchina', 'periodo'], kind='stable').reset_index(drop=True))
+        self.righe_calcolate = len(nuovi)
+        return self.risultati
+
+    def anomalie(self):
+        """Solo i mesi anomali."""
+        return self.risultati[self.risultati['anomalia'].notna()]
+
+    def salva(self, percorso):
+        """Salva lo stato (parametri e punteggi calcolati) per il prossimo aggiorna()."""
+        cartella = os.path.dirname(percorso)
+        if cartella:
+            os.makedirs(cartella, exist_ok=True)
+        temporaneo = percorso + '.tmp'
+        pd.to_pickle({'parametri': self.parametri, 'risultati': self.risultati}, temporaneo)
+        os.replace(temporaneo, percorso)
+
+    @classmethod
+    def carica(cls, percorso, stampa=print, **parametri):
+        """Motore con lo stato salvato in `percorso`, se i parametri coincidono; altrimenti vuoto."""
+        motore = cls(**parametri)
+        if os.path.exists(percorso):
+            try:
+                stato = pd.read_pickle(percorso)
+                if stato.get('parametri') == motore.parametri:
+                    motore.risultati = stato['risultati']
+            except (OSError, ValueError, EOFError, KeyError) as e:
+                stampa(f"Stato delle anomalie non leggibile, verrà ricalcolato: {e}")
+        return motore
@@ -0,0 +1,101 @@
+import json
+import os
+import shutil
+
+# Copia colonnare del foglio 'Consolidato': si legge molto più velocemente dell'XLSX.
+# pandas viene importato solo dove serve: il controllo parquet_aggiornato() resta leggero
+# e può essere fatto prima di caricare le librerie pesanti (vedi energia.py).
+FILE_SORGENTE = '_sorgente.json'
+COLONNA_ORDINE = '_riga'
+
+
+def firma_file(file_path):
+    """Identifica una versione del file tramite data di modifica e dimensione."""
+    stat = os.stat(file_path)
+    return {'mtime_ns': stat.st_mtime_ns, 'dimensione': stat.st_size}
+
+
+def tipizza_consolidato(df, final_columns):
+    """Colonne del Consolidato con tipi espliciti: interi per anno/mese, testo per la macchina, float per le metriche."""
+    import pandas as pd
+
+    df = df[final_columns].copy()
+    for col in final_columns:
+        if col in ('anno', 'mese'):
+            df[col] = pd.to_numeric(df[col], errors='coerce').astype('int64')
+        elif col == 'macchina':
+            df[col] = df[col].astype('string')
+        else:
+            df[col] = pd.to_numeric(df[col], errors='coerce').astype('float64')
+    return df
+
+
+def scrivi_consolidato_parquet(df, cartella, file_excel, final_columns):
+    """
+    Scrive il Consolidato in formato Parquet, partizionato per anno.
+
+    La cartella viene prima scritta accanto a quella definitiva e poi sostituita, così chi
+    legge non vede mai un dataset a metà. Insieme ai dati viene salvata la firma del file
+    Excel da cui provengono, usata da leggi_consolidato_parquet() per riconoscere una copia
+    non aggiornata. Restituisce False se pyarrow non è installato.
+    """
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        print("ATTENZIONE: pyarrow non installato, la copia Parquet del Consolidato non viene creata.")
+        return False
+
+    df = tipizza_consolidato(df, final_columns)
+    # La lettura per partizioni perde l'ordine delle righe: lo si conserva in una colonna
+    df[COLONNA_ORDINE] = range(len(df))
+
+    cartella = os.path.normpath(cartella)
+    nuova = cartella + '.nuova'
+    vecchia = cartella + '.vecchia'
+    for residuo in (nuova, vecchia):
+        shutil.rmtree(residuo, ignore_errors=True)
+
+    df.to_parquet(nuova, partition_cols=['anno'], index=False)
+    with open(os.path.join(nuova, FILE_SORGENTE), 'w', encoding='utf-8') as f:
+        json.dump({'file_excel': os.path.basename(file_excel), 'colonne': list(final_columns),
+                   **firma_file(file_excel)}, f)
+
+    if os.path.exists(cartella):
+        os.replace(cartella, vecchia)
+    os.replace(nuova, cartella)
+    shutil.rmtree(vecchia, ignore_errors=True)
+    return True
+
+
+def _leggi_sorgente(cartella):
+    try:
+        with open(os.path.join(cartella, FILE_SORGENTE), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def parquet_aggiornato(cartella, file_excel):
+    """True se la copia Parquet esiste ed è stata creata dalla versione attuale del file Excel."""
+    sorgente = _leggi_sorgente(cartella)
+    if sorgente is None or not os.path.exists(file_excel):
+        return False
+    firma = firma_file(file_excel)
+    return sorgente.get('mtime_ns') == firma['mtime_ns'] and sorgente.get('dimensione') == firma['dimensione']
+
+
+def leggi_consolidato_parquet(cartella, file_excel):
+    """Legge la copia Parquet se è aggiornata, altrimenti restituisce None."""
+    if not parquet_aggiornato(cartella, file_excel):
+        return None
+    import pandas as pd
+
+    try:
+        df = pd.read_parquet(cartella)
+    except ImportError:
+        return None
+
+    # La colonna di partizione torna come categoria e in fondo: ripristina tipo e ordine
+    df['anno'] = df['anno'].astype('int64')
+    df = df.sort_values(COLONNA_ORDINE).reset_index(drop=True)
+    return df[_leggi_sorgente(cartella)['colonne']]
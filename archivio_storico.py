@@ -0,0 +1,250 @@
+import json
+import os
+import sqlite3
+import time
+
+from archivio_parquet import firma_file
+
+# Archivio storico del Consolidato in un database SQLite locale: una riga per
+# (macchina, anno, mese), aggiornata per upsert dai soli fogli cambiati. La dashboard
+# lo interroga per la sola selezione dei filtri invece di leggere tutto il Consolidato.
+# Come in archivio_parquet.py, pandas viene importato solo dove serve.
+TABELLA = 'consolidato'
+CHIAVE = ['macchina', 'anno', 'mese']
+
+
+def _schema(colonne_valori):
+    colonne = ''.join(f',\n    "{c}" REAL' for c in colonne_valori)
+    return f"""
+CREATE TABLE IF NOT EXISTS {TABELLA} (
+    macchina TEXT NOT NULL,
+    anno INTEGER NOT NULL,
+    mese INTEGER NOT NULL{colonne},
+    foglio TEXT NOT NULL,
+    PRIMARY KEY (macchina, anno, mese)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS {TABELLA}_periodo ON {TABELLA} (anno, mese);
+CREATE INDEX IF NOT EXISTS {TABELLA}_foglio ON {TABELLA} (foglio);
+CREATE TABLE IF NOT EXISTS fogli (foglio TEXT PRIMARY KEY, posizione INTEGER NOT NULL, impronta TEXT);
+CREATE TABLE IF NOT EXISTS metadati (chiave TEXT PRIMARY KEY, valore TEXT NOT NULL);
+"""
+
+
+def _leggi_metadati(con):
+    try:
+        return {k: json.loads(v) for k, v in con.execute("SELECT chiave, valore FROM metadati")}
+    except sqlite3.OperationalError:
+        # Database nuovo o creato da una versione precedente
+        return {}
+
+
+def _prepara_schema(con, final_columns):
+    """Crea le tabelle; se le colonne del Consolidato sono cambiate l'archivio viene ricreato da capo."""
+    colonne = [c for c in final_columns if c not in CHIAVE]
+    if _leggi_metadati(con).get('colonne', colonne) != colonne:
+        print("Le colonne del Consolidato sono cambiate: l'archivio storico viene ricreato.")
+        con.executescript(f"DROP TABLE IF EXISTS {TABELLA}; DROP TABLE IF EXISTS fogli; DROP TABLE IF EXISTS metadati;")
+    elif 'impronta' not in {r[1] for r in con.execute("PRAGMA table_info(fogli)")}:
+        # Archivio senza impronte dei fogli (versione precedente): tutti i fogli vengono riscritti
+        con.execute("DROP TABLE IF EXISTS fogli")
+    con.executescript(_schema(colonne))
+    return colonne
+
+
+def _righe_sql(df, colonne, foglio):
+    """Tuple pronte per executemany: chiave con i tipi SQLite, NaN -> NULL, ultima riga vince sui duplicati."""
+    import pandas as pd
+
+    df = df.dropna(subset=CHIAVE).drop_duplicates(subset=CHIAVE, keep='last')
+    valori = df[colonne].apply(pd.to_numeric, errors='coerce').astype(object)
+    valori = valori.where(valori.notna(), None)
+    return list(zip(df['macchina'].astype(str), df['anno'].astype('int64').tolist(),
+                    df['mese'].astype('int64').tolist(), *(valori[c].tolist() for c in colonne),
+                    [foglio] * len(df)))
+
+
+def aggiorna_storico(percorso, fogli, impronte, file_excel, final_columns, tutti=False):
+    """
+    Allinea l'archivio SQLite al Consolidato appena salvato, in un'unica transazione.
+
+    `fogli` associa a ogni foglio del workbook (nell'ordine del file) le sue righe con le
+    colonne finali, `impronte` la sua impronta (vedi cache_fogli.impronte_fogli), salvata
+    nella tabella dei fogli. Vengono scritti per upsert solo i fogli la cui impronta è
+    diversa da quella archiviata, quindi l'archivio si riallinea anche se un
+    aggiornamento precedente è fallito o è stato saltato; senza impronte (None) o con
+    tutti=True vengono scritti tutti. Le righe sparite da un foglio riscritto e i fogli
+    rimossi dal workbook vengono cancellati. Le righe senza chiave non vengono archiviate
+    e, se una chiave compare più volte, vale l'ultima riga. Insieme ai dati viene salvata
+    la firma del file Excel, usata da StoricoConsolidato.se_aggiornato().
+    Restituisce il numero di righe inserite, modificate o cancellate.
+    """
+    cartella = os.path.dirname(percorso)
+    if cartella:
+        os.makedirs(cartella, exist_ok=True)
+    con = sqlite3.connect(percorso)
+    try:
+        colonne = _prepara_schema(con, final_columns)
+        elenco = ', '.join(f'"{c}"' for c in CHIAVE + colonne + ['foglio'])
+        segnaposti = ', '.join('?' * (len(CHIAVE) + len(colonne) + 1))
+        aggiornamenti = ', '.join(f'"{c}" = excluded."{c}"' for c in colonne + ['foglio'])
+        # Le righe identiche non vengono riscritte
+        diverse = ' OR '.join(f'"{c}" IS NOT excluded."{c}"' for c in colonne + ['foglio'])
+        upsert = (f"INSERT INTO {TABELLA} ({elenco}) VALUES ({segnaposti}) "
+                  f"ON CONFLICT (macchina, anno, mese) DO UPDATE SET {aggiornamenti} WHERE {diverse}")
+
+        modifiche = 0
+        with con:
+            archiviate = dict(con.execute("SELECT foglio, impronta FROM fogli"))
+            presenti = set(archiviate)
+            impronte = impronte or {}
+            for foglio in presenti - set(fogli):
+                modifiche += con.execute(f"DELETE FROM {TABELLA} WHERE foglio = ?", (foglio,)).rowcount
+
+            con.execute("CREATE TEMP TABLE IF NOT EXISTS chiavi_foglio "
+                        "(macchina TEXT, anno INTEGER, mese INTEGER, PRIMARY KEY (macchina, anno, mese))")
+            for foglio, df in fogli.items():
+                impronta = impronte.get(foglio)
+                if not tutti and impronta is not None and archiviate.get(foglio) == impronta:
+                    continue
+                righe = _righe_sql(df, colonne, foglio)
+                con.execute("DELETE FROM chiavi_foglio")
+                con.executemany("INSERT INTO chiavi_foglio VALUES (?, ?, ?)", [r[:3] for r in righe])
+                modifiche += con.execute(f"DELETE FROM {TABELLA} WHERE foglio = ? AND NOT EXISTS ("
+                                         f"SELECT 1 FROM chiavi_foglio k WHERE k.macchina = {TABELLA}.macchina "
+                                         f"AND k.anno = {TABELLA}.anno AND k.mese = {TABELLA}.mese)",
+                                         (foglio,)).rowcount
+                modifiche += con.executemany(upsert, righe).rowcount
+
+            con.execute("DELETE FROM fogli")
+            con.executemany("INSERT INTO fogli VALUES (?, ?, ?)",
+                            [(f, i, impronte.get(f)) for i, f in enumerate(fogli)])
+            metadati = {'colonne': colonne, 'colonne_finali': list(final_columns),
+                        'file_excel': os.path.basename(file_excel), 'aggiornato_il': time.time(),
+                        **firma_file(file_excel)}
+            con.executemany("INSERT OR REPLACE INTO metadati VALUES (?, ?)",
+                            [(k, json.dumps(v)) for k, v in metadati.items()])
+        return modifiche
+    finally:
+        con.close()
+
+
+class StoricoConsolidato:
+    """
+    Interrogazioni in sola lettura dell'archivio: elenchi per i filtri e righe della selezione.
+
+    Ogni interrogazione apre una propria connessione, quindi l'oggetto può essere
+    condiviso tra i thread (le sessioni della dashboard).
+    """
+
+    def __init__(self, percorso):
+        self.percorso = percorso
+
+    @classmethod
+    def se_aggiornato(cls, percorso, file_excel):
+        """Archivio in `percorso` se è stato scritto dalla versione attuale del file Excel, altrimenti None."""
+        if not percorso or not os.path.exists(percorso) or not os.path.exists(file_excel):
+            return None
+        storico = cls(percorso)
+        try:
+            metadati = storico.metadati()
+        except sqlite3.Error:
+            return None
+        firma = firma_file(file_excel)
+        if metadati.get('mtime_ns') != firma['mtime_ns'] or metadati.get('dimensione') != firma['dimensione']:
+            return None
+        return storico
+
+    def _connetti(self):
+        return sqlite3.connect(f"file:{os.path.abspath(self.percorso)}?mode=ro", uri=True)
+
+    def _interroga(self, sql, parametri=()):
+        con = self._connetti()
+        try:
+            return con.execute(sql, parametri).fetchall()
+        finally:
+            con.close()
+
+    def metadati(self):
+        con = self._connetti()
+        try:
+            return _leggi_metadati(con)
+        finally:
+            con.close()
+
+    def versione(self):
+        """Cambia a ogni aggiornamento dell'archivio (utile come chiave di cache)."""
+        stat = os.stat(self.percorso)
+        return stat.st_mtime_ns, stat.st_size
+
+    def macchine(self):
+        """Macchine nell'ordine dei fogli del workbook."""
+        return [m for (m,) in self._interroga(
+            f"SELECT c.macchina FROM {TABELLA} c JOIN fogli f USING (foglio) "
+            f"GROUP BY c.macchina ORDER BY MIN(f.posizione), c.macchina")]
+
+    def anni(self):
+        return [a for (a,) in self._interroga(f"SELECT DISTINCT anno FROM {TABELLA} ORDER BY anno")]
+
+    def mesi(self):
+        return [m for (m,) in self._interroga(f"SELECT DISTINCT mese FROM {TABELLA} ORDER BY mese")]
+
+    @staticmethod
+    def _condizioni(macchine=None, anno=None, mese=None):
+        condizioni, parametri = [], []
+        if macchine:
+            condizioni.append(f"c.macchina IN ({', '.join('?' * len(macchine))})")
+            parametri.extend(macchine)
+        if anno is not None:
+            condizioni.append("c.anno = ?")
+            parametri.append(int(anno))
+        if mese is not None:
+            condizioni.append("c.mese = ?")
+            parametri.append(int(mese))
+        return condizioni, parametri
+
+    def _leggi(self, sql, parametri):
+        import pandas as pd
+
+        con = self._connetti()
+        try:
+            return pd.read_sql_query(sql, con, params=parametri)
+        finally:
+            con.close()
+
+    def righe(self, macchine=None, anno=None, mese=None, colonne=None):
+        """
+        Righe della selezione (tutte le macchine se la lista è vuota) con le colonne finali
+        del Consolidato, ordinate per foglio, anno e mese. Le condizioni usano la chiave
+        primaria (macchina) o l'indice sul periodo (anno, mese).
+        """
+        colonne = colonne or self.metadati()['colonne_finali']
+        condizioni, parametri = self._condizioni(macchine, anno, mese)
+        where = f"WHERE {' AND '.join(condizioni)}" if condizioni else ''
+        selezione = ', '.join(f'c."{c}"' for c in colonne)
+        sql = (f"SELECT {selezione} "
+               f"FROM {TABELLA} c JOIN fogli f USING (foglio) {where} "
+               f"ORDER BY f.posizione, c.macchina, c.anno, c.mese")
+        return self._leggi(sql, parametri)
+
+    def righe_storia(self, macchine, anno, mese, finestra, consumo, pezzi, colonne=None):
+        """
+        Righe necessarie a valutare le anomalie della selezione: per ogni macchina, i mesi
+        con consumo per pezzo positivo dal `finestra`-esimo precedente il primo mese
+        selezionato fino all'ultimo. La storia letta dipende quindi dalla selezione e dalla
+        finestra, non dalla lunghezza dell'archivio.
+        """
+        colonne = colonne or self.metadati()['colonne_finali']
+        filtri_macchine, parametri_macchine = self._condizioni(macchine)
+        filtri_periodo, parametri_periodo = self._condizioni(None, anno, mese)
+        valore = f'c."{consumo}" / c."{pezzi}" > 0'
+        scelta = ' AND '.join(filtri_periodo) or '1'
+        selezione = ', '.join(f'c."{c}"' for c in colonne)
+        sql = (f"WITH valide AS (SELECT c.macchina, c.anno, c.mese, {scelta} AS scelta, "
+               f"ROW_NUMBER() OVER (PARTITION BY c.macchina ORDER BY c.anno, c.mese) AS n "
+               f"FROM {TABELLA} c WHERE {' AND '.join(filtri_macchine + [valore])}), "
+               f"limiti AS (SELECT macchina, MIN(n) AS primo, MAX(n) AS ultimo FROM valide WHERE scelta "
+               f"GROUP BY macchina) "
+               f"SELECT {selezione} FROM {TABELLA} c JOIN valide v USING (macchina, anno, mese) "
+               f"JOIN limiti l USING (macchina) WHERE v.n BETWEEN l.primo - ? AND l.ultimo "
+               f"ORDER BY c.macchina, c.anno, c.mese")
+        return self._leggi(sql, parametri_periodo + parametri_macchine + [int(finestra)])
@@ -0,0 +1,85 @@
+"""
+Tempo di avvio dei comandi da riga di comando, con `python -X importtime`.
+
+Ogni scenario viene eseguito in un processo separato, in una cartella temporanea con il
+config.yaml del progetto ma senza file di input: misura quanto costa arrivare al primo
+messaggio (aiuto o errore di validazione), cioè il caso in cui le importazioni pesanti
+non servono. Per ogni scenario stampa il tempo totale (mediana su --ripetizioni
+esecuzioni), il tempo speso nelle importazioni e i moduli più costosi.
+
+    python benchmarks/bench_avvio.py --ripetizioni 5
+"""
+import argparse
+import os
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+PROGETTO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODULI_PESANTI = ('pandas', 'openpyxl', 'pydantic', 'streamlit', 'plotly')
+SCENARI = {
+    'energia --help': ['energia.py', '--help'],
+    'energia report (input mancanti)': ['energia.py', 'report'],
+    'energia consolida (Excel mancante)': ['energia.py', 'consolida'],
+    'energia prepara-dashboard (Excel mancante)': ['energia.py', 'prepara-dashboard'],
+    'unisci_dati.py (input mancanti)': ['unisci_dati.py'],
+    'crea_consolidato.py (Excel mancante)': ['crea_consolidato.py'],
+}
+# "import time:       self [us] |  cumulative | imported package"
+RIGA_IMPORTTIME = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)')
+
+
+def analizza_importtime(stderr):
+    """
+    Microsecondi totali di importazione, costo cumulativo dei moduli di primo livello
+    e pacchetti importati (a qualunque livello).
+    """
+    moduli, pacchetti = {}, set()
+    for riga in stderr.splitlines():
+        corrispondenza = RIGA_IMPORTTIME.match(riga)
+        if not corrispondenza:
+            continue
+        pacchetti.add(corrispondenza.group(4).split('.')[0])
+        if not corrispondenza.group(3):
+            moduli[corrispondenza.group(4)] = int(corrispondenza.group(2))
+    return sum(moduli.values()), moduli, pacchetti
+
+
+def esegui(comando, cartella):
+    inizio = time.perf_counter()
+    script, *argomenti = comando
+    processo = subprocess.run([sys.executable, '-X', 'importtime', os.path.join(PROGETTO, script), *argomenti],
+                              cwd=cartella, capture_output=True, text=True)
+    return time.perf_counter() - inizio, processo
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--ripetizioni', type=int, default=3)
+    parser.add_argument('--moduli', type=int, default=5, help="Moduli più costosi da mostrare per scenario")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as cartella:
+        shutil.copy(os.path.join(PROGETTO, 'config.yaml'), cartella)
+
+        print(f"{'scenario':<44} {'totale':>9} {'import':>9} {'uscita':>7}  moduli pesanti")
+        for scenario, comando in SCENARI.items():
+            tempi, importazioni = [], []
+            for _ in range(args.ripetizioni):
+                secondi, processo = esegui(comando, cartella)
+                tempi.append(secondi)
+                totale_us, moduli, pacchetti = analizza_importtime(processo.stderr)
+                importazioni.append(totale_us / 1e6)
+            pesanti = [m for m in MODULI_PESANTI if m in pacchetti]
+            print(f"{scenario:<44} {statistics.median(tempi):8.3f}s {statistics.median(importazioni):8.3f}s "
+                  f"{processo.returncode:>7}  {', '.join(pesanti) or '-'}")
+            for modulo, us in sorted(moduli.items(), key=lambda m: -m[1])[:args.moduli]:
+                print(f"    {modulo:<40} {us / 1e6:8.3f}s")
+
+
+if __name__ == "__main__":
+    main()
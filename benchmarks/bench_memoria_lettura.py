@@ -0,0 +1,108 @@
+"""
+Picco di memoria (tracemalloc) della lettura dei fogli macchina: pd.ExcelFile/read_excel
+contro la lettura in streaming a blocchi di lettura_fogli.py.
+
+Uso:
+    python benchmarks/bench_memoria_lettura.py --fogli 100 --righe 10000
+    python benchmarks/bench_memoria_lettura.py --file workbook_esistente.xlsx
+
+Nota: tracemalloc misura solo le allocazioni fatte da Python; il parser XML
+usato da openpyxl rientra nella misura solo se è quello della libreria standard.
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+from openpyxl import Workbook
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from elaborazione_fogli import elabora_fogli
+from lettura_fogli import apri_workbook
+from validazione import normalizza_colonne, valida_colonne
+
+INTESTAZIONE = ['anno ', 'mese ', 'macchina o impianto', 'ore produzione macchina', 'pezzi prodotti',
+                'consumo ', 'lettura ', 'costo energia', 'costo macchina', 'consumo da bolletta',
+                'totale bolletta']
+
+
+def genera_workbook(percorso, fogli, righe, seed=42):
+    """Scrive un workbook sintetico con fogli macchina nel formato del file reale."""
+    rng = np.random.default_rng(seed)
+    wb = Workbook(write_only=True)
+    for i in range(fogli):
+        nome = f"M{i:03d}"
+        ws = wb.create_sheet(nome)
+        ws.append(INTESTAZIONE)
+        ore = rng.uniform(0, 300, righe).round(2)
+        pezzi = rng.integers(0, 150000, righe)
+        consumo = rng.uniform(0, 2000, righe).round(2)
+        costo = rng.uniform(0.15, 0.35, righe).round(4)
+        for r in range(righe):
+            ws.append([2000 + r // 12, r % 12 + 1, nome, float(ore[r]), int(pezzi[r]), float(consumo[r]),
+                       None, float(costo[r]), None, None, None])
+    wb.save(percorso)
+
+
+def lettura_pandas(percorso):
+    """Percorso precedente: pd.ExcelFile + read_excel di ogni foglio intero."""
+    xls = pd.ExcelFile(percorso, engine='openpyxl')
+    validi = []
+    for sheet_name in xls.sheet_names:
+        df = normalizza_colonne(pd.read_excel(xls, sheet_name=sheet_name, header=0))
+        validi.append(valida_colonne(df)[0])
+    return pd.concat(validi, ignore_index=True)
+
+
+def lettura_streaming(percorso, righe_per_blocco):
+    workbook = apri_workbook(percorso)
+    validi = [v for _, v, _ in elabora_fogli(percorso, workbook.sheetnames, processi=1,
+                                             workbook=workbook, righe_per_blocco=righe_per_blocco)]
+    workbook.close()
+    return pd.concat(validi, ignore_index=True)
+
+
+def misura(descrizione, funzione, *args):
+    tracemalloc.start()
+    inizio = time.perf_counter()
+    risultato = funzione(*args)
+    durata = time.perf_counter() - inizio
+    _, picco = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{descrizione:<28} picco {picco / 2**20:8.1f} MiB   tempo (con tracemalloc) {durata:7.2f} s   righe {len(risultato)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--fogli', type=int, default=100)
+    parser.add_argument('--righe', type=int, default=10000)
+    parser.add_argument('--righe-per-blocco', type=int, default=5000)
+    parser.add_argument('--file', help="Usa un workbook esistente invece di generarlo")
+    args = parser.parse_args()
+
+    percorso = args.file
+    if percorso is None:
+        percorso = os.path.join(tempfile.mkdtemp(), 'sintetico.xlsx')
+        print(f"Genero il workbook sintetico ({args.fogli} fogli x {args.righe} righe)...")
+        genera_workbook(percorso, args.fogli, args.righe)
+
+    misura("pd.ExcelFile + read_excel", lettura_pandas, percorso)
+    misura("Streaming a blocchi", _silenzioso(lettura_streaming), percorso, args.righe_per_blocco)
+
+
+def _silenzioso(funzione):
+    """Nasconde i messaggi di avanzamento per foglio."""
+    def eseguita(*args):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return funzione(*args)
+    return eseguita
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Micro-benchmark della pulizia numerica di load_and_clean_data su un Consolidato sintetico:
+ciclo colonna per colonna con replace/to_numeric e data da stringhe (versione precedente)
+contro converti_numeri_italiani e data_da_anno_mese di pulizia_dati.py.
+
+Uso:
+    python benchmarks/bench_pulizia_dashboard.py --righe 1000000
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from pulizia_dati import converti_numeri_italiani, data_da_anno_mese
+
+NUMERIC_COLS = [
+    'anno', 'mese', 'ore_produzione', 'pezzi_prodotti', 'consumo_kwh',
+    'lettura', 'costo_energia_per_kwh', 'costo_macchina', 'consumo_bolletta_kwh', 'totale_bolletta'
+]
+
+
+def genera_consolidato(righe, seed=42):
+    """Consolidato sintetico: metriche numeriche, costi come testo in formato italiano e qualche '-'."""
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        'anno': 2000 + np.arange(righe) // 12 % 40,
+        'mese': np.arange(righe) % 12 + 1,
+        'macchina': rng.choice([f"M{i:03d}" for i in range(200)], righe),
+        'ore_produzione': rng.uniform(0, 300, righe).round(2),
+        'pezzi_prodotti': rng.integers(0, 150000, righe).astype(float),
+        'consumo_kwh': rng.uniform(0, 2000, righe).round(2),
+        'lettura': np.nan,
+    })
+    for col, scala in (('costo_energia_per_kwh', 0.35), ('costo_macchina', 700), ('totale_bolletta', 25000)):
+        valori = pd.Series(np.char.mod('%.2f €', rng.uniform(0, scala, righe))).str.replace('.', ',', regex=False)
+        valori[rng.random(righe) < 0.05] = '-'
+        df[col] = valori.astype(object)
+    df['consumo_bolletta_kwh'] = pd.Series(rng.integers(40000, 90000, righe).astype(str)).astype(object)
+    return df
+
+
+def pulizia_precedente(df):
+    for col in NUMERIC_COLS:
+        if df[col].dtype == 'object':
+            df[col] = df[col].astype(str).str.replace(' €', '', regex=False).str.replace(',', '.', regex=False)
+        df[col] = pd.to_numeric(df[col], errors='coerce')
+    df['data'] = pd.to_datetime(df['anno'].astype(str) + '-' + df['mese'].astype(str) + '-01', errors='coerce')
+    return df
+
+
+def pulizia_vettoriale(df):
+    df = converti_numeri_italiani(df, NUMERIC_COLS)
+    df['data'] = data_da_anno_mese(df['anno'], df['mese'])
+    return df
+
+
+def cronometra(descrizione, funzione, df):
+    inizio = time.perf_counter()
+    risultato = funzione(df.copy())
+    print(f"{descrizione:<24} {time.perf_counter() - inizio:8.2f} s")
+    return risultato
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--righe', type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    print(f"Genero un Consolidato sintetico di {args.righe} righe...")
+    df = genera_consolidato(args.righe)
+
+    prima = cronometra("Colonna per colonna", pulizia_precedente, df)
+    dopo = cronometra("Blocco vettoriale", pulizia_vettoriale, df)
+
+    pd.testing.assert_frame_equal(prima[NUMERIC_COLS], dopo[NUMERIC_COLS], check_dtype=False)
+    assert (prima['data'].values == dopo['data'].values).all(), "Le date non coincidono"
+    print("Risultati identici.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Micro-benchmark della scrittura del foglio "Report Macchine" di unisci_dati.py:
+scrittura cella per cella con pivot per gruppo e bordo applicato a ogni cella (versione
+precedente) contro scrivi_report_macchine di report_macchine.py (pivot unico e foglio write-only).
+
+Uso:
+    python benchmarks/bench_report_macchine.py --macchine 200 --mesi 60
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+from openpyxl import Workbook, load_workbook
+from openpyxl.styles import Border, Side
+from openpyxl.utils import get_column_letter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from report_macchine import scrivi_report_macchine
+
+
+def genera_mensile(macchine, mesi, seed=42):
+    """df_monthly sintetico (Mese 'YYYY-MM', Macchina, quantità e consumo) con qualche mese mancante."""
+    rng = np.random.default_rng(seed)
+    periodi = pd.period_range('2020-01', periods=mesi, freq='M').strftime('%Y-%m')
+    df = pd.DataFrame({
+        'Mese': np.tile(periodi, macchine),
+        'Macchina': np.repeat([f"M{i:03d}" for i in range(macchine)], mesi),
+        'Quantita Prodotta': rng.integers(0, 100000, macchine * mesi),
+        'Consumo Energia': rng.uniform(0, 5000, macchine * mesi).round(2),
+    })
+    return df[rng.random(len(df)) > 0.05].reset_index(drop=True)
+
+
+def report_precedente(df_monthly, file_output, machines_per_row=3):
+    all_machines = df_monthly['Macchina'].unique().tolist()
+    all_machines.sort()
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "Report Macchine"
+    ws.page_setup.orientation = 'portrait'
+    ws.page_setup.paperSize = 9
+    current_row = 1
+    for group_start_idx in range(0, len(all_machines), machines_per_row):
+        current_machines_chunk = all_machines[group_start_idx:group_start_idx + machines_per_row]
+        df_chunk_monthly = df_monthly[df_monthly['Macchina'].isin(current_machines_chunk)]
+        df_chunk_wide = df_chunk_monthly.pivot(index='Mese', columns='Macchina', values=['Quantita Prodotta', 'Consumo Energia'])
+        df_chunk_wide = df_chunk_wide.swaplevel(0, 1, axis=1)
+        df_chunk_wide.sort_index(axis=1, level=[0, 1], inplace=True)
+        ws.cell(row=current_row, column=1, value="Mese")
+        current_col = 2
+        for machine_name in current_machines_chunk:
+            ws.cell(row=current_row, column=current_col, value=machine_name)
+            ws.merge_cells(start_row=current_row, start_column=current_col, end_row=current_row, end_column=current_col + 1)
+            current_col += 2
+        current_row += 1
+        ws.cell(row=current_row, column=1, value="")
+        current_col = 2
+        for machine_name in current_machines_chunk:
+            ws.cell(row=current_row, column=current_col, value="kWh")
+            ws.cell(row=current_row, column=current_col + 1, value="Pezzi")
+            current_col += 2
+        current_row += 1
+        for row_data in df_chunk_wide.reset_index().values.tolist():
+            ws.append(row_data)
+            current_row += 1
+        if group_start_idx + machines_per_row < len(all_machines):
+            ws.append([])
+            current_row += 1
+    thin_border = Border(left=Side(style='thin'), right=Side(style='thin'),
+                         top=Side(style='thin'), bottom=Side(style='thin'))
+    for row in ws.iter_rows(min_row=1, max_row=ws.max_row, min_col=1, max_col=ws.max_column):
+        for cell in row:
+            cell.border = thin_border
+    for col_idx in range(1, ws.max_column + 1):
+        ws.column_dimensions[get_column_letter(col_idx)].width = 15
+    wb.save(file_output)
+
+
+def contenuto(percorso):
+    """Valori, bordi, celle unite, larghezze e impostazioni di pagina del foglio."""
+    ws = load_workbook(percorso)["Report Macchine"]
+    celle = [(c.coordinate, c.value, c.border.left.style, c.border.bottom.style)
+             for riga in ws.iter_rows() for c in riga]
+    larghezze = {k: d.width for k, d in ws.column_dimensions.items()}
+    return (celle, sorted(str(r) for r in ws.merged_cells.ranges), larghezze,
+            ws.page_setup.orientation, ws.page_setup.paperSize)
+
+
+def cronometra(descrizione, funzione, df, percorso):
+    inizio = time.perf_counter()
+    funzione(df, percorso)
+    print(f"{descrizione:<28} {time.perf_counter() - inizio:8.2f} s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--macchine', type=int, default=200)
+    parser.add_argument('--mesi', type=int, default=60)
+    args = parser.parse_args()
+
+    df = genera_mensile(args.macchine, args.mesi)
+    print(f"Report di {args.macchine} macchine x {args.mesi} mesi ({len(df)} righe mensili)")
+    with tempfile.TemporaryDirectory() as cartella:
+        prima = os.path.join(cartella, 'prima.xlsx')
+        dopo = os.path.join(cartella, 'dopo.xlsx')
+        cronometra("Cella per cella", report_precedente, df, prima)
+        cronometra("Pivot unico, write-only", scrivi_report_macchine, df, dopo)
+        assert contenuto(prima) == contenuto(dopo), "I report non coincidono"
+    print("Report identici.")
+
+
+if __name__ == "__main__":
+    main()
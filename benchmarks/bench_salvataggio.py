@@ -0,0 +1,71 @@
+"""
+Tempi di salvataggio del foglio 'Consolidato' su un workbook grande: percorso precedente
+(load_workbook + dataframe_to_rows + save dell'intero file) contro la sostituzione della
+sola parte XML del foglio di scrittura_consolidato.py.
+
+Uso:
+    python benchmarks/bench_salvataggio.py --fogli 30 --righe 5000
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import openpyxl
+import pandas as pd
+from openpyxl.utils.dataframe import dataframe_to_rows
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bench_memoria_lettura import genera_workbook
+from elaborazione_fogli import elabora_fogli
+from scrittura_consolidato import salva_foglio_consolidato
+
+
+def salvataggio_openpyxl(df, file_path):
+    """Percorso precedente di crea_consolidato.py."""
+    book = openpyxl.load_workbook(file_path)
+    if 'Consolidato' in book.sheetnames:
+        book.remove(book['Consolidato'])
+    new_sheet = book.create_sheet('Consolidato')
+    for r in dataframe_to_rows(df, index=False, header=True):
+        new_sheet.append(r)
+    book.save(file_path)
+
+
+def cronometra(descrizione, funzione, df, file_path):
+    inizio = time.perf_counter()
+    funzione(df, file_path)
+    print(f"{descrizione:<36} {time.perf_counter() - inizio:8.2f} s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--fogli', type=int, default=30)
+    parser.add_argument('--righe', type=int, default=5000)
+    args = parser.parse_args()
+
+    cartella = tempfile.mkdtemp()
+    try:
+        originale = os.path.join(cartella, 'sintetico.xlsx')
+        print(f"Genero il workbook sintetico ({args.fogli} fogli x {args.righe} righe)...")
+        genera_workbook(originale, args.fogli, args.righe)
+        fogli = openpyxl.load_workbook(originale, read_only=True).sheetnames
+        df = pd.concat([v for _, v, _ in elabora_fogli(originale, fogli, processi=1)], ignore_index=True)
+
+        # Primo salvataggio: il foglio 'Consolidato' deve esistere già, come nel file reale
+        salvataggio_openpyxl(df, originale)
+        print(f"Consolidato di {len(df)} righe, file di {os.path.getsize(originale) / 2**20:.1f} MiB")
+
+        for descrizione, funzione in (("Prima (openpyxl, intero workbook)", salvataggio_openpyxl),
+                                      ("Dopo (solo la parte del foglio)", salva_foglio_consolidato)):
+            copia = os.path.join(cartella, 'copia.xlsx')
+            shutil.copy(originale, copia)
+            cronometra(descrizione, funzione, df, copia)
+    finally:
+        shutil.rmtree(cartella, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
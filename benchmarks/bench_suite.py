@@ -0,0 +1,232 @@
+"""
+Benchmark delle tre procedure (crea_consolidato.py, unisci_dati.py e la preparazione dei
+dati della dashboard) su file sintetici generati con dati_sintetici.py.
+
+Per ogni fase (lettura, validazione, unione, aggregazione, scrittura, ...) misura il tempo
+e, in un secondo passaggio separato sotto tracemalloc, il picco di memoria. I risultati si
+possono salvare in un file JSON e confrontare con una misura precedente:
+
+    python benchmarks/bench_suite.py --scala media --salva benchmarks/baseline.json
+    python benchmarks/bench_suite.py --scala media --confronta benchmarks/baseline.json
+
+Con --confronta il codice di uscita è 1 se almeno una fase è più lenta della baseline
+oltre la tolleranza (predefinita 20%).
+
+Nota: tracemalloc misura solo le allocazioni fatte da Python e numpy (non quelle di pyarrow).
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+import openpyxl
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from caricamento_dashboard import DatiDashboard
+from crea_consolidato import crea_foglio_consolidato
+from dati_produzione import (aggrega_mensile, formato_lungo, leggi_consumo, leggi_quantita, mensile_in_streaming,
+                             unisci_produzione)
+from lettura_fogli import apri_workbook, blocchi_foglio
+from pulizia_dati import pulisci_consolidato
+from scrittura_consolidato import salva_foglio_consolidato
+from unisci_dati import scrivi_anomalie, scrivi_globale, scrivi_report
+from validazione import normalizza_colonne, valida_colonne
+
+from dati_sintetici import genera_tutto
+
+VERSIONE_RISULTATI = 1
+SCALE = {
+    'piccola': {'fogli': 10, 'righe': 500, 'macchine': 30, 'mesi': 24},
+    'media': {'fogli': 50, 'righe': 2000, 'macchine': 100, 'mesi': 60},
+    'grande': {'fogli': 100, 'righe': 10000, 'macchine': 300, 'mesi': 120},
+}
+GRUPPI = ('consolidato', 'report', 'dashboard')
+
+
+def _righe(risultato):
+    """Righe prodotte da una fase, se il risultato è un DataFrame o una lista di DataFrame."""
+    if isinstance(risultato, pd.DataFrame):
+        return len(risultato)
+    if isinstance(risultato, list) and all(isinstance(r, pd.DataFrame) for r in risultato):
+        return sum(len(r) for r in risultato)
+    return None
+
+
+class Misuratore:
+    """Esegue le fasi, ne misura tempo e (a parte) picco di memoria e raccoglie i risultati."""
+
+    def __init__(self, memoria=True):
+        self.memoria = memoria
+        self.fasi = {}
+
+    def __call__(self, nome, funzione, *args):
+        with contextlib.redirect_stdout(io.StringIO()):
+            inizio = time.perf_counter()
+            risultato = funzione(*args)
+            secondi = time.perf_counter() - inizio
+
+            picco = None
+            if self.memoria:
+                tracemalloc.start()
+                funzione(*args)
+                picco = tracemalloc.get_traced_memory()[1] / 2**20
+                tracemalloc.stop()
+
+        self.fasi[nome] = {'secondi': round(secondi, 4), 'picco_mib': None if picco is None else round(picco, 2),
+                           'righe': _righe(risultato)}
+        memoria = '' if picco is None else f"   picco {picco:8.1f} MiB"
+        print(f"{nome:<34} {secondi:8.2f} s{memoria}")
+        return risultato
+
+
+def fasi_consolidato(misura, config):
+    file_excel = config['file_excel']
+    mappatura = {k.replace(' ', '_'): v for k, v in config['mappatura_colonne'].items()}
+
+    def lettura():
+        workbook = apri_workbook(file_excel)
+        fogli = [s for s in workbook.sheetnames if s not in set(config['fogli_da_escludere'])]
+        blocchi = [df for foglio in fogli for df in blocchi_foglio(workbook, foglio)]
+        workbook.close()
+        return blocchi
+
+    def validazione(blocchi):
+        return [valida_colonne(normalizza_colonne(df.copy()))[0] for df in blocchi]
+
+    blocchi = misura('consolidato.lettura', lettura)
+    validi = misura('consolidato.validazione', validazione, blocchi)
+    consolidato = pd.concat(validi, ignore_index=True).rename(columns=mappatura)
+    consolidato = consolidato.reindex(columns=config['colonne_finali'])
+    misura('consolidato.scrittura', salva_foglio_consolidato, consolidato, file_excel)
+    # Procedura completa (senza cache), che lascia nel workbook il foglio Consolidato per la dashboard
+    misura('consolidato.completo', crea_foglio_consolidato, True)
+
+
+def fasi_report(misura, config):
+    percorsi = config['report']
+    df_quantita = misura('report.lettura_quantita', leggi_quantita, percorsi['file_quantita'])
+    df_consumo = misura('report.lettura_consumo', leggi_consumo, percorsi['file_consumo'])
+
+    def unione():
+        return unisci_produzione(formato_lungo(df_quantita, 'Quantita Prodotta'),
+                                 formato_lungo(df_consumo, 'Consumo Energia'))
+
+    df_merged = misura('report.unione', unione)
+    df_monthly = misura('report.aggregazione', aggrega_mensile, df_merged)
+    # Stesso aggregato in streaming, come lo calcola unisci_dati.py (lettura compresa)
+    misura('report.mensile_streaming', mensile_in_streaming, percorsi['file_quantita'], percorsi['file_consumo'])
+    misura('report.scrittura_report', scrivi_report, df_monthly, config)
+    misura('report.scrittura_anomalie', scrivi_anomalie, df_monthly, config)
+    misura('report.scrittura_globale', scrivi_globale, df_monthly, config)
+
+
+def fasi_dashboard(misura, config):
+    df = misura('dashboard.lettura', pd.read_excel, config['file_excel'], 'Consolidato')
+    df = misura('dashboard.pulizia', lambda: pulisci_consolidato(df.copy()))
+    misura('dashboard.indicizzazione', DatiDashboard, df, None)
+
+
+def ambiente():
+    return {
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'openpyxl': openpyxl.__version__,
+        'sistema': platform.platform(),
+        'cpu': os.cpu_count(),
+    }
+
+
+def confronta(attuale, percorso_baseline, tolleranza):
+    """Stampa il confronto con la baseline e restituisce le fasi più lente oltre la tolleranza."""
+    with open(percorso_baseline, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    if baseline.get('scala') != attuale['scala']:
+        print(f"ATTENZIONE: la baseline è stata misurata con una scala diversa: {baseline.get('scala')}")
+
+    print(f"\nConfronto con {percorso_baseline} ({baseline.get('creato_il')}):")
+    print(f"{'fase':<34} {'baseline':>9} {'attuale':>9} {'rapporto':>9}")
+    regressioni = []
+    for fase, misura in attuale['fasi'].items():
+        prima = baseline.get('fasi', {}).get(fase)
+        if prima is None:
+            print(f"{fase:<34} {'-':>9} {misura['secondi']:8.2f}s {'nuova':>9}")
+            continue
+        rapporto = misura['secondi'] / prima['secondi'] if prima['secondi'] else float('inf')
+        # Differenze sotto i 50 ms non contano: su fasi brevi sono solo rumore
+        lenta = rapporto > 1 + tolleranza and misura['secondi'] - prima['secondi'] > 0.05
+        if lenta:
+            regressioni.append(fase)
+        print(f"{fase:<34} {prima['secondi']:8.2f}s {misura['secondi']:8.2f}s {rapporto:8.2f}x"
+              f"{'   REGRESSIONE' if lenta else ''}")
+    return regressioni
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scala', choices=SCALE, default='piccola')
+    parser.add_argument('--fogli', type=int, help="Fogli macchina del workbook principale")
+    parser.add_argument('--righe', type=int, help="Righe per foglio macchina")
+    parser.add_argument('--macchine', type=int, help="Macchine nei file di produzione")
+    parser.add_argument('--mesi', type=int, help="Mesi nei file di produzione e nelle bollette")
+    parser.add_argument('--solo', nargs='+', choices=GRUPPI, default=list(GRUPPI),
+                        help="Procedure da misurare (predefinito: tutte)")
+    parser.add_argument('--senza-memoria', action='store_true', help="Non misurare il picco di memoria")
+    parser.add_argument('--salva', help="File JSON in cui salvare i risultati")
+    parser.add_argument('--confronta', help="File JSON di una misura precedente da confrontare")
+    parser.add_argument('--tolleranza', type=float, default=0.2,
+                        help="Rallentamento relativo tollerato nel confronto (predefinito 0.2 = 20%%)")
+    args = parser.parse_args()
+
+    scala = dict(SCALE[args.scala])
+    scala.update({k: getattr(args, k) for k in scala if getattr(args, k) is not None})
+    misura = Misuratore(memoria=not args.senza_memoria)
+
+    directory_iniziale = os.getcwd()
+    with tempfile.TemporaryDirectory() as cartella:
+        print(f"Genero i file sintetici: {scala}")
+        config = genera_tutto(cartella, **scala)
+        # Le procedure leggono config.yaml e i file dalla cartella corrente
+        os.chdir(cartella)
+        try:
+            if 'consolidato' in args.solo:
+                fasi_consolidato(misura, config)
+            elif 'dashboard' in args.solo:
+                with contextlib.redirect_stdout(io.StringIO()):
+                    crea_foglio_consolidato(True)
+            if 'report' in args.solo:
+                fasi_report(misura, config)
+            if 'dashboard' in args.solo:
+                fasi_dashboard(misura, config)
+        finally:
+            os.chdir(directory_iniziale)
+
+    risultati = {
+        'versione': VERSIONE_RISULTATI,
+        'creato_il': datetime.now().isoformat(timespec='seconds'),
+        'ambiente': ambiente(),
+        'scala': scala,
+        'fasi': misura.fasi,
+    }
+    if args.salva:
+        with open(args.salva, 'w', encoding='utf-8') as f:
+            json.dump(risultati, f, indent=2)
+        print(f"\nRisultati salvati in: {args.salva}")
+    if args.confronta:
+        regressioni = confronta(risultati, args.confronta, args.tolleranza)
+        if regressioni:
+            print(f"\nFasi più lente della baseline: {', '.join(regressioni)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Confronto tra la validazione riga per riga (Pydantic su iterrows) e quella vettoriale.
+
+Uso:
+    python benchmarks/bench_validazione.py --fogli 30 --righe 2000
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from validazione import normalizza_colonne, valida_colonne, valida_righe
+
+
+def genera_foglio(nome, righe, rng, quota_errori=0.0):
+    """Crea un foglio macchina sintetico con le intestazioni del file reale."""
+    anni = 2015 + np.arange(righe) // 12
+    df = pd.DataFrame({
+        'anno ': anni,
+        'mese ': np.arange(righe) % 12 + 1,
+        'macchina o impianto': nome,
+        'ore produzione macchina': rng.uniform(0, 300, righe).round(2),
+        'pezzi prodotti': rng.integers(0, 150000, righe).astype(float),
+        'consumo ': rng.uniform(0, 2000, righe).round(2),
+        'lettura ': np.nan,
+        'costo energia': rng.uniform(0.15, 0.35, righe).round(4),
+        'costo macchina': np.nan,
+        'consumo da bolletta': rng.integers(40000, 90000, righe).astype(float),
+        'totale bolletta': rng.uniform(10000, 25000, righe).round(2),
+    })
+    if quota_errori:
+        df = df.astype({'consumo ': object, 'anno ': object})
+        sporche = rng.random(righe) < quota_errori
+        df.loc[sporche, 'consumo '] = '-'
+        df.loc[rng.random(righe) < quota_errori / 10, 'anno '] = 'n.d.'
+    return normalizza_colonne(df)
+
+
+def blocco_con_date():
+    """Blocco in cui TextParser restituisce una colonna numerica come datetime64 (celle formattate come date)."""
+    return pd.DataFrame({
+        'macchina_o_impianto': ['M000', 'M000'],
+        'anno': [2024, 2024],
+        'mese': [1, 2],
+        'pezzi_prodotti': pd.to_datetime(['2024-01-01', '2024-02-01']),
+        'consumo': [10.0, 20.0],
+    })
+
+
+def confronta(df_righe, err_righe, df_colonne, err_colonne):
+    assert err_righe == err_colonne, "Gli errori registrati differiscono tra i due percorsi"
+    assert len(df_righe) == len(df_colonne), "Il numero di righe valide differisce tra i due percorsi"
+
+
+def cronometra(funzione, fogli):
+    inizio = time.perf_counter()
+    risultati = [funzione(df) for df in fogli]
+    return time.perf_counter() - inizio, risultati
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--fogli', type=int, default=30, help="Numero di fogli macchina")
+    parser.add_argument('--righe', type=int, default=2000, help="Righe per foglio")
+    parser.add_argument('--errori', type=float, default=0.01, help="Quota di celle sporche ('-', testo)")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    fogli = [genera_foglio(f"M{i:03d}", args.righe, rng, args.errori) for i in range(args.fogli)]
+    print(f"Dati sintetici: {args.fogli} fogli x {args.righe} righe")
+
+    t_righe, ris_righe = cronometra(valida_righe, fogli)
+    t_colonne, ris_colonne = cronometra(valida_colonne, fogli)
+
+    for (df_a, err_a), (df_b, err_b) in zip(ris_righe, ris_colonne):
+        confronta(df_a, err_a, df_b, err_b)
+    confronta(*valida_righe(blocco_con_date()), *valida_colonne(blocco_con_date()))
+
+    print(f"Riga per riga (Pydantic): {t_righe:8.3f} s")
+    print(f"Vettoriale:               {t_colonne:8.3f} s")
+    print(f"Accelerazione:            {t_righe / t_colonne:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+Generatore di file sintetici con gli stessi schemi dei file reali, a scala configurabile:
+
+- workbook principale: un foglio per macchina con le colonne di DatiMacchinaRow, più i
+  fogli esclusi 'Tabelle' e 'Consolidato' (vuoto);
+- prod_quantita.xlsx: mesi sulle righe ('GENNAIO25'), macchine sulle colonne, riga 'Totale';
+- prod_consumo_macchine.xlsx: due righe di titolo, intestazione sulla terza riga,
+  etichette come 'Consumo kWh GENNAIO 25' (con il refuso 'GUIGNO');
+- bollette.xlsx: senza intestazione, data nella prima colonna e importo nell'ultima.
+
+Uso da riga di comando (scrive i file e un config.yaml nella cartella indicata):
+    python benchmarks/dati_sintetici.py cartella --fogli 50 --righe 2000 --macchine 100 --mesi 60
+"""
+import argparse
+import os
+from datetime import datetime
+
+import numpy as np
+import yaml
+from openpyxl import Workbook
+
+INTESTAZIONE_MACCHINA = ['anno ', 'mese ', 'macchina o impianto', 'ore produzione macchina', 'pezzi prodotti',
+                         'consumo ', 'lettura ', 'costo energia', 'costo macchina', 'consumo da bolletta',
+                         'totale bolletta']
+NOMI_MESI = ['GENNAIO', 'FEBBRAIO', 'MARZO', 'APRILE', 'MAGGIO', 'GIUGNO',
+             'LUGLIO', 'AGOSTO', 'SETTEMBRE', 'OTTOBRE', 'NOVEMBRE', 'DICEMBRE']
+ANNO_INIZIALE = 2020
+
+
+def _nome_macchina(i):
+    return f"M{i:03d}"
+
+
+def _mese(indice):
+    """(anno, mese) dell'indice-esimo mese a partire da gennaio di ANNO_INIZIALE."""
+    return ANNO_INIZIALE + indice // 12, indice % 12 + 1
+
+
+def genera_workbook_macchine(percorso, fogli, righe, quota_errori=0.01, seed=42):
+    """Workbook principale: `fogli` fogli macchina da `righe` righe, con qualche riga non valida."""
+    rng = np.random.default_rng(seed)
+    wb = Workbook(write_only=True)
+    for i in range(fogli):
+        nome = _nome_macchina(i)
+        ws = wb.create_sheet(nome)
+        ws.append(INTESTAZIONE_MACCHINA)
+        ore = rng.uniform(0, 300, righe).round(2)
+        pezzi = rng.integers(0, 150000, righe)
+        consumo = rng.uniform(0, 2000, righe).round(2)
+        costo = rng.uniform(0.15, 0.35, righe).round(4)
+        errate = rng.random(righe) < quota_errori
+        for r in range(righe):
+            anno, mese = _mese(r)
+            # Le righe errate hanno testo in una colonna numerica, come capita nel file reale
+            ws.append([anno, mese, nome, 'n.d.' if errate[r] else float(ore[r]), int(pezzi[r]),
+                       float(consumo[r]), None, float(costo[r]), None, None, None])
+    ws = wb.create_sheet('Tabelle')
+    ws.append(['Tabella di servizio, esclusa dal consolidamento'])
+    ws = wb.create_sheet('Consolidato')
+    ws.append(['anno'])
+    wb.save(percorso)
+
+
+def genera_prod_quantita(percorso, macchine, mesi, seed=43):
+    """Pezzi prodotti in formato largo: prima colonna l'etichetta del mese, poi una colonna per macchina."""
+    rng = np.random.default_rng(seed)
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet('Foglio1')
+    ws.append(['Mese'] + [_nome_macchina(i) for i in range(macchine)])
+    totali = np.zeros(macchine, dtype='int64')
+    for m in range(mesi):
+        anno, mese = _mese(m)
+        pezzi = rng.integers(0, 100000, macchine)
+        totali += pezzi
+        ws.append([f"{NOMI_MESI[mese - 1]}{anno % 100:02d}"] + pezzi.tolist())
+    ws.append(['Totale'] + totali.tolist())
+    wb.save(percorso)
+
+
+def genera_prod_consumo(percorso, macchine, mesi, seed=44):
+    """Consumi in formato largo con due righe di titolo prima dell'intestazione."""
+    rng = np.random.default_rng(seed)
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet('Foglio1')
+    ws.append(['Consumi energetici per macchina'])
+    ws.append([])
+    ws.append(['Nomi macchina'] + [_nome_macchina(i) for i in range(macchine)])
+    for m in range(mesi):
+        anno, mese = _mese(m)
+        nome_mese = 'GUIGNO' if mese == 6 else NOMI_MESI[mese - 1]
+        consumi = rng.uniform(0, 5000, macchine).round(2)
+        ws.append([f"Consumo kWh {nome_mese} {anno % 100:02d}"] + consumi.tolist())
+    wb.save(percorso)
+
+
+def genera_bollette(percorso, mesi, seed=45):
+    """Bollette senza intestazione: data del mese, consumo e importo (ultima colonna)."""
+    rng = np.random.default_rng(seed)
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet('Foglio1')
+    for m in range(mesi):
+        anno, mese = _mese(m)
+        ws.append([datetime(anno, mese, 1), round(float(rng.uniform(40000, 90000))),
+                   round(float(rng.uniform(5000, 25000)), 2)])
+    wb.save(percorso)
+
+
+def genera_tutto(cartella, fogli, righe, macchine, mesi):
+    """Scrive tutti i file sintetici e un config.yaml che li usa; restituisce il config."""
+    os.makedirs(cartella, exist_ok=True)
+    with open(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'config.yaml')) as f:
+        config = yaml.safe_load(f)
+    config.update({
+        'file_excel': 'principale.xlsx',
+        'cartella_cache': '.cache_consolidato',
+        'cartella_parquet': None,
+        # Un solo processo: tempi e memoria confrontabili tra macchine diverse
+        'processi_paralleli': 1,
+        'report': {'file_quantita': 'prod_quantita.xlsx', 'file_consumo': 'prod_consumo_macchine.xlsx',
+                   'file_bollette': 'bollette.xlsx', 'file_report': 'report.xlsx',
+                   'file_anomalie': 'report_anomalie.xlsx', 'file_globale': 'report_globale_mensile.xlsx'},
+    })
+    config.setdefault('anomalie', {})['file_stato'] = None
+
+    genera_workbook_macchine(os.path.join(cartella, config['file_excel']), fogli, righe)
+    genera_prod_quantita(os.path.join(cartella, 'prod_quantita.xlsx'), macchine, mesi)
+    genera_prod_consumo(os.path.join(cartella, 'prod_consumo_macchine.xlsx'), macchine, mesi)
+    genera_bollette(os.path.join(cartella, 'bollette.xlsx'), mesi)
+    with open(os.path.join(cartella, 'config.yaml'), 'w') as f:
+        yaml.safe_dump(config, f, allow_unicode=True, sort_keys=False)
+    return config
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('cartella')
+    parser.add_argument('--fogli', type=int, default=50)
+    parser.add_argument('--righe', type=int, default=2000)
+    parser.add_argument('--macchine', type=int, default=100)
+    parser.add_argument('--mesi', type=int, default=60)
+    args = parser.parse_args()
+    genera_tutto(args.cartella, args.fogli, args.righe, args.macchine, args.mesi)
+    print(f"File sintetici scritti in: {args.cartella}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+import hashlib
+import json
+import os
+import zipfile
+
+import pandas as pd
+
+from pacchetto_xlsx import (formati_numero_stili, indici_stili, indici_stringhe_condivise, leggi_stringhe_condivise,
+                            mappa_fogli)
+
+# Da incrementare quando cambiano le regole di validazione o il formato delle voci:
+# una cache scritta con una versione diversa viene scartata per intero.
+VERSIONE_CACHE = 1
+FILE_INDICE = 'indice.json'
+
+
+def impronte_fogli(file_path, sheet_names):
+    """
+    Calcola un'impronta del contenuto di ogni foglio direttamente dall'archivio .xlsx.
+
+    L'impronta combina l'XML del foglio con il testo delle stringhe condivise a cui
+    le sue celle fanno riferimento e con il formato numerico dei loro stili (styles.xml):
+    se un altro foglio aggiunge stringhe o stili alle tabelle comuni, i fogli non toccati
+    mantengono la stessa impronta, mentre una cella riformattata (es. come data) la cambia.
+    """
+    impronte = {}
+    with zipfile.ZipFile(file_path) as archivio:
+        parti = mappa_fogli(archivio)
+        stringhe = None
+        formati = None
+        for sheet_name in sheet_names:
+            xml_foglio = archivio.read(parti[sheet_name])
+            h = hashlib.sha256(xml_foglio)
+            indici = indici_stringhe_condivise(xml_foglio)
+            if indici:
+                if stringhe is None:
+                    stringhe = leggi_stringhe_condivise(archivio)
+                for i in indici:
+                    h.update(b'\x00' + stringhe[i].encode('utf-8'))
+            stili = indici_stili(xml_foglio)
+            if stili:
+                if formati is None:
+                    formati = formati_numero_stili(archivio)
+                for i in stili:
+                    formato = formati[i] if i < len(formati) else ''
+                    h.update(b'\x01' + f"{i}:{formato}".encode('utf-8'))
+            impronte[sheet_name] = h.hexdigest()
+    return impronte
+
+
+class CacheFogli:
+    """
+    Cache locale delle righe validate di ogni foglio, indicizzata per impronta del contenuto.
+
+    Ogni voce contiene il DataFrame delle righe valide e gli errori di validazione del
+    foglio, così un foglio non modificato non viene riletto ma i suoi errori continuano
+    a comparire in errori_validazione.log.
+    """
+
+    def __init__(self, cartella, file_excel):
+        self.cartella = cartella
+        self.file_excel = os.path.abspath(file_excel)
+        self.voci = {}
+        percorso_indice = os.path.join(cartella, FILE_INDICE)
+        if os.path.exists(percorso_indice):
+            try:
+                with open(percorso_indice, 'r', encoding='utf-8') as f:
+                    indice = json.load(f)
+                if indice.get('versione') == VERSIONE_CACHE and indice.get('file_excel') == self.file_excel:
+                    self.voci = indice.get('fogli', {})
+            except (OSError, ValueError) as e:
+                print(f"Cache non leggibile, verrà ricostruita: {e}")
+
+    def _percorso_voce(self, impronta):
+        return os.path.join(self.cartella, f"{impronta}.pkl")
+
+    def leggi(self, sheet_name, impronta):
+        """Restituisce (righe_valide, errori) se il foglio è invariato, altrimenti None."""
+        if self.voci.get(sheet_name) != impronta:
+            return None
+        try:
+            voce = pd.read_pickle(self._percorso_voce(impronta))
+        except (OSError, ValueError, EOFError) as e:
+            print(f"Voce di cache non leggibile per il foglio {sheet_name}: {e}")
+            return None
+        return voce['righe'], voce['errori']
+
+    def scrivi(self, sheet_name, impronta, righe, errori):
+        os.makedirs(self.cartella, exist_ok=True)
+        pd.to_pickle({'righe': righe, 'errori': errori}, self._percorso_voce(impronta))
+        self.voci[sheet_name] = impronta
+
+    def svuota(self):
+        """Dimentica tutte le voci (ricostruzione completa)."""
+        self.voci = {}
+
+    def salva(self, sheet_names):
+        """Rimuove i fogli non più presenti, cancella i file orfani e scrive l'indice."""
+        rimossi = [s for s in self.voci if s not in sheet_names]
+        for sheet_name in rimossi:
+            print(f"Rimuovo dalla cache il foglio non più presente: {sheet_name}")
+            del self.voci[sheet_name]
+
+        os.makedirs(self.cartella, exist_ok=True)
+        in_uso = {f"{impronta}.pkl" for impronta in self.voci.values()}
+        for nome_file in os.listdir(self.cartella):
+            if nome_file.endswith('.pkl') and nome_file not in in_uso:
+                os.remove(os.path.join(self.cartella, nome_file))
+
+        percorso_indice = os.path.join(self.cartella, FILE_INDICE)
+        temporaneo = percorso_indice + '.tmp'
+        with open(temporaneo, 'w', encoding='utf-8') as f:
+            json.dump({'versione': VERSIONE_CACHE, 'file_excel': self.file_excel, 'fogli': self.voci}, f, indent=2)
+        os.replace(temporaneo, percorso_indice)
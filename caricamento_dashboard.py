@@ -0,0 +1,266 @@
+import hashlib
+import os
+import threading
+import time
+from copy import copy
+
+from anomalie import MotoreAnomalie, serie_consumo_per_pezzo
+from cubo_dashboard import CuboMensile
+from filtri_dashboard import IndiceConsolidato
+from pulizia_dati import pulisci_consolidato
+from strumentazione import Esecuzione
+
+
+def firma_sorgente(file_path, con_hash=False):
+    """
+    Firma della versione del file: data di modifica e dimensione, più l'hash SHA-256 del
+    contenuto se richiesto (utile quando il file viene copiato mantenendo la data originale).
+    """
+    stat = os.stat(file_path)
+    firma = (stat.st_mtime_ns, stat.st_size)
+    if con_hash:
+        h = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for pezzo in iter(lambda: f.read(1024 * 1024), b''):
+                h.update(pezzo)
+        firma += (h.hexdigest(),)
+    return firma
+
+
+class DatiDashboard:
+    """
+    Istantanea dei dati pronti per la dashboard: indice per i filtri, cubo mensile e anomalie.
+
+    Le anomalie del consumo per pezzo sono calcolate sulle celle del cubo; passando il
+    motore dell'istantanea precedente vengono valutati solo i mesi nuovi.
+    """
+
+    def __init__(self, df, firma, motore_anomalie=None):
+        self.indice = IndiceConsolidato(df)
+        self.cubo = CuboMensile(self.indice.df)
+        # Copia: il motore dell'istantanea precedente resta invariato per chi la sta usando
+        self.motore_anomalie = copy(motore_anomalie) if motore_anomalie is not None else MotoreAnomalie()
+        celle = self.cubo.indice.df.dropna(subset=['data'])
+        self.cubo.aggiungi_anomalie(self.motore_anomalie.aggiorna(
+            serie_consumo_per_pezzo(celle, 'macchina', 'data', 'consumo_kwh', 'pezzi_prodotti')))
+        self.firma = firma
+        self.caricati_il = time.time()
+        # Identifica l'istantanea (es. nelle chiavi della cache dei grafici)
+        self.versione = (firma, self.caricati_il)
+        # Resoconto del caricamento (fasi e tempi), assegnato da CaricatoreDati
+        self.resoconto = None
+
+
+class _IndiceStorico:
+    """Interfaccia di IndiceConsolidato, con i filtri risolti da interrogazioni dell'archivio."""
+
+    def __init__(self, dati):
+        self._dati = dati
+
+    @property
+    def macchine(self):
+        return self._dati.elenchi()['macchine']
+
+    @property
+    def anni(self):
+        return self._dati.elenchi()['anni']
+
+    @property
+    def mesi(self):
+        return self._dati.elenchi()['mesi']
+
+    def filtra(self, macchine=None, anno=None, mese=None):
+        # Sulla selezione il filtro non scarta nulla, ma dà lo stesso ordine delle macchine
+        return self._dati.selezione(macchine, anno, mese)[0].filtra(macchine, anno, mese)
+
+
+class _CuboStorico:
+    """Interfaccia di CuboMensile sulle sole celle della selezione."""
+
+    def __init__(self, dati):
+        self._dati = dati
+
+    def filtra(self, macchine=None, anno=None, mese=None):
+        return self._dati.selezione(macchine, anno, mese)[1].filtra(macchine, anno, mese)
+
+    def riepilogo(self, macchine=None, anno=None, mese=None):
+        return self._dati.selezione(macchine, anno, mese)[1].riepilogo(macchine, anno, mese)
+
+
+class DatiStorico:
+    """
+    Dati della dashboard interrogati dall'archivio storico SQLite (vedi archivio_storico.py),
+    con i tipi di `schema` (vedi pulizia_dati.schema_consolidato).
+
+    Offre la stessa interfaccia di DatiDashboard (indice, cubo, motore_anomalie), ma ogni
+    combinazione di filtri diventa un'interrogazione indicizzata: in memoria restano solo
+    le righe selezionate e, per le anomalie, i mesi che le precedono nella finestra.
+    L'ultima selezione viene conservata, perché tabella, grafici e riepilogo della stessa
+    pagina usano gli stessi filtri.
+    """
+
+    def __init__(self, storico, parametri_anomalie=None, schema=None):
+        self.storico = storico
+        self.schema = schema
+        self.motore_anomalie = MotoreAnomalie(**(parametri_anomalie or {}))
+        self.indice = _IndiceStorico(self)
+        self.cubo = _CuboStorico(self)
+        self.resoconto = None
+        self._elenchi = None
+        self._ultima = None
+
+    @property
+    def caricati_il(self):
+        return self.storico.metadati()['aggiornato_il']
+
+    @property
+    def versione(self):
+        return self.storico.versione()
+
+    def elenchi(self):
+        """Macchine, anni e mesi per i filtri, riletti solo quando l'archivio cambia."""
+        versione = self.storico.versione()
+        elenchi = self._elenchi
+        if elenchi is None or elenchi[0] != versione:
+            elenchi = (versione, {'macchine': self.storico.macchine(), 'anni': self.storico.anni(),
+                                  'mesi': self.storico.mesi()})
+            self._elenchi = elenchi
+        return elenchi[1]
+
+    def selezione(self, macchine=None, anno=None, mese=None):
+        """(IndiceConsolidato, CuboMensile) delle sole righe che soddisfano i filtri."""
+        chiave = (tuple(macchine or ()), anno, mese, self.storico.versione())
+        ultima = self._ultima
+        if ultima is not None and ultima[0] == chiave:
+            return ultima[1]
+
+        indice = IndiceConsolidato(pulisci_consolidato(self.storico.righe(macchine, anno, mese), self.schema))
+        cubo = CuboMensile(indice.df)
+        # Il punteggio di un mese dipende dai mesi precedenti: con un filtro sul periodo si
+        # leggono anche i `finestra_mesi` mesi con un valore che precedono la selezione
+        storia = cubo
+        if (anno is not None or mese is not None) and indice.macchine:
+            righe = self.storico.righe_storia(indice.macchine, anno, mese, self.motore_anomalie.finestra_mesi,
+                                              'consumo_kwh', 'pezzi_prodotti')
+            storia = CuboMensile(pulisci_consolidato(righe, self.schema))
+        celle = storia.indice.df.dropna(subset=['data'])
+        motore = MotoreAnomalie(**self.motore_anomalie.parametri)
+        cubo.aggiungi_anomalie(motore.calcola(
+            serie_consumo_per_pezzo(celle, 'macchina', 'data', 'consumo_kwh', 'pezzi_prodotti')))
+
+        self._ultima = (chiave, (indice, cubo))
+        return indice, cubo
+
+
+class CaricatoreDati:
+    """
+    Mantiene i dati della dashboard allineati al file sorgente.
+
+    I dati vengono ricaricati quando cambia la firma del file o quando scade il TTL.
+    Il ricaricamento avviene in un thread in background: nel frattempo le sessioni
+    continuano a ricevere l'istantanea precedente, che viene sostituita solo quando
+    la nuova è completa. Se il caricamento fallisce (ad esempio perché il file è ancora
+    in fase di salvataggio) resta in uso l'istantanea precedente e si riprova al
+    controllo successivo. Con osserva_file=True un thread controlla il file a intervalli
+    regolari anche quando nessuno sta usando la dashboard. Ogni caricamento viene misurato
+    come un'esecuzione 'dashboard' (vedi strumentazione.py) con la configurazione `config`.
+    """
+
+    def __init__(self, carica, file_path, ttl=None, intervallo_controllo=5, con_hash=False, osserva_file=False,
+                 parametri_anomalie=None, config=None):
+        self._carica = carica
+        self.file_path = file_path
+        self.ttl = ttl
+        self.intervallo_controllo = intervallo_controllo
+        self.con_hash = con_hash
+        self._lock = threading.Lock()
+        self._dati = None
+        self._thread_ricarica = None
+        self._ultimo_controllo = 0.0
+        self.ultimo_errore = None
+        self.parametri_anomalie = parametri_anomalie or {}
+        self.config = config
+        if osserva_file:
+            threading.Thread(target=self._osserva, name='osservatore-dati', daemon=True).start()
+
+    def _firma(self):
+        return firma_sorgente(self.file_path, self.con_hash)
+
+    def _scaduti(self, dati):
+        return self.ttl is not None and time.time() - dati.caricati_il > self.ttl
+
+    def _nuovi_dati(self, df, firma):
+        precedenti = self._dati
+        motore = precedenti.motore_anomalie if precedenti is not None else MotoreAnomalie(**self.parametri_anomalie)
+        return DatiDashboard(df, firma, motore)
+
+    def _carica_istantanea(self):
+        with Esecuzione('dashboard', self.config) as esecuzione:
+            firma = self._firma()
+            with esecuzione.fase('lettura e pulizia') as fase:
+                df = self._carica()
+                fase['righe'] = len(df)
+            with esecuzione.fase('indici, cubo e anomalie', righe=len(df)):
+                nuovi = self._nuovi_dati(df, firma)
+            esecuzione.esito = 'completata'
+        nuovi.resoconto = esecuzione.rapporto
+        return nuovi
+
+    def _esegui_caricamento(self):
+        nuovi = self._carica_istantanea()
+        with self._lock:
+            self._dati = nuovi
+            self.ultimo_errore = None
+        return nuovi
+
+    def _ricarica_in_background(self):
+        try:
+            self._esegui_caricamento()
+        except Exception as e:
+            self.ultimo_errore = f"{type(e).__name__}: {e}"
+
+    def _avvia_ricarica(self):
+        with self._lock:
+            if self.ricarica_in_corso:
+                return
+            self._thread_ricarica = threading.Thread(target=self._ricarica_in_background,
+                                                     name='ricarica-dati', daemon=True)
+            self._thread_ricarica.start()
+
+    @property
+    def ricarica_in_corso(self):
+        return self._thread_ricarica is not None and self._thread_ricarica.is_alive()
+
+    def _da_ricaricare(self, dati):
+        try:
+            return self._firma() != dati.firma or self._scaduti(dati)
+        except OSError:
+            # File momentaneamente non accessibile: si tengono i dati attuali
+            return False
+
+    def dati(self):
+        """Restituisce l'istantanea corrente; al primo accesso il caricamento è sincrono."""
+        dati = self._dati
+        if dati is None:
+            with self._lock:
+                if self._dati is None:
+                    self._dati = self._carica_istantanea()
+                return self._dati
+
+        adesso = time.time()
+        if adesso - self._ultimo_controllo >= self.intervallo_controllo:
+            self._ultimo_controllo = adesso
+            if self._da_ricaricare(dati):
+                self._avvia_ricarica()
+        return dati
+
+    def ricarica(self):
+        """Ricaricamento manuale e sincrono (pulsante 'Ricarica dati')."""
+        return self._esegui_caricamento()
+
+    def _osserva(self):
+        while True:
+            time.sleep(self.intervallo_controllo)
+            dati = self._dati
+            if dati is not None and self._da_ricaricare(dati):
+                self._avvia_ricarica()
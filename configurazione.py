@@ -0,0 +1,31 @@
+import os
+
+import yaml
+
+# Modulo leggero (solo yaml): usato da energia.py per controllare configurazione e file
+# di input prima di importare pandas, openpyxl e gli altri moduli pesanti.
+
+# Percorsi predefiniti dei file di unisci_dati.py (sezione 'report' di config.yaml)
+PERCORSI_REPORT = {
+    'file_quantita': 'prod_quantita.xlsx',
+    'file_consumo': 'prod_consumo_macchine.xlsx',
+    'file_bollette': 'bollette.xlsx',
+    'file_report': 'report.xlsx',
+    'file_anomalie': 'report_anomalie.xlsx',
+    'file_globale': 'report_globale_mensile.xlsx',
+}
+
+
+def carica_config(config_path='config.yaml'):
+    """Legge config.yaml, se presente (percorsi dei file e parametri delle anomalie)."""
+    if not os.path.exists(config_path):
+        return {}
+    with open(config_path, 'r') as f:
+        return yaml.safe_load(f) or {}
+
+
+def percorsi_report(config):
+    """Percorsi dei file dalla sezione 'report' di config.yaml, con i valori predefiniti."""
+    percorsi = dict(PERCORSI_REPORT)
+    percorsi.update({k: v for k, v in ((config or {}).get('report') or {}).items() if k in percorsi and v})
+    return percorsi
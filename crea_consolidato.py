@@ -1,41 +1,28 @@
-
 import pandas as pd
-import openpyxl
 import os
 import yaml
 import logging
-from typing import Optional
-from pydantic import BaseModel, ValidationError, field_validator
+import argparse
+from archivio_parquet import firma_file, scrivi_consolidato_parquet
+from archivio_storico import aggiorna_storico
+from cache_fogli import CacheFogli, impronte_fogli
+from elaborazione_fogli import elabora_fogli
+from lettura_fogli import RIGHE_PER_BLOCCO, apri_workbook
+from scrittura_consolidato import WorkbookModificato, salva_foglio_consolidato
+from strumentazione import Esecuzione
 
 # --- Configurazione del Logging ---
-logging.basicConfig(
-    filename='errori_validazione.log',
-    level=logging.ERROR,
-    format='%(asctime)s - FOGLIO: %(sheet_name)s - RIGA: %(row_num)s - ERRORE: %(message)s',
-    filemode='w'
-)
+# Viene applicata all'avvio del consolidamento e non all'import del modulo: i processi
+# worker che importano questo file non devono troncare errori_validazione.log.
 logger = logging.getLogger()
 
-# --- Modello di Dati con Pydantic ---
-class DatiMacchinaRow(BaseModel):
-    """Definisce la struttura e i tipi di una riga di dati valida."""
-    macchina_o_impianto: str
-    anno: int
-    mese: int
-    ore_produzione_macchina: Optional[float] = None
-    pezzi_prodotti: Optional[float] = None
-    consumo: Optional[float] = None
-    lettura: Optional[float] = None
-    costo_energia: Optional[float] = None
-    costo_macchina: Optional[float] = None
-    consumo_da_bolletta: Optional[float] = None
-    totale_bolletta: Optional[float] = None
-
-    @field_validator('*', mode='before')
-    def empty_str_to_none(cls, v):
-        if isinstance(v, str) and v.strip() in ('', '-'):
-            return None
-        return v
+def configura_logging():
+    logging.basicConfig(
+        filename='errori_validazione.log',
+        level=logging.ERROR,
+        format='%(asctime)s - FOGLIO: %(sheet_name)s - RIGA: %(row_num)s - ERRORE: %(message)s',
+        filemode='w'
+    )
 
 def load_config(config_path='config.yaml'):
     """Carica la configurazione dal file YAML."""
@@ -47,101 +34,181 @@ def load_config(config_path='config.yaml'):
         except yaml.YAMLError as e:
             raise ValueError(f"Errore nel parsing del file di configurazione YAML: {e}")
 
-def crea_foglio_consolidato():
+def crea_foglio_consolidato(completo=False):
     """
     Legge, valida e consolida i dati, salvando gli errori in un file di log.
+
+    In modalità incrementale (predefinita) vengono riletti solo i fogli il cui
+    contenuto è cambiato dall'ultima esecuzione; con completo=True la cache viene
+    ignorata e tutti i fogli vengono rielaborati. Restituisce l'esito dell'esecuzione
+    ('completata', 'interrotta' se non c'è nulla da salvare, 'rimandata' se il file è
+    stato salvato da altri durante l'elaborazione e va rielaborato, 'errore').
     """
+    configura_logging()
     try:
         config = load_config()
         file_path = config['file_excel']
         sheets_to_exclude = set(config['fogli_da_escludere'])
         column_mapping = config['mappatura_colonne']
         final_columns = config['colonne_finali']
+        cache_dir = config.get('cartella_cache', '.cache_consolidato')
+        workers = config.get('processi_paralleli')
+        righe_per_blocco = config.get('righe_per_blocco') or RIGHE_PER_BLOCCO
+        parquet_dir = config.get('cartella_parquet')
+        file_storico = config.get('file_storico')
     except (FileNotFoundError, ValueError, KeyError) as e:
         print(f"Errore di configurazione: {e}")
-        return
+        return 'errore'
 
     if not os.path.exists(file_path):
         print(f"Errore: Il file '{file_path}' non è stato trovato.")
-        return
+        return 'errore'
 
-    try:
-        xls = pd.ExcelFile(file_path, engine='openpyxl')
-        sheet_names = [s for s in xls.sheet_names if s not in sheets_to_exclude]
-        print(f"Fogli trovati da elaborare: {sheet_names}")
-
-        if not sheet_names:
-            print("Nessun foglio di macchina trovato da elaborare.")
-            return
-
-        valid_rows = []
-        error_count = 0
-
-        for sheet_name in sheet_names:
-            print(f"Leggo e valido il foglio: {sheet_name}...")
-            df = pd.read_excel(xls, sheet_name=sheet_name, header=0)
-            
-            # Standardizza i nomi delle colonne per la validazione
-            df.columns = df.columns.str.strip().str.replace(' ', '_')
-
-            for index, row in df.iterrows():
-                if pd.isna(row.get('macchina_o_impianto')) or not str(row.get('macchina_o_impianto')).strip():
-                    continue
-                
-                try:
-                    validated_row = DatiMacchinaRow(**row.to_dict())
-                    valid_rows.append(validated_row.model_dump())
-                except ValidationError as e:
-                    error_details = e.errors()[0]
-                    err_msg = f"{error_details['msg']} (colonna: {error_details['loc'][0]})"
-                    logger.error(err_msg, extra={'sheet_name': sheet_name, 'row_num': index + 2})
-                    error_count += 1
-        
-        if error_count > 0:
-            print(f"ATTENZIONE: Sono stati trovati {error_count} errori di validazione. Controlla il file 'errori_validazione.log'.")
-
-        if not valid_rows:
-            print("Nessun dato valido trovato nei fogli delle macchine.")
-            return
-
-        consolidated_df = pd.DataFrame(valid_rows)
-        print("Dati validi uniti con successo.")
-
-        # Rinomina le colonne per il formato finale
-        # Le colonne nel df sono es: 'macchina_o_impianto', nella config la key è 'macchina o impianto'
-        inverted_mapping = {k.replace(' ', '_'): v for k, v in column_mapping.items()}
-        consolidated_df.rename(columns=inverted_mapping, inplace=True)
-        
-        for col in final_columns:
-            if col not in consolidated_df.columns:
-                consolidated_df[col] = None
-        
-        consolidated_df = consolidated_df[final_columns]
-
-        print(f"Salvataggio del foglio 'Consolidato' nel file '{file_path}'...")
+    # Tempi, righe e memoria di ogni fase e di ogni foglio finiscono nel resoconto JSON
+    # dell'esecuzione (vedi strumentazione.py), mostrato anche nella dashboard
+    with Esecuzione('consolidato', config) as esecuzione:
+        esecuzione.info.update(file_excel=file_path, completo=completo)
         try:
-            from openpyxl.utils.dataframe import dataframe_to_rows
-            book = openpyxl.load_workbook(file_path)
-            if 'Consolidato' in book.sheetnames:
-                book.remove(book['Consolidato'])
-            new_sheet = book.create_sheet('Consolidato')
-            for r in dataframe_to_rows(consolidated_df, index=False, header=True):
-                new_sheet.append(r)
-            book.save(file_path)
-            print("Operazione completata con successo!")
+            with esecuzione.fase('apertura e cache') as fase:
+                # Versione letta: al salvataggio si controlla che il file non sia cambiato
+                firma_lettura = firma_file(file_path)
+                # Lettura in streaming (sola lettura): il workbook non viene caricato in memoria per intero
+                workbook = apri_workbook(file_path)
+                sheet_names = [s for s in workbook.sheetnames if s not in sheets_to_exclude]
+                print(f"Fogli trovati da elaborare: {sheet_names}")
+
+                if not sheet_names:
+                    print("Nessun foglio di macchina trovato da elaborare.")
+                    workbook.close()
+                    return esecuzione.esito
+
+                cache = CacheFogli(cache_dir, file_path)
+                if completo:
+                    print("Ricostruzione completa: la cache dei fogli viene ignorata.")
+                    cache.svuota()
+                impronte = impronte_fogli(file_path, sheet_names)
+
+                risultati = {}
+                for sheet_name in sheet_names:
+                    dati_in_cache = cache.leggi(sheet_name, impronte[sheet_name])
+                    if dati_in_cache is not None:
+                        print(f"Foglio invariato, uso la cache: {sheet_name}")
+                        risultati[sheet_name] = dati_in_cache
+                fase['fogli_da_cache'] = len(risultati)
+
+            da_elaborare = [s for s in sheet_names if s not in risultati]
+            misure_fogli = {}
+            with esecuzione.fase('lettura e validazione', fogli=len(da_elaborare)) as fase:
+                for sheet_name, validi, errori in elabora_fogli(file_path, da_elaborare, workers,
+                                                                workbook=workbook, righe_per_blocco=righe_per_blocco,
+                                                                misure=misure_fogli,
+                                                                memoria=esecuzione.parametri['memoria']):
+                    cache.scrivi(sheet_name, impronte[sheet_name], validi, errori)
+                    risultati[sheet_name] = (validi, errori)
+                # Il file va chiuso prima del salvataggio
+                workbook.close()
+                fase['righe'] = sum(m['righe_valide'] + m['errori'] for m in misure_fogli.values())
+            for sheet_name in sheet_names:
+                if sheet_name in misure_fogli:
+                    esecuzione.aggiungi_foglio(sheet_name, da_cache=False, **misure_fogli[sheet_name])
+                else:
+                    validi, errori = risultati[sheet_name]
+                    esecuzione.aggiungi_foglio(sheet_name, da_cache=True, righe_valide=len(validi),
+                                               errori=len(errori))
+
+            valid_frames = []
+            error_count = 0
+            # Posizione delle righe di ogni foglio nel Consolidato (per l'archivio storico)
+            intervalli_fogli = {}
+            inizio = 0
+
+            # Errori e righe vengono raccolti nell'ordine dei fogli nel workbook
+            for sheet_name in sheet_names:
+                validi, errori = risultati[sheet_name]
+                for row_num, err_msg in errori:
+                    logger.error(err_msg, extra={'sheet_name': sheet_name, 'row_num': row_num})
+                error_count += len(errori)
+                if not validi.empty:
+                    valid_frames.append(validi)
+                intervalli_fogli[sheet_name] = (inizio, inizio + len(validi))
+                inizio += len(validi)
+
+            cache.salva(sheet_names)
+            esecuzione.info['errori_validazione'] = error_count
+
+            if error_count > 0:
+                print(f"ATTENZIONE: Sono stati trovati {error_count} errori di validazione. Controlla il file 'errori_validazione.log'.")
+
+            if not valid_frames:
+                print("Nessun dato valido trovato nei fogli delle macchine.")
+                return esecuzione.esito
+
+            with esecuzione.fase('unione') as fase:
+                consolidated_df = pd.concat(valid_frames, ignore_index=True)
+                print("Dati validi uniti con successo.")
+
+                # Rinomina le colonne per il formato finale
+                # Le colonne nel df sono es: 'macchina_o_impianto', nella config la key è 'macchina o impianto'
+                inverted_mapping = {k.replace(' ', '_'): v for k, v in column_mapping.items()}
+                consolidated_df.rename(columns=inverted_mapping, inplace=True)
+
+                for col in final_columns:
+                    if col not in consolidated_df.columns:
+                        consolidated_df[col] = None
+
+                consolidated_df = consolidated_df[final_columns]
+                fase['righe'] = len(consolidated_df)
+
+            print(f"Salvataggio del foglio 'Consolidato' nel file '{file_path}'...")
+            salvato = False
+            with esecuzione.fase('salvataggio excel', righe=len(consolidated_df)):
+                try:
+                    # Riscrive solo il foglio 'Consolidato' (file temporaneo + rinomina atomica)
+                    if salva_foglio_consolidato(consolidated_df, file_path, firma_lettura=firma_lettura):
+                        print("Riscritto solo il foglio 'Consolidato', gli altri fogli sono invariati.")
+                    print("Operazione completata con successo!")
+                    salvato = True
+
+                except WorkbookModificato as e:
+                    print(f"{e}: il foglio 'Consolidato' non viene scritto, rieseguire il consolidamento.")
+                    esecuzione.esito = 'rimandata'
+
+                except Exception as e:
+                    # Nessun salvataggio sul posto: il file temporaneo è stato scartato e il
+                    # workbook è rimasto quello di prima
+                    print(f"Errore durante il salvataggio del foglio 'Consolidato': {e}")
+                    print(f"Il file '{file_path}' non è stato modificato.")
+                    esecuzione.info['errore'] = f"{type(e).__name__}: {e}"
+                    esecuzione.esito = 'errore'
+
+            # La copia Parquet viene scritta solo dopo l'Excel, con la firma del file appena salvato
+            if salvato and parquet_dir:
+                print(f"Salvataggio della copia Parquet in '{parquet_dir}'...")
+                with esecuzione.fase('copia parquet', righe=len(consolidated_df)):
+                    if scrivi_consolidato_parquet(consolidated_df, parquet_dir, file_path, final_columns):
+                        print("Copia Parquet aggiornata.")
+
+            # Archivio storico interrogabile per (macchina, anno, mese): upsert dei soli fogli la
+            # cui impronta è diversa da quella archiviata
+            if salvato and file_storico:
+                print(f"Aggiornamento dell'archivio storico '{file_storico}'...")
+                with esecuzione.fase('archivio storico') as fase:
+                    fogli = {nome: consolidated_df.iloc[a:b] for nome, (a, b) in intervalli_fogli.items()}
+                    fase['righe'] = aggiorna_storico(file_storico, fogli, impronte, file_path, final_columns,
+                                                    tutti=completo)
+                print(f"Archivio storico aggiornato ({fase['righe']} righe modificate).")
+            if salvato:
+                esecuzione.esito = 'completata'
 
         except Exception as e:
-            print(f"Errore durante il salvataggio con openpyxl: {e}")
-            print("Tentativo di salvataggio alternativo con Pandas...")
-            try:
-                with pd.ExcelWriter(file_path, engine='openpyxl', mode='a', if_sheet_exists='replace') as writer:
-                    consolidated_df.to_excel(writer, sheet_name='Consolidato', index=False)
-                print("Salvataggio alternativo con Pandas riuscito!")
-            except Exception as e2:
-                print(f"Anche il salvataggio alternativo è fallito: {e2}")
-
-    except Exception as e:
-        print(f"Si è verificato un errore imprevisto: {e}")
+            print(f"Si è verificato un errore imprevisto: {e}")
+            esecuzione.esito = 'errore'
+            esecuzione.info['errore'] = f"{type(e).__name__}: {e}"
+    return esecuzione.esito
 
 if __name__ == "__main__":
-    crea_foglio_consolidato()
+    parser = argparse.ArgumentParser(description="Crea o aggiorna il foglio 'Consolidato'.")
+    parser.add_argument('--full', action='store_true',
+                        help="Ignora la cache e rielabora tutti i fogli delle macchine")
+    args = parser.parse_args()
+    crea_foglio_consolidato(completo=args.full)
@@ -0,0 +1,69 @@
+import numpy as np
+import pandas as pd
+
+from filtri_dashboard import IndiceConsolidato
+
+# Metriche additive conservate nel cubo
+METRICHE_CUBO = ['consumo_kwh', 'costo_macchina', 'pezzi_prodotti', 'ore_produzione']
+
+
+def aggiungi_rapporti(df):
+    """
+    Rapporti derivati in float64 (divisione per zero -> NaN). Non sono conservati nei dati
+    caricati: si aggiungono a una copia delle sole righe selezionate.
+    """
+    df = df.copy()
+    consumo = df['consumo_kwh'].astype('float64')
+    pezzi = df['pezzi_prodotti'].astype('float64').replace(0, np.nan)
+    df['consumo_per_pezzo'] = consumo / pezzi
+    df['consumo_per_ora'] = consumo / df['ore_produzione'].astype('float64').replace(0, np.nan)
+    df['costo_per_pezzo'] = df['costo_macchina'].astype('float64') / pezzi
+    return df
+
+
+class CuboMensile:
+    """
+    Aggregato materializzato macchina x anno x mese delle metriche della dashboard.
+
+    Viene costruito una volta sola al caricamento dei dati; grafici e riepiloghi per
+    qualsiasi combinazione di filtri si ottengono selezionando le celle del cubo (con
+    lo stesso indice dei dati di dettaglio) e, se serve, sommandole.
+    """
+
+    def __init__(self, df):
+        # min_count=1: una cella senza valori resta NaN invece di diventare 0. dropna=False:
+        # le righe senza anno o mese formano una cella a sé e restano nei totali del riepilogo
+        # (senza data non compaiono nei grafici nel tempo); quelle senza macchina vengono escluse
+        df = df[df['macchina'].notna()]
+        cubo = (df.groupby(['macchina', 'anno', 'mese'], observed=True, sort=False, dropna=False)[METRICHE_CUBO]
+                .sum(min_count=1)
+                .reset_index())
+        cubo['macchina'] = cubo['macchina'].astype(object)
+        # In float64 anno e mese mancanti sono NaN (data NaT) invece di NA, non convertibile
+        cubo['data'] = pd.to_datetime(pd.DataFrame({'year': cubo['anno'].astype('float64'),
+                                                    'month': cubo['mese'].astype('float64'), 'day': 1}),
+                                      errors='coerce')
+        self.indice = IndiceConsolidato(cubo)
+
+    def aggiungi_anomalie(self, risultati):
+        """Riporta sulle celle mediana mobile, punteggio ed esito calcolati da MotoreAnomalie."""
+        celle = self.indice.df
+        chiavi = pd.MultiIndex.from_arrays([celle['macchina'].astype(object), celle['data']])
+        allineati = risultati.set_index(['macchina', 'periodo']).reindex(chiavi)
+        for colonna in ('mediana', 'punteggio', 'anomalia'):
+            celle[colonna] = allineati[colonna].to_numpy()
+
+    def filtra(self, macchine=None, anno=None, mese=None):
+        """Celle del cubo selezionate dai filtri (una riga per macchina e mese), con i rapporti derivati."""
+        return aggiungi_rapporti(self.indice.filtra(macchine, anno, mese))
+
+    def riepilogo(self, macchine=None, anno=None, mese=None):
+        """Totali per macchina sulle celle selezionate, con consumo e costo per pezzo."""
+        celle = self.indice.filtra(macchine, anno, mese)
+        # Raggruppa sul nome (non sulla categoria) per avere le macchine in ordine alfabetico;
+        # le somme di molti mesi si fanno in float64
+        riepilogo = (celle[METRICHE_CUBO].astype('float64')
+                     .groupby(celle['macchina'].astype(str)).sum().round(2))
+        riepilogo['consumo_per_pezzo'] = (riepilogo['consumo_kwh'] / riepilogo['pezzi_prodotti']).round(4)
+        riepilogo['costo_per_pezzo'] = (riepilogo['costo_macchina'] / riepilogo['pezzi_prodotti']).round(4)
+        return riepilogo
@@ -0,0 +1,286 @@
+import itertools
+import os
+
+import numpy as np
+import pandas as pd
+
+from etichette_mesi import interpreta_mesi
+from lettura_fogli import apri_workbook, blocchi_foglio
+
+# Aggregati mensili già calcolati, per percorsi e versione dei file (vedi carica_mensile)
+_CACHE_MENSILE = {}
+# Formato lungo in streaming (vedi mensile_in_streaming): righe del foglio lette alla volta
+# e colonne (macchine) trasformate alla volta
+RIGHE_PER_BLOCCO_PRODUZIONE = 1000
+COLONNE_PER_BLOCCO = 256
+# Chiave intera dei record: periodo nei bit alti, codice della macchina nei 32 bit bassi
+_BIT_MACCHINA = 32
+
+
+# --- Lettura dei file ---
+
+def leggi_quantita(file_quantita):
+    """Foglio delle quantità prodotte: mesi sulle righe, macchine sulle colonne."""
+    print(f"Leggo e trasformo il file: {file_quantita}")
+    return pd.read_excel(file_quantita, header=0)
+
+
+def leggi_consumo(file_consumo):
+    """Foglio dei consumi per macchina (intestazione sulla terza riga)."""
+    print(f"Leggo e trasformo il file: {file_consumo}")
+    df_consumo = pd.read_excel(file_consumo, header=2)
+    print(f"Colonna data/mese identificata come: '{df_consumo.columns[0]}'")
+    return df_consumo
+
+
+def leggi_bollette(file_bollette, stampa=print):
+    """File delle bollette letto senza intestazioni, o None se il file non esiste."""
+    if not os.path.exists(file_bollette):
+        return None
+    stampa(f"Leggo il file: {file_bollette}")
+    return pd.read_excel(file_bollette, header=None)
+
+
+# --- Trasformazioni (DataFrame -> DataFrame) ---
+
+def formato_lungo(df_wide, value_name):
+    """Da formato largo (prima colonna = mese, una colonna per macchina) a righe Mese, Macchina, valore."""
+    colonna_mese = df_wide.columns[0]
+    df_wide = df_wide.assign(**{colonna_mese: df_wide[colonna_mese].astype(str)})
+    df_long = df_wide.melt(
+        id_vars=[colonna_mese],
+        var_name='Macchina',
+        value_name=value_name
+    )
+    return df_long.rename(columns={colonna_mese: 'Mese'})
+
+
+def unisci_produzione(df_quantita_long, df_consumo_long):
+    """Unione esterna di quantità e consumi su Mese e Macchina."""
+    print("Unisco i dati...")
+    return pd.merge(
+        df_quantita_long,
+        df_consumo_long,
+        on=['Mese', 'Macchina'],
+        how='outer'
+    )
+
+
+def aggrega_mensile(df_merged):
+    """Aggregato mensile per macchina (Mese 'YYYY-MM'), condiviso da tutti i report."""
+    print("Aggrego i dati su base mensile...")
+    print("Pulizia e standardizzazione delle date...")
+    # Ogni etichetta distinta (es. 'GENNAIO25') viene interpretata una sola volta
+    periodi, etichette_non_valide = interpreta_mesi(df_merged['Mese'])
+    if etichette_non_valide:
+        print(f"ATTENZIONE: {len(etichette_non_valide)} etichette di mese non riconosciute, righe escluse: "
+              f"{', '.join(etichette_non_valide)}")
+    validi = periodi.notna()
+    df_merged = df_merged[validi].assign(AnnoMese=periodi[validi].dt.strftime('%Y-%m'))
+
+    df_monthly = df_merged.groupby(['AnnoMese', 'Macchina']).agg({
+        'Quantita Prodotta': 'sum',
+        'Consumo Energia': 'sum'
+    }).reset_index()
+    return df_monthly.rename(columns={'AnnoMese': 'Mese'})
+
+
+def mensile_da_dataframe(df_quantita, df_consumo):
+    """Aggregato mensile direttamente dai due fogli in formato largo, già letti."""
+    return aggrega_mensile(unisci_produzione(
+        formato_lungo(df_quantita, 'Quantita Prodotta'),
+        formato_lungo(df_consumo, 'Consumo Energia')
+    ))
+
+
+# --- Formato lungo in streaming con chiavi intere ---
+
+def record_lunghi(blocchi, codici_macchine, colonne_per_blocco=COLONNE_PER_BLOCCO, non_riconosciute=None):
+    """
+    Formato lungo in streaming: da blocchi di righe in formato largo (prima colonna =
+    etichetta del mese, una colonna per macchina) produce, per ogni gruppo di al più
+    `colonne_per_blocco` colonne, gli array (periodo, codice macchina, valore).
+
+    Il periodo è l'ordinale del mese (mesi dal 1970-01); le righe con un'etichetta non
+    riconosciuta vengono scartate subito e l'etichetta aggiunta a `non_riconosciute`.
+    I codici vengono da `codici_macchine` (nome -> intero), condiviso tra i file perché la
+    stessa macchina abbia lo stesso codice. Le celle vuote restano NaN: la coppia (mese,
+    macchina) esiste anche senza valore, come con formato_lungo().
+    """
+    for df in blocchi:
+        periodi, etichette = interpreta_mesi(df.iloc[:, 0].astype(str))
+        if non_riconosciute is not None:
+            non_riconosciute.extend(e for e in etichette if e not in non_riconosciute)
+        validi = periodi.notna().to_numpy()
+        ordinali = pd.PeriodIndex(periodi[validi]).asi8
+        righe = df[validi]
+        for inizio in range(1, df.shape[1], colonne_per_blocco):
+            parte = righe.iloc[:, inizio:inizio + colonne_per_blocco]
+            codici = np.array([codici_macchine.setdefault(nome, len(codici_macchine)) for nome in parte.columns],
+                              dtype='int64')
+            valori = parte.apply(pd.to_numeric, errors='coerce').to_numpy(dtype='float64', na_value=np.nan)
+            yield np.repeat(ordinali, len(codici)), np.tile(codici, len(ordinali)), valori.ravel()
+
+
+def _riduci(chiavi, valori):
+    """Chiavi uniche (ordinate) e somma dei valori di ciascuna, con i NaN contati come 0."""
+    uniche, posizioni = np.unique(chiavi, return_inverse=True)
+    return uniche, np.bincount(posizioni, weights=np.nan_to_num(valori), minlength=len(uniche))
+
+
+def somme_per_chiave(record):
+    """
+    Somme per (periodo, macchina) dei record di record_lunghi(), accumulate gruppo per
+    gruppo: in memoria restano il gruppo corrente e un valore per ogni coppia già vista.
+    """
+    chiavi, somme = np.empty(0, dtype='int64'), np.empty(0, dtype='float64')
+    for periodi, codici, valori in record:
+        nuove = (periodi << _BIT_MACCHINA) | codici
+        chiavi, somme = _riduci(np.concatenate([chiavi, nuove]), np.concatenate([somme, valori]))
+    return chiavi, somme
+
+
+def unisci_per_codice(*somme):
+    """
+    Unione esterna di più (chiavi, somme) sulle chiavi intere: le coppie assenti da un file
+    valgono 0, come i NaN dell'unione esterna di unisci_produzione() dopo la somma.
+    """
+    chiavi = np.unique(np.concatenate([k for k, _ in somme]))
+    colonne = []
+    for chiavi_file, valori in somme:
+        colonna = np.zeros(len(chiavi))
+        colonna[np.searchsorted(chiavi, chiavi_file)] = valori
+        colonne.append(colonna)
+    return chiavi, colonne
+
+
+def _somme_file(percorso, riga_intestazione, codici_macchine, non_riconosciute, righe_per_blocco,
+                colonne_per_blocco):
+    print(f"Leggo e trasformo il file: {percorso}")
+    workbook = apri_workbook(percorso)
+    try:
+        blocchi = blocchi_foglio(workbook, workbook.sheetnames[0], righe_per_blocco, riga_intestazione)
+        primo = next(blocchi, None)
+        if primo is None:
+            return np.empty(0, dtype='int64'), np.empty(0, dtype='float64')
+        if riga_intestazione:
+            print(f"Colonna data/mese identificata come: '{primo.columns[0]}'")
+        blocchi = itertools.chain([primo], blocchi)
+        return somme_per_chiave(record_lunghi(blocchi, codici_macchine, colonne_per_blocco, non_riconosciute))
+    finally:
+        workbook.close()
+
+
+def mensile_in_streaming(file_quantita, file_consumo, righe_per_blocco=RIGHE_PER_BLOCCO_PRODUZIONE,
+                         colonne_per_blocco=COLONNE_PER_BLOCCO):
+    """
+    Stesso risultato di mensile_da_dataframe(leggi_quantita(...), leggi_consumo(...)), ma
+    senza tenere in memoria i fogli interi né i DataFrame in formato lungo.
+
+    I fogli vengono letti in streaming a blocchi di righe; ogni blocco diventa record
+    (periodo, codice macchina, valore) a gruppi di colonne, sommati subito per chiave
+    intera. L'unione dei due file avviene sulle chiavi intere, senza confronti tra
+    stringhe. La memoria dipende quindi dalla dimensione dei blocchi e dal numero di
+    coppie (mese, macchina) del risultato. Unica differenza: se la stessa etichetta di
+    mese compare su più righe di entrambi i file, i valori vengono sommati una volta sola
+    invece di essere moltiplicati dalle combinazioni dell'unione esterna.
+    """
+    codici_macchine = {}
+    non_riconosciute = []
+    quantita = _somme_file(file_quantita, 0, codici_macchine, non_riconosciute, righe_per_blocco,
+                           colonne_per_blocco)
+    consumo = _somme_file(file_consumo, 2, codici_macchine, non_riconosciute, righe_per_blocco,
+                          colonne_per_blocco)
+    print("Unisco i dati...")
+    chiavi, (quantita_prodotta, consumo_energia) = unisci_per_codice(quantita, consumo)
+
+    print("Aggrego i dati su base mensile...")
+    if non_riconosciute:
+        print(f"ATTENZIONE: {len(non_riconosciute)} etichette di mese non riconosciute, righe escluse: "
+              f"{', '.join(non_riconosciute)}")
+    periodi = chiavi >> _BIT_MACCHINA
+    codici = chiavi & ((1 << _BIT_MACCHINA) - 1)
+    nomi = np.empty(len(codici_macchine), dtype=object)
+    nomi[list(codici_macchine.values())] = list(codici_macchine.keys())
+    # Stesso ordine di groupby(['AnnoMese', 'Macchina']): per mese e per nome della macchina
+    posto_nome = np.empty(len(nomi), dtype='int64')
+    posto_nome[np.argsort(nomi, kind='stable')] = np.arange(len(nomi))
+    ordine = np.lexsort((posto_nome[codici], periodi))
+    return pd.DataFrame({
+        'Mese': pd.PeriodIndex.from_ordinals(periodi[ordine], freq='M').strftime('%Y-%m'),
+        'Macchina': nomi[codici[ordine]],
+        'Quantita Prodotta': quantita_prodotta[ordine],
+        'Consumo Energia': consumo_energia[ordine],
+    })
+
+
+def prepara_bollette(df_bollette):
+    """Prima colonna come Mese ('YYYY-MM') e ultima come Valore Bolletta; righe senza mese valido escluse."""
+    # Seleziono la prima colonna (indice 0) come 'Mese' e l'ultima colonna (indice -1) come 'Valore Bolletta'
+    df_bollette = df_bollette[[0, df_bollette.shape[1] - 1]]
+    df_bollette.columns = ['Mese', 'Valore Bolletta']
+
+    # Assicuro che la colonna 'Mese' sia nello stesso formato 'YYYY-MM'
+    df_bollette['Mese'] = pd.to_datetime(df_bollette['Mese'], errors='coerce').dt.strftime('%Y-%m')
+    return df_bollette.dropna(subset=['Mese'])
+
+
+def riepilogo_globale(df_monthly, df_bollette=None):
+    """Totali mensili di tutte le macchine, con il valore della bolletta se disponibile."""
+    # df_monthly è già aggregato per Mese e Macchina. Ora aggrego per solo Mese.
+    df_global_summary = df_monthly.groupby('Mese').agg({
+        'Quantita Prodotta': 'sum',
+        'Consumo Energia': 'sum'
+    }).reset_index()
+
+    df_global_summary.rename(columns={
+        'Consumo Energia': 'Consumo Globale kWh',
+        'Quantita Prodotta': 'Pezzi Prodotti Totali'
+    }, inplace=True)
+
+    if df_bollette is None:
+        df_global_summary['Valore Bolletta'] = None # Aggiungo la colonna ma la lascio vuota
+        return df_global_summary
+    # Uso left merge per mantenere tutti i mesi del report globale
+    return pd.merge(df_global_summary, prepara_bollette(df_bollette), on='Mese', how='left')
+
+
+def tabella_anomalie(df_monthly, esiti):
+    """Righe di df_monthly segnalate da MotoreAnomalie.anomalie(), con statistiche e motivo."""
+    esiti = esiti.rename(columns={'macchina': 'Macchina', 'periodo': 'Mese', 'valore': 'Consumo_per_Pezzo',
+                                  'mediana': 'Mediana_Mobile', 'mad': 'MAD_Mobile', 'punteggio': 'Punteggio_Robusto'})
+    anomalous_rows = df_monthly.merge(esiti, on=['Macchina', 'Mese']).sort_values(['Mese', 'Macchina'])
+
+    # Motivo costruito sull'intera colonna invece che riga per riga
+    def quattro_decimali(colonna):
+        return pd.Series(np.char.mod('%.4f', anomalous_rows[colonna].to_numpy(dtype='float64')),
+                         index=anomalous_rows.index, dtype=object)
+    anomalous_rows['Motivo_Anomalia'] = ("Consumo/Pezzo " + anomalous_rows.pop('anomalia') + " ("
+                                         + quattro_decimali('Consumo_per_Pezzo') + " vs mediana "
+                                         + quattro_decimali('Mediana_Mobile') + ")")
+    return anomalous_rows
+
+
+# --- Riuso in processi di lunga durata ---
+
+def _firma(percorso):
+    stat = os.stat(percorso)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def carica_mensile(file_quantita, file_consumo):
+    """
+    Aggregato mensile dei due file, ricalcolato solo quando uno dei file cambia.
+
+    Pensata per processi che restano attivi (dashboard, scheduler): le chiamate successive
+    restituiscono lo stesso DataFrame senza rileggere gli Excel, quindi chi lo riceve non
+    deve modificarlo sul posto.
+    """
+    chiave = (os.path.abspath(file_quantita), os.path.abspath(file_consumo))
+    firme = (_firma(file_quantita), _firma(file_consumo))
+    in_cache = _CACHE_MENSILE.get(chiave)
+    if in_cache is not None and in_cache[0] == firme:
+        return in_cache[1]
+    df_monthly = mensile_in_streaming(file_quantita, file_consumo)
+    _CACHE_MENSILE[chiave] = (firme, df_monthly)
+    return df_monthly
@@ -0,0 +1,83 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from lettura_fogli import RIGHE_PER_BLOCCO, apri_workbook, leggi_e_valida_foglio
+from strumentazione import misura
+from validazione import CAMPI_MODELLO
+
+# Workbook aperto una sola volta per ogni processo worker (vedi _inizializza_worker)
+_workbook_worker = None
+_righe_per_blocco_worker = RIGHE_PER_BLOCCO
+_memoria_worker = False
+
+
+def _inizializza_worker(file_path, righe_per_blocco, memoria):
+    global _workbook_worker, _righe_per_blocco_worker, _memoria_worker
+    _workbook_worker = apri_workbook(file_path)
+    _righe_per_blocco_worker = righe_per_blocco
+    _memoria_worker = memoria
+
+
+def _leggi_foglio_misurato(workbook, sheet_name, righe_per_blocco, memoria):
+    """leggi_e_valida_foglio() con le misure del foglio: tempi di lettura e validazione, righe, memoria."""
+    tempi = {}
+    with misura(memoria) as misurato:
+        validi, errori = leggi_e_valida_foglio(workbook, sheet_name, righe_per_blocco, tempi)
+    return validi, errori, {
+        'secondi': misurato['secondi'],
+        'lettura_s': tempi['lettura'],
+        'validazione_s': tempi['validazione'],
+        'righe_valide': len(validi),
+        'errori': len(errori),
+        'picco_mb': misurato['picco_mb'],
+        'pid': os.getpid(),
+    }
+
+
+def _valida_foglio_worker(sheet_name):
+    """Eseguita nel worker: restituisce colonne come array numpy, non liste di dizionari."""
+    validi, errori, misure = _leggi_foglio_misurato(_workbook_worker, sheet_name, _righe_per_blocco_worker,
+                                                     _memoria_worker)
+    return {campo: validi[campo].to_numpy() for campo in CAMPI_MODELLO}, errori, misure
+
+
+def numero_processi(richiesti, fogli):
+    """Processi da usare: quelli configurati (predefinito: numero di CPU), mai più dei fogli."""
+    if not richiesti:
+        richiesti = os.cpu_count() or 1
+    return max(1, min(int(richiesti), fogli))
+
+
+def elabora_fogli(file_path, sheet_names, processi=None, workbook=None, righe_per_blocco=RIGHE_PER_BLOCCO,
+                  misure=None, memoria=False):
+    """
+    Legge e valida i fogli indicati, in parallelo se è disponibile più di un processo.
+
+    I risultati vengono prodotti come (sheet_name, righe_valide, errori) nello stesso
+    ordine di sheet_names, così i messaggi di log restano deterministici. Se `misure` è
+    un dizionario, per ogni foglio vi vengono registrati tempi, righe e (con memoria=True)
+    picco di memoria, misurati nel processo che ha elaborato il foglio.
+    """
+    misure = {} if misure is None else misure
+    processi = numero_processi(processi, len(sheet_names))
+
+    if processi == 1:
+        if workbook is None:
+            workbook = apri_workbook(file_path)
+        for sheet_name in sheet_names:
+            print(f"Leggo e valido il foglio: {sheet_name}...")
+            validi, errori, misure[sheet_name] = _leggi_foglio_misurato(workbook, sheet_name, righe_per_blocco,
+                                                                        memoria)
+            yield sheet_name, validi, errori
+        return
+
+    print(f"Leggo e valido {len(sheet_names)} fogli con {processi} processi in parallelo...")
+    with ProcessPoolExecutor(max_workers=processi, initializer=_inizializza_worker,
+                             initargs=(file_path, righe_per_blocco, memoria)) as executor:
+        # map() restituisce i risultati nell'ordine di invio, indipendentemente da chi finisce prima
+        for sheet_name, (colonne, errori, misure[sheet_name]) in zip(sheet_names,
+                                                                     executor.map(_valida_foglio_worker, sheet_names)):
+            print(f"Foglio letto e validato: {sheet_name}")
+            yield sheet_name, pd.DataFrame(colonne, columns=CAMPI_MODELLO), errori
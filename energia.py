@@ -0,0 +1,210 @@
+"""
+Punto di ingresso unico per le procedure pianificate:
+
+    python energia.py consolida [--full]            foglio 'Consolidato' (crea_consolidato.py)
+    python energia.py report [--output ...]         report Excel statici (unisci_dati.py)
+    python energia.py prepara-dashboard [--forza]   copia Parquet e archivio storico della dashboard
+    python energia.py servizio [--una-volta]        aggiornamento continuo al cambiare dei file di input
+    python energia.py esporta [voci ...] [--da --a]  un report per macchina o gruppo (esportazione_macchine.py)
+
+Configurazione e file di input vengono controllati prima di importare pandas, openpyxl,
+pydantic e gli altri moduli pesanti, che sono caricati solo dal comando che li usa: un
+errore di configurazione o un file mancante viene segnalato in pochi millisecondi.
+Il codice di uscita è diverso da 0 se i controlli non sono superati o se il comando
+non riesce (errore di validazione o di salvataggio, nessun report esportato).
+"""
+import argparse
+import os
+import re
+import sys
+
+from configurazione import carica_config, percorsi_report
+
+CONFIG = 'config.yaml'
+# Chiavi di config.yaml lette senza valore predefinito da crea_consolidato.py
+CHIAVI_CONSOLIDATO = ('file_excel', 'fogli_da_escludere', 'mappatura_colonne', 'colonne_finali')
+# Stesso elenco di unisci_dati.USCITE, ripetuto per non importare unisci_dati
+USCITE = ('report', 'anomalie', 'globale')
+# Stesso elenco di esportazione_macchine.FORMATI
+FORMATI_ESPORTAZIONE = ('xlsx', 'csv', 'parquet')
+
+
+def _file_mancanti(*percorsi):
+    mancanti = [p for p in percorsi if not os.path.exists(p)]
+    for percorso in mancanti:
+        print(f"Errore: Il file '{percorso}' non è stato trovato.")
+    return bool(mancanti)
+
+
+def _config_consolidato():
+    """config.yaml con le chiavi richieste dal consolidamento, o None (con il motivo a video)."""
+    if not os.path.exists(CONFIG):
+        print(f"Errore di configurazione: File di configurazione non trovato: {CONFIG}")
+        return None
+    try:
+        config = carica_config(CONFIG)
+    except Exception as e:
+        print(f"Errore di configurazione: Errore nel parsing del file di configurazione YAML: {e}")
+        return None
+    mancanti = [k for k in CHIAVI_CONSOLIDATO if not config.get(k)]
+    if mancanti:
+        print(f"Errore di configurazione: chiavi mancanti in {CONFIG}: {', '.join(mancanti)}")
+        return None
+    return config
+
+
+# --- Comandi ---
+
+def consolida(args):
+    config = _config_consolidato()
+    if config is None or _file_mancanti(config['file_excel']):
+        return 1
+    from crea_consolidato import crea_foglio_consolidato
+    esito = crea_foglio_consolidato(completo=args.full)
+    # 'interrotta': nessun dato da salvare, non è un errore
+    return 0 if esito in ('completata', 'interrotta') else 1
+
+
+def report(args):
+    config = carica_config(CONFIG)
+    percorsi = percorsi_report(config)
+    if _file_mancanti(percorsi['file_quantita'], percorsi['file_consumo']):
+        return 1
+    from unisci_dati import esegui_pipeline
+    try:
+        esegui_pipeline(list(dict.fromkeys(args.output)), config)
+    except Exception as e:
+        print(f"Si è verificato un errore: {e}")
+        return 1
+    print("\nOperazione completata!")
+    return 0
+
+
+def prepara_dashboard(args):
+    """
+    Allinea al foglio 'Consolidato' la copia Parquet e l'archivio storico letti dalla dashboard.
+
+    Serve quando il Consolidato è stato modificato a mano o le copie sono state cancellate;
+    dopo crea_consolidato.py sono già aggiornate e il comando termina senza leggere il file.
+    """
+    config = _config_consolidato()
+    if config is None or _file_mancanti(config['file_excel']):
+        return 1
+    from archivio_parquet import parquet_aggiornato
+    from archivio_storico import StoricoConsolidato
+
+    file_excel = config['file_excel']
+    cartella_parquet = config.get('cartella_parquet')
+    file_storico = config.get('file_storico')
+    scrivi_parquet = bool(cartella_parquet) and (args.forza or not parquet_aggiornato(cartella_parquet, file_excel))
+    scrivi_storico = bool(file_storico) and (args.forza
+                                             or StoricoConsolidato.se_aggiornato(file_storico, file_excel) is None)
+    if not scrivi_parquet and not scrivi_storico:
+        print("Copia Parquet e archivio storico sono già aggiornati.")
+        return 0
+
+    import pandas as pd
+    from archivio_parquet import scrivi_consolidato_parquet
+    from archivio_storico import aggiorna_storico
+
+    final_columns = config['colonne_finali']
+    print(f"Leggo il foglio 'Consolidato' del file '{file_excel}'...")
+    try:
+        df = pd.read_excel(file_excel, sheet_name='Consolidato')
+    except ValueError as e:
+        print(f"Errore: {e}. Esegui prima 'python energia.py consolida'.")
+        return 1
+    df = df.reindex(columns=final_columns)
+    senza_chiave = df[['macchina', 'anno', 'mese']].isna().any(axis=1)
+    if senza_chiave.any():
+        print(f"ATTENZIONE: {int(senza_chiave.sum())} righe senza macchina, anno o mese vengono ignorate.")
+        df = df[~senza_chiave].reset_index(drop=True)
+
+    if scrivi_parquet:
+        print(f"Salvataggio della copia Parquet in '{cartella_parquet}'...")
+        if scrivi_consolidato_parquet(df, cartella_parquet, file_excel, final_columns):
+            print("Copia Parquet aggiornata.")
+    if scrivi_storico:
+        # Il foglio di origine delle righe non è noto: ogni macchina fa da foglio, e al
+        # prossimo consolidamento l'archivio viene riallineato ai fogli veri
+        fogli = {macchina: righe for macchina, righe in df.groupby('macchina', sort=False)}
+        print(f"Aggiornamento dell'archivio storico '{file_storico}'...")
+        modifiche = aggiorna_storico(file_storico, fogli, None, file_excel, final_columns)
+        print(f"Archivio storico aggiornato ({modifiche} righe modificate).")
+    return 0
+
+
+def servizio(args):
+    if not os.path.exists(CONFIG):
+        print(f"Errore di configurazione: File di configurazione non trovato: {CONFIG}")
+        return 1
+    from servizio_aggiornamento import ServizioAggiornamento
+    ServizioAggiornamento(carica_config(CONFIG)).esegui(una_volta=args.una_volta)
+    return 0
+
+
+def esporta(args):
+    config = carica_config(CONFIG)
+    percorsi = percorsi_report(config)
+    if _file_mancanti(percorsi['file_quantita'], percorsi['file_consumo']):
+        return 1
+    from esportazione_macchine import esporta_report
+    try:
+        file_gruppi = esporta_report(args.voci, args.da, args.a, args.formato, args.cartella, config)
+    except Exception as e:
+        print(f"Si è verificato un errore: {e}")
+        return 1
+    if not file_gruppi:
+        print("Nessun report esportato.")
+        return 1
+    return 0
+
+
+def _mese(valore):
+    if not re.fullmatch(r'\d{4}-(0[1-9]|1[0-2])', valore):
+        raise argparse.ArgumentTypeError(f"mese non valido: '{valore}' (formato AAAA-MM)")
+    return valore
+
+
+COMANDI = {'consolida': consolida, 'report': report, 'prepara-dashboard': prepara_dashboard, 'servizio': servizio,
+           'esporta': esporta}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    comandi = parser.add_subparsers(dest='comando', required=True)
+
+    parser_consolida = comandi.add_parser('consolida', help="Crea o aggiorna il foglio 'Consolidato'")
+    parser_consolida.add_argument('--full', action='store_true',
+                                  help="Ignora la cache e rielabora tutti i fogli delle macchine")
+
+    parser_report = comandi.add_parser('report', help="Genera i report Excel dai file di produzione e consumo")
+    parser_report.add_argument('--output', nargs='+', choices=USCITE, default=list(USCITE),
+                               help="Report da generare (predefinito: tutti)")
+
+    parser_dashboard = comandi.add_parser('prepara-dashboard',
+                                          help="Aggiorna copia Parquet e archivio storico letti dalla dashboard")
+    parser_dashboard.add_argument('--forza', action='store_true',
+                                  help="Riscrive copia Parquet e archivio anche se risultano aggiornati")
+
+    parser_servizio = comandi.add_parser('servizio',
+                                         help="Tiene aggiornati Consolidato e report al cambiare dei file di input")
+    parser_servizio.add_argument('--una-volta', action='store_true',
+                                 help="Esegue le fasi non aggiornate e termina")
+
+    parser_esporta = comandi.add_parser('esporta', help="Un report per ogni macchina o gruppo di macchine")
+    parser_esporta.add_argument('voci', nargs='*',
+                                help="Macchine o gruppi della sezione 'esportazione' di config.yaml "
+                                     "(predefinito: tutte le macchine, una per file)")
+    parser_esporta.add_argument('--da', type=_mese, help="Primo mese incluso (AAAA-MM)")
+    parser_esporta.add_argument('--a', type=_mese, help="Ultimo mese incluso (AAAA-MM)")
+    parser_esporta.add_argument('--formato', choices=FORMATI_ESPORTAZIONE,
+                                help="Formato dei file (predefinito: quello di config.yaml, altrimenti xlsx)")
+    parser_esporta.add_argument('--cartella', help="Cartella dei file (predefinito: quella di config.yaml)")
+
+    args = parser.parse_args(argv)
+    return COMANDI[args.comando](args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,6 +2,18 @@ import streamlit as st
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
+import os
+import time
+import yaml
+from anomalie import parametri_anomalie
+from archivio_parquet import leggi_consolidato_parquet
+from archivio_storico import StoricoConsolidato
+from caricamento_dashboard import CaricatoreDati, DatiStorico
+from cubo_dashboard import aggiungi_rapporti
+from filtri_dashboard import formati_tabella
+from grafici_dashboard import GraficiDashboard, parametri_grafici
+from pulizia_dati import pulisci_consolidato, schema_consolidato
+from strumentazione import leggi_ultima_esecuzione
 
 # --- Configurazione della Pagina ---
 st.set_page_config(
@@ -11,41 +23,69 @@ st.set_page_config(
 )
 
 # --- Caricamento e Pulizia Dati ---
-@st.cache_data
-def load_and_clean_data():
-    # Carica il foglio "Consolidato" del file Excel
-    df = pd.read_excel("Dati consumi e costi energetici.xlsx", sheet_name="Consolidato")
-
-    # Rimuove le righe e colonne completamente vuote
-    df = df.dropna(how='all').reset_index(drop=True)
-    df = df.loc[:, ~df.columns.str.contains('^Unnamed')]
-
-    # Pulisce e converte le colonne numeriche
-    numeric_cols = [
-        'anno', 'mese', 'ore_produzione', 'pezzi_prodotti', 'consumo_kwh', 
-        'lettura', 'costo_energia_per_kwh', 'costo_macchina', 'consumo_bolletta_kwh', 'totale_bolletta'
-    ]
-    for col in numeric_cols:
-        if df[col].dtype == 'object':
-            df[col] = df[col].astype(str).str.replace(' €', '', regex=False).str.replace(',', '.', regex=False)
-        df[col] = pd.to_numeric(df[col], errors='coerce')
-
-    # --- CALCOLO FORZATO PER RISOLVERE PROBLEMI DI VISUALIZZAZIONE ---
-    # Questa operazione sovrascrive la colonna 'costo_macchina' letta dal file,
-    # garantendo che sia sempre un valore numerico calcolato.
-    df['costo_macchina'] = df['consumo_kwh'].fillna(0) * df['costo_energia_per_kwh'].fillna(0)
-
-    # Crea una colonna data per facilitare i filtri
-    df['data'] = pd.to_datetime(df['anno'].astype(str) + '-' + df['mese'].astype(str) + '-01', errors='coerce')
-
-    # Ricalcola le metriche dipendenti con il nuovo costo_macchina
-    df['consumo_per_pezzo'] = df['consumo_kwh'] / df['pezzi_prodotti'].replace(0, pd.NA)
-    df['consumo_per_ora'] = df['consumo_kwh'] / df['ore_produzione'].replace(0, pd.NA)
-    df['costo_per_pezzo'] = df['costo_macchina'] / df['pezzi_prodotti'].replace(0, pd.NA)
+def carica_config(config_path='config.yaml'):
+    """Legge i percorsi da config.yaml; senza file si usano i valori predefiniti."""
+    config = {'file_excel': "Dati consumi e costi energetici.xlsx", 'cartella_parquet': None, 'dashboard': {}}
+    if os.path.exists(config_path):
+        with open(config_path, 'r') as f:
+            config.update(yaml.safe_load(f) or {})
+    return config
 
-    return df
-
-df = load_and_clean_data()
+def load_and_clean_data():
+    config = carica_config()
+    file_excel = config['file_excel']
+
+    # Preferisce la copia Parquet del Consolidato; se manca o non è aggiornata legge l'Excel
+    df = None
+    if config['cartella_parquet']:
+        df = leggi_consolidato_parquet(config['cartella_parquet'], file_excel)
+    if df is None:
+        # Carica il foglio "Consolidato" del file Excel
+        df = pd.read_excel(file_excel, sheet_name="Consolidato")
+
+    # Tipi compatti dalle colonne finali di config.yaml: meno memoria per ogni istantanea
+    return pulisci_consolidato(df, schema_consolidato(config))
+
+@st.cache_resource
+def carica_dati():
+    # Un solo caricatore per processo, condiviso tra le sessioni: ricarica i dati quando
+    # il file cambia o scade il TTL, senza bloccare chi sta usando la dashboard
+    config = carica_config()
+    opzioni = config.get('dashboard') or {}
+    return CaricatoreDati(
+        load_and_clean_data,
+        config['file_excel'],
+        ttl=opzioni.get('ttl_secondi'),
+        intervallo_controllo=opzioni.get('intervallo_controllo_secondi', 5),
+        con_hash=opzioni.get('controllo_hash', False),
+        osserva_file=opzioni.get('osserva_file', False),
+        parametri_anomalie=parametri_anomalie(config),
+        config=config
+    )
+
+@st.cache_resource
+def dati_da_storico(percorso):
+    # Condiviso tra le sessioni: contiene solo l'ultima selezione, non l'intero storico
+    config = carica_config()
+    return DatiStorico(StoricoConsolidato(percorso), parametri_anomalie(config), schema_consolidato(config))
+
+@st.cache_resource
+def grafici_condivisi():
+    # Figure condivise tra le sessioni, per versione dei dati e combinazione di filtri
+    return GraficiDashboard(parametri_grafici(carica_config()))
+
+# Con l'archivio storico aggiornato i filtri diventano interrogazioni indicizzate;
+# altrimenti si carica in memoria l'intero Consolidato (Parquet o Excel)
+config = carica_config()
+storico = StoricoConsolidato.se_aggiornato(config.get('file_storico'), config['file_excel'])
+if storico is not None:
+    caricatore = None
+    dati = dati_da_storico(storico.percorso)
+else:
+    caricatore = carica_dati()
+    dati = caricatore.dati()
+indice = dati.indice
+cubo = dati.cubo
 
 # --- Titolo e Intestazione ---
 st.title("⚡ Dashboard Consumi Energetici - Vetronaviglio")
@@ -54,8 +94,27 @@ st.markdown("Un'applicazione interattiva per analizzare i consumi energetici del
 # --- Sidebar per i Filtri ---
 st.sidebar.header("Filtri")
 
+# Stato dei dati e ricaricamento manuale
+if caricatore is None:
+    # L'archivio viene interrogato a ogni aggiornamento della pagina: non serve ricaricare
+    aggiornato = time.strftime('%d/%m/%Y %H:%M:%S', time.localtime(dati.caricati_il))
+    st.sidebar.caption(f"Dati interrogati dall'archivio storico, aggiornato il {aggiornato}")
+else:
+    if st.sidebar.button("🔄 Ricarica dati"):
+        with st.spinner("Ricaricamento dei dati in corso..."):
+            try:
+                dati = caricatore.ricarica()
+                indice, cubo = dati.indice, dati.cubo
+            except Exception as e:
+                st.sidebar.error(f"Ricaricamento non riuscito: {e}")
+    st.sidebar.caption(f"Dati caricati alle {time.strftime('%H:%M:%S', time.localtime(dati.caricati_il))}")
+    if caricatore.ricarica_in_corso:
+        st.sidebar.caption("Aggiornamento dei dati in corso in background...")
+    if caricatore.ultimo_errore:
+        st.sidebar.warning(f"Ultimo aggiornamento automatico non riuscito: {caricatore.ultimo_errore}")
+
 # Filtro per Macchina
-macchine_univoche = df['macchina'].dropna().unique()
+macchine_univoche = indice.macchine
 macchine_selezionate = st.sidebar.multiselect(
     "Seleziona Macchina/Impianto:",
     options=macchine_univoche,
@@ -63,7 +122,7 @@ macchine_selezionate = st.sidebar.multiselect(
 )
 
 # Filtro per Anno
-anni_univoci = sorted(df['anno'].dropna().unique())
+anni_univoci = indice.anni
 anno_selezionato = st.sidebar.selectbox(
     "Seleziona Anno:",
     options=["Tutti"] + list(anni_univoci),
@@ -71,125 +130,135 @@ anno_selezionato = st.sidebar.selectbox(
 )
 
 # Filtro per Mese
-mesi_univoci = sorted(df['mese'].dropna().unique())
+mesi_univoci = indice.mesi
 mese_selezionato = st.sidebar.selectbox(
     "Seleziona Mese:",
     options=["Tutti"] + list(mesi_univoci),
     index=0
 )
 
-# Applica i filtri
-df_filtrato = df.copy()
-
-if macchine_selezionate:
-    df_filtrato = df_filtrato[df_filtrato['macchina'].isin(macchine_selezionate)]
-
-if anno_selezionato != "Tutti":
-    df_filtrato = df_filtrato[df_filtrato['anno'] == anno_selezionato]
-
-if mese_selezionato != "Tutti":
-    df_filtrato = df_filtrato[df_filtrato['mese'] == mese_selezionato]
+# Applica i filtri (ricerca sugli indici, senza copiare l'intero DataFrame)
+filtri = dict(
+    macchine=macchine_selezionate,
+    anno=None if anno_selezionato == "Tutti" else anno_selezionato,
+    mese=None if mese_selezionato == "Tutti" else mese_selezionato
+)
+df_filtrato = indice.filtra(**filtri)
+# I grafici usano le celle del cubo mensile corrispondenti agli stessi filtri
+df_cubo = cubo.filtra(**filtri)
+# Figure già costruite per questi dati e filtri vengono riusate senza ricalcoli
+grafici = grafici_condivisi()
+chiave_grafici = (dati.versione, tuple(macchine_selezionate), filtri['anno'], filtri['mese'])
 
 # --- Visualizzazione dei Dati Filtrati ---
 st.subheader("📊 Dati Filtrati")
 
-# Rimuovi le colonne 'lettura' e 'data' solo per la visualizzazione della tabella
-df_display = df_filtrato.drop(columns=['lettura', 'data', 'consumo_bolletta_kwh', 'totale_bolletta'], errors='ignore')
-
-st.dataframe(df_display.style.format(
-        formatter={
-            "costo_macchina": lambda x: f'{x:.2f} €' if pd.notna(x) else '-',
-            "costo_energia_per_kwh": lambda x: f'{x:.4f} €' if pd.notna(x) else '-',
-            "totale_bolletta": lambda x: f'{x:.2f} €' if pd.notna(x) else '-',
-            "consumo_kwh": lambda x: f'{x:.2f}' if pd.notna(x) else '-',
-            "ore_produzione": lambda x: f'{x:.2f}' if pd.notna(x) else '-',
-            "pezzi_prodotti": lambda x: f'{x:.0f}' if pd.notna(x) else '-',
-            "costo_per_pezzo": lambda x: f'{x:.4f} €' if pd.notna(x) else '-'
-        }
-    ), use_container_width=True)
+# Rimuovi alcune colonne solo per la visualizzazione della tabella; i rapporti derivati
+# vengono calcolati qui, sulle sole righe filtrate
+df_display = aggiungi_rapporti(
+    df_filtrato.drop(columns=['lettura', 'consumo_bolletta_kwh', 'totale_bolletta'], errors='ignore'))
+
+# Formati applicati solo alla visualizzazione: le colonne restano numeriche e si ordinano per valore
+st.dataframe(df_display, use_container_width=True,
+             column_config={col: st.column_config.NumberColumn(format=formato)
+                            for col, formato in formati_tabella(df_display).items()})
 
 # --- Grafici Interattivi ---
 st.subheader("📈 Analisi dei Consumi")
 
-tab1, tab2, tab3, tab4 = st.tabs(["Consumo kWh", "Costo Macchina", "Consumo per Pezzo", "Consumo per Ora"])
+tab1, tab2, tab3, tab4, tab5 = st.tabs(["Consumo kWh", "Costo Macchina", "Consumo per Pezzo", "Consumo per Ora", "Anomalie"])
 
 with tab1:
     if not df_filtrato.empty:
-        fig1 = px.line(
-            df_filtrato,
-            x='data',
-            y='consumo_kwh',
-            color='macchina',
-            markers=True,
-            title="Consumo Energetico (kWh) nel Tempo"
-        )
-        fig1.update_layout(xaxis_title="Data", yaxis_title="Consumo (kWh)")
-        st.plotly_chart(fig1, use_container_width=True)
+        st.plotly_chart(grafici.figura('consumo', chiave_grafici, df_cubo), use_container_width=True)
     else:
         st.info("Nessun dato disponibile con i filtri selezionati.")
 
 with tab2:
     if not df_filtrato.empty:
-        fig2 = px.bar(
-            df_filtrato,
-            x='macchina',
-            y='costo_macchina',
-            color='data',
-            title="Costo Energetico per Macchina",
-            barmode='group'
-        )
-        fig2.update_layout(xaxis_title="Macchina", yaxis_title="Costo (€)")
-        st.plotly_chart(fig2, use_container_width=True)
+        st.plotly_chart(grafici.figura('costo', chiave_grafici, df_cubo), use_container_width=True)
     else:
         st.info("Nessun dato disponibile con i filtri selezionati.")
 
 with tab3:
     if not df_filtrato.empty:
-        fig3 = px.scatter(
-            df_filtrato.dropna(subset=['consumo_per_pezzo']),
-            x='pezzi_prodotti',
-            y='consumo_per_pezzo',
-            color='macchina',
-            size='consumo_kwh',
-            hover_data=['data', 'anno', 'mese'],
-            title="Efficienza: Consumo per Pezzo Prodotto"
-        )
-        fig3.update_layout(xaxis_title="Pezzi Prodotti", yaxis_title="Consumo (kWh) per Pezzo")
-        st.plotly_chart(fig3, use_container_width=True)
+        st.plotly_chart(grafici.figura('consumo_per_pezzo', chiave_grafici, df_cubo), use_container_width=True)
     else:
         st.info("Nessun dato disponibile con i filtri selezionati.")
 
 with tab4:
     if not df_filtrato.empty:
-        fig4 = px.box(
-            df_filtrato.dropna(subset=['consumo_per_ora']),
-            x='macchina',
-            y='consumo_per_ora',
-            title="Distribuzione del Consumo per Ora di Lavoro"
-        )
-        fig4.update_layout(xaxis_title="Macchina", yaxis_title="Consumo (kWh) per Ora")
-        st.plotly_chart(fig4, use_container_width=True)
+        st.plotly_chart(grafici.figura('consumo_per_ora', chiave_grafici, df_cubo), use_container_width=True)
     else:
         st.info("Nessun dato disponibile con i filtri selezionati.")
 
+with tab5:
+    # Punteggi calcolati sulle celle del cubo: gli stessi filtri valgono anche qui
+    df_punteggi = df_cubo.dropna(subset=['punteggio'])
+    if not df_punteggi.empty:
+        motore = dati.motore_anomalie
+        st.caption(f"Consumo per pezzo confrontato con mediana e MAD degli ultimi {motore.finestra_mesi} mesi "
+                   f"della stessa macchina: anomalo oltre ±{motore.soglia} (punteggio robusto).")
+        st.plotly_chart(grafici.figura('anomalie', chiave_grafici, df_punteggi, motore.soglia),
+                        use_container_width=True)
+
+        df_anomalie = df_punteggi[df_punteggi['anomalia'].notna()]
+        if not df_anomalie.empty:
+            st.dataframe(
+                df_anomalie[['macchina', 'anno', 'mese', 'consumo_per_pezzo', 'mediana', 'punteggio', 'anomalia']]
+                .round({'consumo_per_pezzo': 4, 'mediana': 4, 'punteggio': 2}),
+                use_container_width=True, hide_index=True
+            )
+        else:
+            st.info("Nessuna anomalia con i filtri selezionati.")
+    else:
+        st.info("Storia insufficiente per valutare le anomalie con i filtri selezionati.")
+
 # --- Tabella Riepilogativa ---
 st.subheader("📋 Riepilogo per Macchina")
 
 if not df_filtrato.empty:
-    riepilogo = df_filtrato.groupby('macchina').agg({
-        'consumo_kwh': 'sum',
-        'costo_macchina': 'sum',
-        'pezzi_prodotti': 'sum',
-        'ore_produzione': 'sum'
-    }).round(2)
-
-    riepilogo['consumo_per_pezzo'] = (riepilogo['consumo_kwh'] / riepilogo['pezzi_prodotti']).round(4)
-    riepilogo['costo_per_pezzo'] = (riepilogo['costo_macchina'] / riepilogo['pezzi_prodotti']).round(4)
+    riepilogo = cubo.riepilogo(**filtri)
 
     st.dataframe(riepilogo, use_container_width=True)
 else:
     st.info("Nessun dato disponibile con i filtri selezionati.")
 
+# --- Prestazioni dell'ultimo consolidamento ---
+# Resoconto JSON scritto da crea_consolidato.py (vedi strumentazione.py)
+with st.expander("⏱️ Prestazioni dell'ultimo consolidamento"):
+    esecuzione = leggi_ultima_esecuzione('consolidato', config)
+    if esecuzione is None:
+        st.info("Nessun resoconto disponibile: esegui crea_consolidato.py per generarlo.")
+    else:
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("Eseguito il", esecuzione['inizio'].replace('T', ' '))
+        col2.metric("Esito", esecuzione['esito'])
+        col3.metric("Durata totale", f"{esecuzione['secondi_totali']:.1f} s")
+        col4.metric("Errori di validazione", esecuzione.get('errori_validazione', '-'))
+
+        df_fasi = pd.DataFrame(esecuzione['fasi'])
+        st.dataframe(df_fasi.reindex(columns=['fase', 'secondi', 'righe', 'picco_mb']),
+                     use_container_width=True, hide_index=True)
+
+        # Fogli rielaborati (non presi dalla cache): dove si spende il tempo, lettura o validazione
+        df_fogli = pd.DataFrame(esecuzione['fogli'])
+        if not df_fogli.empty and 'lettura_s' in df_fogli:
+            df_fogli = df_fogli.dropna(subset=['lettura_s']).nlargest(15, 'secondi')
+            fig_fogli = px.bar(
+                df_fogli[['foglio', 'lettura_s', 'validazione_s']].melt(
+                    id_vars='foglio', var_name='attività', value_name='secondi'),
+                x='foglio',
+                y='secondi',
+                color='attività',
+                title="Fogli più lenti: lettura e validazione"
+            )
+            st.plotly_chart(fig_fogli, use_container_width=True)
+        if esecuzione.get('profilo'):
+            st.caption(f"Profilo dell'esecuzione salvato in: {esecuzione['profilo']}")
+    if dati.resoconto:
+        st.caption(f"Ultimo caricamento dei dati della dashboard: {dati.resoconto['secondi_totali']:.2f} s")
+
 # --- Sezione "Informazioni" ---
 st.sidebar.markdown("---")
 st.sidebar.info(
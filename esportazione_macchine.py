@@ -0,0 +1,140 @@
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from configurazione import carica_config, percorsi_report
+from dati_produzione import carica_mensile
+from elaborazione_fogli import numero_processi
+from report_macchine import scrivi_report_macchine
+from strumentazione import Esecuzione, stampa_fasi
+from unisci_dati import scrittura_atomica
+
+# Esportazione di un report per macchina o per gruppo di macchine (es. reparto), tutti
+# ricavati dallo stesso aggregato mensile: i file di produzione vengono letti una volta
+# sola e ogni processo scrive solo le righe del proprio gruppo.
+PARAMETRI_ESPORTAZIONE = {
+    'cartella': 'report_macchine',
+    'formato': 'xlsx',
+    # Processi usati per scrivere i file (vuoto = numero di CPU)
+    'processi': None,
+    'macchine_per_riga': 3,
+    # Gruppi con nome: {'Forni': ['F01', 'F02'], ...}
+    'gruppi': {},
+}
+FORMATI = ('xlsx', 'csv', 'parquet')
+
+
+def parametri_esportazione(config):
+    """Impostazioni dalla sezione 'esportazione' di config.yaml, con i valori predefiniti."""
+    parametri = dict(PARAMETRI_ESPORTAZIONE)
+    parametri.update({k: v for k, v in ((config or {}).get('esportazione') or {}).items()
+                      if k in parametri and v is not None})
+    return parametri
+
+
+def risolvi_gruppi(voci, macchine, gruppi_configurati):
+    """
+    {nome del file: macchine} per le voci richieste: il nome di un gruppo di config.yaml
+    o il codice di una macchina. Senza voci, un report per ogni macchina. Le voci non
+    riconosciute vengono segnalate e saltate.
+    """
+    if not voci:
+        return {m: [m] for m in macchine}
+    presenti = set(macchine)
+    gruppi = {}
+    for voce in dict.fromkeys(voci):
+        if voce in gruppi_configurati:
+            gruppi[voce] = [m for m in gruppi_configurati[voce] if m in presenti]
+        elif voce in presenti:
+            gruppi[voce] = [voce]
+        else:
+            print(f"ATTENZIONE: '{voce}' non è né una macchina dei file di produzione né un gruppo di config.yaml.")
+    return gruppi
+
+
+def nome_file(gruppo, formato):
+    """Nome del file del gruppo, con i soli caratteri validi in ogni sistema."""
+    return re.sub(r'[^\w.-]+', '_', gruppo) + f".{formato}"
+
+
+def scrivi_gruppo(df_gruppo, percorso, formato, macchine_per_riga=3):
+    """Scrive il report di un gruppo (eseguita nel processo worker); restituisce le misure."""
+    inizio = time.perf_counter()
+    with scrittura_atomica(percorso) as temporaneo:
+        if formato == 'xlsx':
+            scrivi_report_macchine(df_gruppo, temporaneo, macchine_per_riga)
+        elif formato == 'csv':
+            df_gruppo.to_csv(temporaneo, index=False)
+        else:
+            df_gruppo.to_parquet(temporaneo, index=False)
+    return {'secondi': time.perf_counter() - inizio, 'righe': len(df_gruppo), 'pid': os.getpid()}
+
+
+def esporta_report(voci=None, da=None, a=None, formato=None, cartella=None, config=None):
+    """
+    Un file per ogni voce (macchina o gruppo) con i mesi da `da` ad `a` inclusi ('YYYY-MM').
+
+    L'aggregato mensile viene calcolato una volta (carica_mensile) e tagliato per gruppo;
+    i file vengono scritti in parallelo da un pool di processi, ognuno in modo atomico.
+    L'avanzamento è stampato a ogni file completato; tempi e righe di ogni file finiscono
+    nel resoconto dell'esecuzione 'esportazione'. Restituisce {gruppo: percorso}.
+    """
+    config = carica_config() if config is None else config
+    parametri = parametri_esportazione(config)
+    formato = formato or parametri['formato']
+    cartella = cartella or parametri['cartella']
+    if formato not in FORMATI:
+        raise ValueError(f"Formato '{formato}' non supportato (disponibili: {', '.join(FORMATI)})")
+    percorsi = percorsi_report(config)
+
+    with Esecuzione('esportazione', config) as esecuzione:
+        esecuzione.info.update({'formato': formato, 'da': da, 'a': a})
+        with esecuzione.fase('lettura e aggregazione') as fase:
+            df_monthly = carica_mensile(percorsi['file_quantita'], percorsi['file_consumo'])
+            # Mesi 'YYYY-MM': l'ordine del testo è quello cronologico
+            nel_periodo = df_monthly['Mese'].between(da or '0000-00', a or '9999-99')
+            df_periodo = df_monthly[nel_periodo]
+            fase['righe'] = len(df_periodo)
+
+        gruppi = risolvi_gruppi(voci, sorted(df_monthly['Macchina'].unique().tolist()), parametri['gruppi'])
+        righe_gruppo = {}
+        for gruppo, macchine in gruppi.items():
+            righe = df_periodo[df_periodo['Macchina'].isin(macchine)]
+            if righe.empty:
+                print(f"ATTENZIONE: nessun dato per '{gruppo}' nel periodo richiesto, file non creato.")
+            else:
+                righe_gruppo[gruppo] = righe
+        esecuzione.info['gruppi'] = len(righe_gruppo)
+
+        os.makedirs(cartella, exist_ok=True)
+        file_gruppi = {g: os.path.join(cartella, nome_file(g, formato)) for g in righe_gruppo}
+        processi = numero_processi(parametri['processi'], len(righe_gruppo))
+        print(f"Esporto {len(righe_gruppo)} report ({formato}) in '{cartella}' con {processi} processi...")
+
+        with esecuzione.fase('scrittura (totale)', righe=int(sum(len(r) for r in righe_gruppo.values()))):
+            argomenti = {g: (righe_gruppo[g], file_gruppi[g], formato, parametri['macchine_per_riga'])
+                         for g in righe_gruppo}
+            if processi == 1:
+                completati = ((g, scrivi_gruppo(*argomenti[g])) for g in argomenti)
+                _registra(esecuzione, completati, len(argomenti))
+            else:
+                with ProcessPoolExecutor(max_workers=processi) as executor:
+                    futuri = {executor.submit(scrivi_gruppo, *argomenti[g]): g for g in argomenti}
+                    _registra(esecuzione, ((futuri[f], f.result()) for f in as_completed(futuri)), len(futuri))
+        esecuzione.esito = 'completata'
+
+    stampa_fasi(esecuzione)
+    if esecuzione.fogli:
+        piu_lento = max(esecuzione.fogli, key=lambda voce: voce['secondi'])
+        print(f"\n{len(esecuzione.fogli)} file in {esecuzione.rapporto['secondi_totali']:.2f} s "
+              f"(scrittura media {sum(v['secondi'] for v in esecuzione.fogli) / len(esecuzione.fogli):.2f} s "
+              f"per file, più lento: {piu_lento['foglio']} {piu_lento['secondi']:.2f} s)")
+    return file_gruppi
+
+
+def _registra(esecuzione, completati, totale):
+    """Avanzamento a video e misure di ogni file nel resoconto, nell'ordine di completamento."""
+    for n, (gruppo, misure) in enumerate(completati, start=1):
+        print(f"[{n}/{totale}] {gruppo}: {misure['righe']} righe in {misure['secondi']:.2f} s")
+        esecuzione.aggiungi_foglio(gruppo, **misure)
@@ -0,0 +1,48 @@
+import numpy as np
+import pandas as pd
+
+# Nomi dei mesi usati nelle etichette dei file di produzione (compreso il refuso 'GUIGNO')
+MESI_ITALIANI = {
+    'GENNAIO': 1, 'FEBBRAIO': 2, 'MARZO': 3, 'APRILE': 4,
+    'MAGGIO': 5, 'GIUGNO': 6, 'GUIGNO': 6, 'LUGLIO': 7, 'AGOSTO': 8,
+    'SETTEMBRE': 9, 'OTTOBRE': 10, 'NOVEMBRE': 11, 'DICEMBRE': 12
+}
+
+_NAT = np.iinfo('int64').min
+
+
+def _ordinali_mese(etichette):
+    """Ordinale del periodo mensile (mesi dal 1970-01) per ogni etichetta, _NAT se non riconosciuta."""
+    testo = pd.Series(etichette, dtype=object).astype(str).str.upper()
+
+    # Come nella pulizia originale vale il primo nome di mese (nell'ordine del dizionario) contenuto nell'etichetta
+    mesi = np.zeros(len(testo), dtype='int64')
+    for nome, numero in MESI_ITALIANI.items():
+        trovati = (mesi == 0) & testo.str.contains(nome, regex=False).to_numpy(dtype=bool)
+        mesi[trovati] = numero
+
+    # Anno: primo gruppo di cifre, a due (25 -> 2025) o a quattro cifre
+    cifre = testo.str.extract(r'(\d+)', expand=False)
+    lunghezze = cifre.str.len().fillna(0).to_numpy(dtype='int64')
+    anni = pd.to_numeric(cifre, errors='coerce').fillna(0).to_numpy(dtype='int64')
+    anni = np.where(lunghezze == 2, anni + 2000, anni)
+
+    validi = (mesi > 0) & ((lunghezze == 2) | (lunghezze == 4))
+    return np.where(validi, (anni - 1970) * 12 + mesi - 1, _NAT)
+
+
+def interpreta_mesi(etichette):
+    """
+    Converte etichette come 'GENNAIO25' o 'Consumo kWh GUIGNO 25' in periodi mensili.
+
+    Ogni etichetta distinta viene interpretata una sola volta e il risultato viene
+    riportato su tutte le righe. Restituisce la serie con dtype period[M] (NaT per le
+    etichette non riconosciute) e l'elenco delle etichette non riconosciute.
+    """
+    etichette = pd.Series(etichette)
+    codici, uniche = pd.factorize(etichette, use_na_sentinel=False)
+    ordinali = _ordinali_mese(np.asarray(uniche, dtype=object))
+    periodi = pd.PeriodIndex.from_ordinals(ordinali, freq='M')
+
+    non_riconosciute = [str(e) for e, o in zip(uniche, ordinali) if o == _NAT]
+    return pd.Series(periodi.take(codici), index=etichette.index), non_riconosciute
@@ -0,0 +1,87 @@
+import numpy as np
+import pandas as pd
+
+from formati_colonne import FORMATI_COLONNE
+
+
+class IndiceConsolidato:
+    """
+    Dati del Consolidato ordinati per (macchina, anno, mese) con indici di gruppo precalcolati.
+
+    Le righe di ogni macchina sono contigue e, al loro interno, ordinate per anno e mese:
+    un filtro diventa una ricerca binaria sugli intervalli invece di una scansione (e una
+    copia) dell'intero DataFrame. Le macchine mantengono l'ordine di prima comparsa nel file.
+    """
+
+    def __init__(self, df):
+        # Anche se la colonna è già una categoria, le macchine seguono l'ordine di comparsa
+        comparsa = np.asarray(df['macchina'].dropna().unique(), dtype=object)
+        macchine = pd.Categorical(df['macchina'], categories=comparsa)
+        codici = macchine.codes.astype('int64')
+        # Le righe senza macchina (codice -1) vanno in fondo
+        codici[codici < 0] = len(macchine.categories)
+        anni = df['anno'].to_numpy(dtype='float64')
+        mesi = df['mese'].to_numpy(dtype='float64')
+
+        ordine = np.lexsort((mesi, anni, codici))
+        self.df = df.iloc[ordine].reset_index(drop=True)
+        self.df['macchina'] = macchine[ordine]
+        self._anni = anni[ordine]
+        self._mesi = mesi[ordine]
+
+        codici = codici[ordine]
+        self.macchine = list(macchine.categories)
+        inizi = np.searchsorted(codici, np.arange(len(self.macchine)), side='left')
+        fini = np.searchsorted(codici, np.arange(len(self.macchine)), side='right')
+        self._intervalli = {m: (int(a), int(b)) for m, a, b in zip(self.macchine, inizi, fini)}
+        self._senza_macchina = (int(fini[-1]) if len(fini) else 0, len(self.df))
+
+        # Valori per i filtri, con il tipo originale delle colonne
+        self.anni = sorted(self.df['anno'].dropna().unique())
+        self.mesi = sorted(self.df['mese'].dropna().unique())
+
+    def _restringi(self, inizio, fine, valori, valore):
+        """Sotto-intervallo di [inizio, fine) in cui valori == valore (valori ordinati nell'intervallo)."""
+        blocco = valori[inizio:fine]
+        return (inizio + int(np.searchsorted(blocco, valore, side='left')),
+                inizio + int(np.searchsorted(blocco, valore, side='right')))
+
+    def filtra(self, macchine=None, anno=None, mese=None):
+        """
+        Righe delle macchine indicate (tutte se la lista è vuota), eventualmente per anno e mese.
+
+        Senza alcun filtro restituisce il DataFrame indicizzato stesso, senza copiarlo:
+        chi lo riceve non deve modificarlo sul posto.
+        """
+        if macchine:
+            intervalli = [self._intervalli[m] for m in macchine if m in self._intervalli]
+        else:
+            if anno is None and mese is None:
+                return self.df
+            intervalli = list(self._intervalli.values()) + [self._senza_macchina]
+
+        posizioni = []
+        for inizio, fine in intervalli:
+            if anno is not None:
+                inizio, fine = self._restringi(inizio, fine, self._anni, anno)
+                if mese is not None:
+                    inizio, fine = self._restringi(inizio, fine, self._mesi, mese)
+            elif mese is not None:
+                # Senza anno i mesi non sono ordinati nell'intervallo: maschera sulla sola macchina
+                blocco = np.flatnonzero(self._mesi[inizio:fine] == mese) + inizio
+                posizioni.append(blocco)
+                continue
+            posizioni.append(np.arange(inizio, fine))
+
+        if not posizioni:
+            return self.df.iloc[:0]
+        return self.df.iloc[np.concatenate(posizioni)]
+
+
+def formati_tabella(df):
+    """
+    Formato printf (con il suffisso) delle colonne di FORMATI_COLONNE presenti in `df`, da
+    usare con st.column_config.NumberColumn: le colonne restano numeriche, quindi
+    l'ordinamento della tabella è per valore e non alfabetico.
+    """
+    return {col: formato + suffisso for col, (formato, suffisso) in FORMATI_COLONNE.items() if col in df.columns}
@@ -0,0 +1,22 @@
+# Formati numerici delle colonne del Consolidato, senza dipendenze: li usano la tabella
+# della dashboard (filtri_dashboard.formati_tabella) e i tipi compatti in memoria
+# (pulizia_dati), che non devono perdere cifre tra quelle mostrate.
+
+# (formato printf, suffisso)
+FORMATI_COLONNE = {
+    "costo_macchina": ('%.2f', ' €'),
+    "costo_energia_per_kwh": ('%.4f', ' €'),
+    "totale_bolletta": ('%.2f', ' €'),
+    "consumo_kwh": ('%.2f', ''),
+    "ore_produzione": ('%.2f', ''),
+    "pezzi_prodotti": ('%.0f', ''),
+    "costo_per_pezzo": ('%.4f', ' €'),
+}
+# Decimali delle colonne senza un formato proprio
+DECIMALI_PREDEFINITI = 2
+
+
+def decimali_mostrati(colonna):
+    """Cifre decimali con cui la colonna viene mostrata."""
+    formato = FORMATI_COLONNE.get(colonna)
+    return int(formato[0][2:-1]) if formato else DECIMALI_PREDEFINITI
@@ -0,0 +1,228 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objects as go
+
+# Impostazioni della sezione 'grafici' di config.yaml
+PARAMETRI_GRAFICI = {
+    # Oltre questo numero di punti un grafico mostra serie ridotte (LTTB) o aggregate
+    'max_punti': 5000,
+    # Grafici a dispersione e linee disegnati con WebGL oltre questo numero di punti
+    'soglia_webgl': 1000,
+    # Figure conservate in memoria, una per grafico e combinazione di filtri
+    'figure_in_cache': 64,
+}
+
+
+def parametri_grafici(config):
+    """Impostazioni dalla sezione 'grafici' di config.yaml, con i valori predefiniti."""
+    parametri = dict(PARAMETRI_GRAFICI)
+    parametri.update({k: v for k, v in ((config or {}).get('grafici') or {}).items() if k in parametri})
+    return parametri
+
+
+# --- Riduzione dei punti ---
+
+def lttb(x, y, punti):
+    """
+    Indici dei `punti` punti scelti da Largest-Triangle-Three-Buckets sulla serie (x, y)
+    ordinata per x: primo e ultimo punto sempre inclusi, per ogni intervallo intermedio il
+    punto che forma il triangolo più grande con il punto scelto prima e la media
+    dell'intervallo successivo. Picchi e cali restano visibili, a differenza della media.
+    """
+    n = len(x)
+    if punti >= n or punti < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype='float64')
+    y = np.asarray(y, dtype='float64')
+    bordi = np.linspace(1, n - 1, punti - 1).astype('int64')
+    scelti = np.empty(punti, dtype='int64')
+    scelti[0], scelti[-1] = 0, n - 1
+    a = 0
+    for i in range(punti - 2):
+        inizio, fine = bordi[i], bordi[i + 1]
+        successivo = slice(fine, bordi[i + 2] if i + 2 < len(bordi) else n)
+        media_x, media_y = x[successivo].mean(), y[successivo].mean()
+        aree = np.abs((x[a] - media_x) * (y[inizio:fine] - y[a]) - (x[a] - x[inizio:fine]) * (media_y - y[a]))
+        a = inizio + int(np.argmax(aree))
+        scelti[i + 1] = a
+    return scelti
+
+
+def riduci_serie(df, x, y, gruppo, max_punti):
+    """
+    Righe di `df` da disegnare come linee: tutte se sono al massimo `max_punti`, altrimenti
+    per ogni gruppo (macchina) i punti scelti da LTTB, in proporzione alla sua lunghezza.
+    Le righe senza valore vengono scartate prima della riduzione.
+    """
+    df = df.dropna(subset=[x, y])
+    if len(df) <= max_punti:
+        return df
+    quota = max_punti / len(df)
+    parti = []
+    for _, serie in df.groupby(gruppo, observed=True, sort=False):
+        serie = serie.sort_values(x, kind='stable')
+        ascisse = serie[x].to_numpy()
+        if np.issubdtype(ascisse.dtype, np.datetime64):
+            ascisse = ascisse.astype('datetime64[ns]').astype('int64')
+        indici = lttb(ascisse, serie[y].to_numpy(dtype='float64'), max(3, int(len(serie) * quota)))
+        parti.append(serie.iloc[indici])
+    return pd.concat(parti)
+
+
+def quartili_per_gruppo(df, gruppo, valore):
+    """
+    Statistiche dei box plot per gruppo (q1, mediana, q3 e baffi entro 1,5 volte lo scarto
+    interquartile, come Plotly), così al browser arrivano cinque numeri per macchina
+    invece di tutti i valori. I quartili usano l'interpolazione lineare di numpy.
+    """
+    df = df.dropna(subset=[valore])
+    gruppi = df.groupby(gruppo, observed=True)[valore]
+    statistiche = gruppi.quantile([0.25, 0.5, 0.75]).unstack()
+    statistiche.columns = ['q1', 'mediana', 'q3']
+    scarto = statistiche['q3'] - statistiche['q1']
+    limiti = df[[gruppo]].join(statistiche[['q1', 'q3']].assign(scarto=scarto), on=gruppo)
+    dentro = ((df[valore] >= limiti['q1'] - 1.5 * limiti['scarto'])
+              & (df[valore] <= limiti['q3'] + 1.5 * limiti['scarto']))
+    statistiche['minimo'] = df[dentro].groupby(gruppo, observed=True)[valore].min()
+    statistiche['massimo'] = df[dentro].groupby(gruppo, observed=True)[valore].max()
+    statistiche['valori'] = gruppi.size()
+    return statistiche
+
+
+def _titolo(titolo, mostrati, totali, come='campionati'):
+    return titolo if mostrati >= totali else f"{titolo} ({come}: {mostrati:,} di {totali:,} punti)"
+
+
+def _render(punti, parametri):
+    return 'webgl' if punti > parametri['soglia_webgl'] else 'svg'
+
+
+# --- Figure delle schede ---
+
+def figura_consumo(df, parametri):
+    """Consumo mensile per macchina; oltre max_punti le serie sono ridotte con LTTB."""
+    ridotto = riduci_serie(df, 'data', 'consumo_kwh', 'macchina', parametri['max_punti'])
+    fig = px.line(
+        ridotto,
+        x='data',
+        y='consumo_kwh',
+        color='macchina',
+        markers=True,
+        render_mode=_render(len(ridotto), parametri),
+        title=_titolo("Consumo Energetico (kWh) nel Tempo", len(ridotto), len(df.dropna(subset=['consumo_kwh'])))
+    )
+    fig.update_layout(xaxis_title="Data", yaxis_title="Consumo (kWh)")
+    return fig
+
+
+def figura_costo(df, parametri):
+    """
+    Costo per macchina con una barra per mese; oltre max_punti i mesi vengono sommati per
+    anno, perché ogni mese diventa una serie (e una voce di legenda) a sé.
+    """
+    if len(df) <= parametri['max_punti']:
+        fig = px.bar(df, x='macchina', y='costo_macchina', color='data', barmode='group',
+                     title="Costo Energetico per Macchina")
+    else:
+        annuale = (df.groupby(['macchina', 'anno'], observed=True, sort=False)['costo_macchina']
+                   .sum().reset_index())
+        annuale['anno'] = annuale['anno'].astype(str)
+        fig = px.bar(annuale, x='macchina', y='costo_macchina', color='anno', barmode='group',
+                     title=_titolo("Costo Energetico per Macchina", len(annuale), len(df), 'somme per anno'))
+    fig.update_layout(xaxis_title="Macchina", yaxis_title="Costo (€)")
+    return fig
+
+
+def figura_consumo_per_pezzo(df, parametri):
+    """Dispersione pezzi/consumo per pezzo, con WebGL oltre soglia_webgl punti."""
+    df = df.dropna(subset=['consumo_per_pezzo'])
+    fig = px.scatter(
+        df,
+        x='pezzi_prodotti',
+        y='consumo_per_pezzo',
+        color='macchina',
+        size='consumo_kwh',
+        hover_data=['data', 'anno', 'mese'],
+        render_mode=_render(len(df), parametri),
+        title="Efficienza: Consumo per Pezzo Prodotto"
+    )
+    fig.update_layout(xaxis_title="Pezzi Prodotti", yaxis_title="Consumo (kWh) per Pezzo")
+    return fig
+
+
+def figura_consumo_per_ora(df, parametri):
+    """Box plot per macchina; oltre max_punti con quartili calcolati qui invece che nel browser."""
+    df = df.dropna(subset=['consumo_per_ora'])
+    titolo = "Distribuzione del Consumo per Ora di Lavoro"
+    if len(df) <= parametri['max_punti']:
+        fig = px.box(df, x='macchina', y='consumo_per_ora', title=titolo)
+    else:
+        statistiche = quartili_per_gruppo(df, 'macchina', 'consumo_per_ora')
+        fig = go.Figure(go.Box(
+            x=statistiche.index.astype(str),
+            q1=statistiche['q1'], median=statistiche['mediana'], q3=statistiche['q3'],
+            lowerfence=statistiche['minimo'], upperfence=statistiche['massimo'],
+            name='consumo_per_ora'
+        ))
+        fig.update_layout(title=f"{titolo} (quartili di {len(df):,} valori, senza valori anomali)")
+    fig.update_layout(xaxis_title="Macchina", yaxis_title="Consumo (kWh) per Ora")
+    return fig
+
+
+def figura_anomalie(df, parametri, soglia):
+    """Punteggi di anomalia nel tempo con le soglie ±soglia, con WebGL oltre soglia_webgl punti."""
+    fig = px.scatter(
+        df,
+        x='data',
+        y='punteggio',
+        color='macchina',
+        hover_data=['consumo_per_pezzo', 'mediana', 'anomalia'],
+        render_mode=_render(len(df), parametri),
+        title="Punteggio di Anomalia del Consumo per Pezzo"
+    )
+    fig.add_hline(y=soglia, line_dash='dash', line_color='red')
+    fig.add_hline(y=-soglia, line_dash='dash', line_color='red')
+    fig.update_layout(xaxis_title="Data", yaxis_title="Punteggio robusto")
+    return fig
+
+
+FIGURE = {
+    'consumo': figura_consumo,
+    'costo': figura_costo,
+    'consumo_per_pezzo': figura_consumo_per_pezzo,
+    'consumo_per_ora': figura_consumo_per_ora,
+    'anomalie': figura_anomalie,
+}
+
+
+class GraficiDashboard:
+    """
+    Figure delle schede, costruite una sola volta per versione dei dati e combinazione di
+    filtri e condivise tra le sessioni (le più vecchie escono dalla cache oltre
+    figure_in_cache). Chi riceve una figura non deve modificarla.
+
+        figura = grafici.figura('consumo', (dati.versione, filtri...), df_cubo)
+    """
+
+    def __init__(self, parametri=None):
+        self.parametri = {**PARAMETRI_GRAFICI, **(parametri or {})}
+        self._figure = OrderedDict()
+        self._lock = threading.Lock()
+
+    def figura(self, nome, chiave, df, *argomenti):
+        chiave = (nome, chiave, argomenti)
+        with self._lock:
+            figura = self._figure.get(chiave)
+            if figura is not None:
+                self._figure.move_to_end(chiave)
+                return figura
+        figura = FIGURE[nome](df, self.parametri, *argomenti)
+        with self._lock:
+            self._figure[chiave] = figura
+            while len(self._figure) > self.parametri['figure_in_cache']:
+                self._figure.popitem(last=False)
+        return figura
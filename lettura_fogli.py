@@ -0,0 +1,110 @@
+import time
+
+import openpyxl
+import pandas as pd
+from openpyxl.cell.cell import TYPE_ERROR, TYPE_NUMERIC
+from pandas.io.parsers import TextParser
+
+from validazione import CAMPI_MODELLO, normalizza_colonne, valida_colonne
+
+RIGHE_PER_BLOCCO = 5000
+
+
+def apri_workbook(file_path):
+    """Apre il workbook in sola lettura: i fogli vengono letti in streaming, senza caricare il DOM."""
+    return openpyxl.load_workbook(file_path, read_only=True, data_only=True, keep_links=False)
+
+
+def _converti_cella(cell):
+    # Stesse conversioni del lettore openpyxl di pandas.read_excel
+    if cell.value is None:
+        return ''
+    if cell.data_type == TYPE_ERROR:
+        return float('nan')
+    if cell.data_type == TYPE_NUMERIC:
+        intero = int(cell.value)
+        return intero if intero == cell.value else float(cell.value)
+    return cell.value
+
+
+def itera_righe(workbook, sheet_name):
+    """Generatore che produce le righe di un foglio una alla volta, come liste di valori."""
+    ws = workbook[sheet_name]
+    ws.reset_dimensions()
+    for row in ws.iter_rows():
+        yield [_converti_cella(cell) for cell in row]
+
+
+def blocchi_foglio(workbook, sheet_name, righe_per_blocco=RIGHE_PER_BLOCCO, riga_intestazione=0):
+    """
+    Legge un foglio in blocchi di righe e produce un DataFrame per ogni blocco.
+
+    L'intestazione è la riga `riga_intestazione` (come header= di pd.read_excel); le righe
+    precedenti vengono ignorate. L'indice di ogni blocco riporta la posizione della riga
+    sotto l'intestazione (come in pd.read_excel), quindi i numeri di riga negli errori non
+    cambiano. Le righe completamente vuote vengono saltate.
+    """
+    righe = itera_righe(workbook, sheet_name)
+    for _ in range(riga_intestazione):
+        next(righe, None)
+    intestazione = next(righe, None)
+    if intestazione is None:
+        return
+    while intestazione and intestazione[-1] == '':
+        intestazione.pop()
+    larghezza = len(intestazione)
+    if not larghezza:
+        return
+
+    blocco, posizioni = [], []
+    for posizione, riga in enumerate(righe):
+        if not any(v != '' for v in riga):
+            continue
+        # Le celle oltre l'intestazione non hanno un nome di colonna da validare
+        riga = riga[:larghezza] + [''] * (larghezza - len(riga))
+        blocco.append(riga)
+        posizioni.append(posizione)
+        if len(blocco) >= righe_per_blocco:
+            yield _blocco_in_dataframe(intestazione, blocco, posizioni)
+            blocco, posizioni = [], []
+    if blocco:
+        yield _blocco_in_dataframe(intestazione, blocco, posizioni)
+
+
+def _blocco_in_dataframe(intestazione, blocco, posizioni):
+    df = TextParser([intestazione] + blocco, header=0, skip_blank_lines=False).read()
+    df.index = posizioni
+    return df
+
+
+def leggi_e_valida_foglio(workbook, sheet_name, righe_per_blocco=RIGHE_PER_BLOCCO, tempi=None):
+    """
+    Legge in streaming un foglio macchina e ne valida le righe blocco per blocco.
+
+    In memoria restano solo il blocco corrente e le righe già validate.
+    Restituisce (righe_valide, errori). Se `tempi` è un dizionario, vi vengono
+    registrati i secondi spesi nella lettura ('lettura') e nella validazione ('validazione').
+    """
+    validi_per_blocco = []
+    errori = []
+    lettura = validazione = 0.0
+    istante = time.perf_counter()
+    for df in blocchi_foglio(workbook, sheet_name, righe_per_blocco):
+        letto = time.perf_counter()
+        lettura += letto - istante
+        # Standardizza i nomi delle colonne per la validazione
+        normalizza_colonne(df)
+        # Validazione vettoriale: le regole sono quelle di DatiMacchinaRow
+        validi, errori_blocco = valida_colonne(df)
+        errori.extend(errori_blocco)
+        if not validi.empty:
+            validi_per_blocco.append(validi)
+        istante = time.perf_counter()
+        validazione += istante - letto
+    lettura += time.perf_counter() - istante
+    if tempi is not None:
+        tempi.update(lettura=lettura, validazione=validazione)
+
+    if not validi_per_blocco:
+        return pd.DataFrame(columns=CAMPI_MODELLO), errori
+    return pd.concat(validi_per_blocco, ignore_index=True), errori
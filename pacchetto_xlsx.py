@@ -0,0 +1,80 @@
+import posixpath
+import re
+import xml.etree.ElementTree as ET
+import zipfile
+
+# Un file .xlsx è un archivio zip: qui si leggono le sue parti senza caricare il workbook con openpyxl.
+NS_MAIN = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+NS_REL = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+NS_PKG_REL = 'http://schemas.openxmlformats.org/package/2006/relationships'
+
+_RE_CELLA_CONDIVISA = re.compile(rb'<c\b[^>]*\bt="s"[^>]*>\s*<v>(\d+)</v>')
+_RE_STILE_CELLA = re.compile(rb'<c\b[^>]*\bs="(\d+)"')
+
+
+def _percorso_parte(base, target):
+    """Risolve il Target di una relazione rispetto alla cartella della parte che la dichiara."""
+    if target.startswith('/'):
+        return target.lstrip('/')
+    return posixpath.normpath(posixpath.join(base, target))
+
+
+def mappa_fogli(archivio: zipfile.ZipFile):
+    """Restituisce {nome_foglio: percorso della parte XML} nell'ordine del workbook."""
+    workbook = ET.fromstring(archivio.read('xl/workbook.xml'))
+    relazioni = ET.fromstring(archivio.read('xl/_rels/workbook.xml.rels'))
+    target_per_id = {r.get('Id'): r.get('Target') for r in relazioni.iter(f'{{{NS_PKG_REL}}}Relationship')}
+
+    fogli = {}
+    for foglio in workbook.iter(f'{{{NS_MAIN}}}sheet'):
+        rel_id = foglio.get(f'{{{NS_REL}}}id')
+        fogli[foglio.get('name')] = _percorso_parte('xl', target_per_id[rel_id])
+    return fogli
+
+
+def leggi_stringhe_condivise(archivio: zipfile.ZipFile):
+    """Legge la tabella delle stringhe condivise (sharedStrings.xml), se presente."""
+    if 'xl/sharedStrings.xml' not in archivio.namelist():
+        return []
+    stringhe = []
+    for _, elemento in ET.iterparse(archivio.open('xl/sharedStrings.xml')):
+        if elemento.tag == f'{{{NS_MAIN}}}si':
+            stringhe.append(''.join(t.text or '' for t in elemento.iter(f'{{{NS_MAIN}}}t')))
+            elemento.clear()
+    return stringhe
+
+
+def indici_stringhe_condivise(xml_foglio: bytes):
+    """Indici della tabella delle stringhe condivise usati dalle celle di un foglio."""
+    return [int(m) for m in _RE_CELLA_CONDIVISA.findall(xml_foglio)]
+
+
+def formati_numero_stili(archivio: zipfile.ZipFile):
+    """
+    Formato numerico di ogni stile di cella (cellXfs di styles.xml, nell'ordine degli
+    indici s="..."): il codice del formato se personalizzato, altrimenti l'id predefinito.
+    È la parte dello stile che cambia i valori letti (es. un numero formattato come data).
+    """
+    if 'xl/styles.xml' not in archivio.namelist():
+        return []
+    stili = ET.fromstring(archivio.read('xl/styles.xml'))
+    codici = {f.get('numFmtId'): f.get('formatCode') for f in stili.iter(f'{{{NS_MAIN}}}numFmt')}
+    celle = stili.find(f'{{{NS_MAIN}}}cellXfs')
+    if celle is None:
+        return []
+    formati = []
+    for xf in celle.iter(f'{{{NS_MAIN}}}xf'):
+        id_formato = xf.get('numFmtId', '0')
+        formati.append(codici.get(id_formato, id_formato))
+    return formati
+
+
+def indici_stili(xml_foglio: bytes):
+    """Indici degli stili di cella (attributo s) usati dalle celle di un foglio, senza ripetizioni."""
+    return sorted({int(m) for m in _RE_STILE_CELLA.findall(xml_foglio)})
+
+
+def percorso_relazioni(parte):
+    """Percorso del file .rels di una parte (es. xl/worksheets/_rels/sheet1.xml.rels)."""
+    cartella, nome = posixpath.split(parte)
+    return posixpath.join(cartella, '_rels', f'{nome}.rels')
@@ -0,0 +1,151 @@
+import numpy as np
+import pandas as pd
+
+from formati_colonne import decimali_mostrati
+
+try:
+    import pyarrow  # noqa: F401
+    # Con pyarrow le operazioni sulle stringhe e la conversione finale girano in codice compilato
+    _TIPO_TESTO = pd.StringDtype('pyarrow')
+    _TIPO_DECIMALI = 'double[pyarrow]'
+except ImportError:
+    _TIPO_TESTO = pd.StringDtype('python')
+    _TIPO_DECIMALI = 'float64'
+
+# Schema in memoria del Consolidato (vedi schema_consolidato): con molti utenti della
+# dashboard categorie, interi piccoli e float32 riducono la memoria di ogni istantanea
+COLONNE_CONSOLIDATO = ['anno', 'mese', 'macchina', 'ore_produzione', 'pezzi_prodotti', 'consumo_kwh', 'lettura',
+                       'costo_energia_per_kwh', 'costo_macchina', 'consumo_bolletta_kwh', 'totale_bolletta']
+TIPI_CHIAVI = {'macchina': 'category', 'anno': 'Int16', 'mese': 'Int8'}
+# Le letture del contatore sono progressivi con troppe cifre per float32
+COLONNE_DOPPIA_PRECISIONE = ('lettura',)
+
+# Più di un punto senza virgola ("1.234.567") può essere solo un separatore delle migliaia
+_RE_MIGLIAIA = r'[+-]?\d{1,3}(?:\.\d{3}){2,}'
+# Numero già normalizzato (punto decimale); tutto il resto diventa NaN come con errors='coerce'
+_RE_NUMERO = r'[+-]?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?'
+
+
+def _testo_in_numero(testo):
+    """
+    Converte stringhe in formato italiano ('1.234,56 €', '12,5', '-') in float.
+
+    Con la virgola i punti sono separatori delle migliaia; senza virgola un solo punto
+    resta il separatore decimale, come nella pulizia originale. Segnaposto e testo
+    non numerico (es. '-' o '- 0 €') diventano NaN.
+    """
+    testo = testo.str.replace('€', '', regex=False).str.strip()
+    migliaia = testo.str.contains(',', regex=False) | testo.str.fullmatch(_RE_MIGLIAIA)
+    testo = testo.str.replace('.', '', regex=False).where(migliaia.fillna(False), testo)
+    testo = testo.str.replace(',', '.', regex=False)
+    validi = testo.str.fullmatch(_RE_NUMERO).fillna(False)
+    return testo.where(validi).astype(_TIPO_DECIMALI).to_numpy(dtype='float64', na_value=np.nan)
+
+
+def converti_numeri_italiani(df, colonne):
+    """
+    Converte in numeri le colonne indicate in un solo passaggio sull'intero blocco.
+
+    Le colonne già numeriche restano invariate. Le colonne testuali (anche miste a
+    numeri) vengono accodate in un unico vettore di stringhe, normalizzato con
+    operazioni vettoriali e convertito con un solo cast.
+    """
+    colonne = [c for c in colonne if c in df.columns]
+    testuali = [c for c in colonne if not pd.api.types.is_numeric_dtype(df[c].dtype)]
+    if not testuali:
+        return df
+
+    blocco = pd.concat([df[c].astype(_TIPO_TESTO) for c in testuali], ignore_index=True)
+    valori = _testo_in_numero(blocco).reshape(len(testuali), len(df))
+    for i, col in enumerate(testuali):
+        df[col] = valori[i]
+    return df
+
+
+def data_da_anno_mese(anno, mese):
+    """Primo giorno del mese da anno e mese numerici, senza passare da stringhe (NaT se non validi)."""
+    anni = pd.to_numeric(anno, errors='coerce').to_numpy(dtype='float64', na_value=np.nan)
+    mesi = pd.to_numeric(mese, errors='coerce').to_numpy(dtype='float64', na_value=np.nan)
+    validi = (np.isfinite(anni) & np.isfinite(mesi) & (anni == np.round(anni)) & (mesi == np.round(mesi))
+              & (mesi >= 1) & (mesi <= 12) & (anni >= 1678) & (anni <= 2261))
+
+    date = np.full(len(anni), np.datetime64('NaT'), dtype='datetime64[ns]')
+    mesi_da_epoca = (anni[validi] - 1970) * 12 + (mesi[validi] - 1)
+    date[validi] = mesi_da_epoca.astype('int64').astype('datetime64[M]')
+    return pd.Series(date, index=getattr(anno, 'index', None))
+
+
+def schema_consolidato(config=None):
+    """
+    Tipo in memoria di ogni colonna finale del Consolidato (sezione colonne_finali di config.yaml).
+
+    Macchina come categoria, anno e mese come interi piccoli, metriche in float32 tranne
+    quelle della lista `colonne_doppia_precisione` della sezione 'dashboard'.
+    """
+    config = config or {}
+    colonne = config.get('colonne_finali') or COLONNE_CONSOLIDATO
+    doppie = set((config.get('dashboard') or {}).get('colonne_doppia_precisione', COLONNE_DOPPIA_PRECISIONE))
+    return {c: TIPI_CHIAVI.get(c, 'float64' if c in doppie else 'float32') for c in colonne}
+
+
+def _intero_piccolo(valori, tipo):
+    """Interi nullable del tipo indicato; valori non interi o fuori intervallo diventano mancanti."""
+    numeri = pd.to_numeric(valori, errors='coerce').to_numpy(dtype='float64', na_value=np.nan)
+    limiti = np.iinfo(tipo.lower())
+    validi = np.isfinite(numeri) & (numeri == np.round(numeri)) & (numeri >= limiti.min) & (numeri <= limiti.max)
+    interi = np.where(validi, numeri, 0).astype(tipo.lower())
+    return pd.arrays.IntegerArray(interi, ~validi).astype(tipo)
+
+
+def _decimale_compatto(valori, colonna):
+    """
+    float32 se l'errore di arrotondamento resta sotto un decimo dell'ultima cifra mostrata
+    (formati_colonne.decimali_mostrati), altrimenti float64.
+    """
+    doppi = np.asarray(valori, dtype='float64')
+    singoli = doppi.astype('float32')
+    tolleranza = 10.0 ** -(decimali_mostrati(colonna) + 1)
+    with np.errstate(invalid='ignore'):
+        errore = np.abs(singoli.astype('float64') - doppi)
+    return singoli if not (errore > tolleranza).any() else doppi
+
+
+def applica_schema(df, schema):
+    """Converte sul posto le colonne di `schema` presenti nel DataFrame nei tipi compatti."""
+    for col, tipo in schema.items():
+        if col not in df.columns:
+            continue
+        if tipo == 'category':
+            # Categorie nell'ordine di comparsa, come in IndiceConsolidato
+            df[col] = pd.Categorical(df[col], categories=df[col].dropna().unique())
+        elif tipo in ('Int8', 'Int16', 'Int32', 'Int64'):
+            df[col] = _intero_piccolo(df[col], tipo)
+        elif tipo == 'float32':
+            df[col] = _decimale_compatto(df[col], col)
+        else:
+            df[col] = df[col].astype(tipo)
+    return df
+
+
+def pulisci_consolidato(df, schema=None):
+    """
+    Pulizia del foglio Consolidato per la dashboard: righe e colonne vuote, numeri in
+    formato italiano e costo macchina ricalcolato, con i tipi compatti di `schema`
+    (predefinito: schema_consolidato()). Data e rapporti derivati non vengono salvati:
+    si calcolano sulle sole righe mostrate (vedi cubo_dashboard.aggiungi_rapporti).
+    """
+    schema = schema or schema_consolidato()
+    # Rimuove le righe e colonne completamente vuote
+    df = df.dropna(how='all').reset_index(drop=True)
+    df = df.loc[:, ~df.columns.str.contains('^Unnamed')]
+
+    # Conversione in un solo passaggio (gestisce '€', separatori delle migliaia e segnaposto '-')
+    numeric_cols = [c for c, tipo in schema.items() if tipo != 'category']
+    df = converti_numeri_italiani(df, numeric_cols)
+
+    # --- CALCOLO FORZATO PER RISOLVERE PROBLEMI DI VISUALIZZAZIONE ---
+    # Questa operazione sovrascrive la colonna 'costo_macchina' letta dal file,
+    # garantendo che sia sempre un valore numerico calcolato.
+    df['costo_macchina'] = df['consumo_kwh'].fillna(0) * df['costo_energia_per_kwh'].fillna(0)
+
+    return applica_schema(df, schema)
@@ -0,0 +1,86 @@
+from copy import copy
+
+import pandas as pd
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Border, NamedStyle, Side
+from openpyxl.styles.fonts import DEFAULT_FONT
+from openpyxl.utils import get_column_letter
+from openpyxl.worksheet.cell_range import CellRange
+
+METRICHE_REPORT = ['Quantita Prodotta', 'Consumo Energia']
+# Intestazioni della seconda riga, nell'ordine delle metriche ordinate per nome (Consumo, Quantita)
+ETICHETTE_METRICHE = ['kWh', 'Pezzi']
+STILE_BORDO = 'Bordo report'
+
+
+def _stile_bordo():
+    lato = Side(style='thin')
+    return NamedStyle(name=STILE_BORDO, font=DEFAULT_FONT,
+                      border=Border(left=lato, right=lato, top=lato, bottom=lato))
+
+
+def _riga(ws, stile, valori, colonne):
+    """Riga di celle con lo stile indicato, completata con celle vuote fino a `colonne`."""
+    valori = list(valori) + [None] * (colonne - len(valori))
+    celle = []
+    for valore in valori:
+        cella = WriteOnlyCell(ws, value=valore)
+        cella._style = copy(stile)
+        celle.append(cella)
+    return celle
+
+
+def scrivi_report_macchine(df_monthly, file_output, macchine_per_riga=3, larghezza_colonne=15):
+    """
+    Scrive il foglio "Report Macchine" con le macchine affiancate a gruppi di `macchine_per_riga`.
+
+    Il pivot mese x macchina viene calcolato una sola volta e poi tagliato per gruppo;
+    le righe vengono scritte in streaming con un foglio write-only, usando uno stile con
+    nome condiviso da tutte le celle invece di un bordo per cella.
+    """
+    chiavi = df_monthly.set_index(['Mese', 'Macchina'])
+    wide = chiavi[METRICHE_REPORT].unstack('Macchina').swaplevel(0, 1, axis=1)
+    wide = wide.sort_index(axis=1, level=[0, 1])
+    # Mesi presenti per ogni macchina: ogni gruppo riporta solo i mesi di almeno una sua macchina
+    presenza = pd.Series(True, index=chiavi.index).unstack('Macchina', fill_value=False)
+
+    all_machines = sorted(df_monthly['Macchina'].unique().tolist())
+    gruppi = [all_machines[i:i + macchine_per_riga] for i in range(0, len(all_machines), macchine_per_riga)]
+    colonne = 1 + 2 * max((len(g) for g in gruppi), default=0)
+
+    wb = Workbook(write_only=True)
+    wb.add_named_style(_stile_bordo())
+    ws = wb.create_sheet("Report Macchine")
+    ws.page_setup.orientation = 'portrait'
+    ws.page_setup.paperSize = 9  # A4
+    for col_idx in range(1, colonne + 1):
+        ws.column_dimensions[get_column_letter(col_idx)].width = larghezza_colonne
+    # Lo stile con nome viene risolto una volta sola e poi copiato su ogni cella
+    modello = WriteOnlyCell(ws)
+    modello.style = STILE_BORDO
+    stile = modello._style
+
+    current_row = 1
+    for n, gruppo in enumerate(gruppi):
+        # Prima riga di intestazione: nome della macchina unito sulle sue due colonne
+        intestazione = ["Mese"]
+        for col in range(2, 2 + 2 * len(gruppo), 2):
+            intestazione += [gruppo[(col - 2) // 2], None]
+            ws.merged_cells.add(CellRange(min_col=col, min_row=current_row, max_col=col + 1, max_row=current_row))
+        ws.append(_riga(ws, stile, intestazione, colonne))
+        ws.append(_riga(ws, stile, [""] + ETICHETTE_METRICHE * len(gruppo), colonne))
+        current_row += 2
+
+        mesi_gruppo = presenza[gruppo].any(axis=1).to_numpy()
+        df_chunk_wide = wide.loc[mesi_gruppo, gruppo]
+        for row_data in df_chunk_wide.reset_index().values.tolist():
+            ws.append(_riga(ws, stile, row_data, colonne))
+            current_row += 1
+
+        # Riga vuota (con i bordi) tra un gruppo e il successivo
+        if n < len(gruppi) - 1:
+            ws.append(_riga(ws, stile, [], colonne))
+            current_row += 1
+
+    wb.save(file_output)
@@ -0,0 +1,131 @@
+import itertools
+import math
+import numbers
+import os
+import re
+import shutil
+import tempfile
+import zipfile
+from xml.sax.saxutils import escape
+
+import numpy as np
+import openpyxl
+from openpyxl.utils import get_column_letter
+from openpyxl.utils.dataframe import dataframe_to_rows
+
+from archivio_parquet import firma_file
+from pacchetto_xlsx import mappa_fogli, percorso_relazioni
+
+NOME_FOGLIO = 'Consolidato'
+_INTESTAZIONE_XML = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+)
+# Caratteri di controllo non ammessi in XML 1.0
+_RE_CARATTERI_NON_VALIDI = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+_RIGHE_PER_SCRITTURA = 1000
+
+
+class WorkbookModificato(Exception):
+    """Il workbook è stato salvato da altri (es. in Excel) dopo la lettura: il foglio non viene scritto."""
+
+
+def _cella_xml(riferimento, valore):
+    """XML di una cella; None, NaN e infiniti diventano celle vuote (non scritte)."""
+    if valore is None:
+        return ''
+    if isinstance(valore, (bool, np.bool_)):
+        return f'<c r="{riferimento}" t="b"><v>{int(valore)}</v></c>'
+    if isinstance(valore, numbers.Integral):
+        return f'<c r="{riferimento}"><v>{int(valore)}</v></c>'
+    if isinstance(valore, numbers.Real):
+        valore = float(valore)
+        if not math.isfinite(valore):
+            return ''
+        return f'<c r="{riferimento}"><v>{valore!r}</v></c>'
+    if valore != valore:  # pd.NA / NaT
+        return ''
+    testo = escape(_RE_CARATTERI_NON_VALIDI.sub('', str(valore)))
+    return f'<c r="{riferimento}" t="inlineStr"><is><t xml:space="preserve">{testo}</t></is></c>'
+
+
+def _righe_xml(df):
+    """Genera l'XML del foglio riga per riga (intestazione compresa), a pezzi di testo."""
+    lettere = [get_column_letter(i + 1) for i in range(len(df.columns))]
+    ultima = f'{lettere[-1]}{len(df) + 1}' if lettere else 'A1'
+    yield f'{_INTESTAZIONE_XML}<dimension ref="A1:{ultima}"/><sheetData>'
+
+    buffer = []
+    righe = itertools.chain([list(df.columns)], df.itertuples(index=False, name=None))
+    for numero, valori in enumerate(righe, start=1):
+        celle = ''.join(_cella_xml(f'{lettera}{numero}', v) for lettera, v in zip(lettere, valori))
+        buffer.append(f'<row r="{numero}">{celle}</row>')
+        if len(buffer) >= _RIGHE_PER_SCRITTURA:
+            yield ''.join(buffer)
+            buffer = []
+    yield ''.join(buffer)
+    yield '</sheetData></worksheet>'
+
+
+def _sostituisci_parte_foglio(df, file_path, parte, destinazione):
+    """Copia l'archivio parte per parte, riscrivendo in streaming solo l'XML del foglio."""
+    with zipfile.ZipFile(file_path) as sorgente, \
+            zipfile.ZipFile(destinazione, 'w', compression=zipfile.ZIP_DEFLATED) as nuovo:
+        for info in sorgente.infolist():
+            if info.filename == parte:
+                nuova_parte = zipfile.ZipInfo(parte, date_time=info.date_time)
+                nuova_parte.compress_type = zipfile.ZIP_DEFLATED
+                with nuovo.open(nuova_parte, 'w', force_zip64=True) as f:
+                    for pezzo in _righe_xml(df):
+                        f.write(pezzo.encode('utf-8'))
+            else:
+                with sorgente.open(info) as da, nuovo.open(info, 'w') as a:
+                    shutil.copyfileobj(da, a, 1024 * 1024)
+
+
+def _salva_con_openpyxl(df, file_path, destinazione, nome_foglio):
+    """Percorso completo: carica l'intero workbook, sostituisce il foglio e lo salva."""
+    book = openpyxl.load_workbook(file_path)
+    if nome_foglio in book.sheetnames:
+        book.remove(book[nome_foglio])
+    new_sheet = book.create_sheet(nome_foglio)
+    for r in dataframe_to_rows(df, index=False, header=True):
+        new_sheet.append(r)
+    book.save(destinazione)
+
+
+def salva_foglio_consolidato(df, file_path, nome_foglio=NOME_FOGLIO, firma_lettura=None):
+    """
+    Sostituisce il foglio nome_foglio nel file Excel senza riscrivere gli altri fogli.
+
+    Se il foglio esiste già (e non ha parti collegate come tabelle o disegni) viene
+    riscritta solo la sua parte XML dentro l'archivio .xlsx; gli altri fogli vengono
+    copiati così come sono. Altrimenti si passa per openpyxl. In entrambi i casi il
+    risultato viene scritto in un file temporaneo nella stessa cartella e poi rinominato
+    sul file originale: un'interruzione non lascia mai il workbook a metà.
+
+    Con `firma_lettura` (firma_file() presa quando i fogli sono stati letti), se il file
+    è cambiato nel frattempo il temporaneo viene scartato e si solleva WorkbookModificato,
+    così un salvataggio fatto in Excel durante l'elaborazione non viene sovrascritto.
+    """
+    with zipfile.ZipFile(file_path) as archivio:
+        parte = mappa_fogli(archivio).get(nome_foglio)
+        veloce = parte is not None and percorso_relazioni(parte) not in archivio.namelist()
+
+    cartella = os.path.dirname(os.path.abspath(file_path))
+    descrittore, temporaneo = tempfile.mkstemp(suffix='.xlsx', prefix='.salvataggio_', dir=cartella)
+    os.close(descrittore)
+    try:
+        if veloce:
+            _sostituisci_parte_foglio(df, file_path, parte, temporaneo)
+        else:
+            _salva_con_openpyxl(df, file_path, temporaneo, nome_foglio)
+        shutil.copymode(file_path, temporaneo)
+        if firma_lettura is not None and firma_file(file_path) != firma_lettura:
+            raise WorkbookModificato(f"'{file_path}' è stato modificato durante l'elaborazione")
+        os.replace(temporaneo, file_path)
+    except BaseException:
+        if os.path.exists(temporaneo):
+            os.remove(temporaneo)
+        raise
+    return veloce
@@ -0,0 +1,219 @@
+import os
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+from configurazione import carica_config, percorsi_report
+from crea_consolidato import crea_foglio_consolidato
+from unisci_dati import USCITE, esegui_pipeline
+
+# Servizio che tiene aggiornati Consolidato (con copia Parquet e archivio storico) e report
+# statici: controlla i file di input a intervalli regolari e, quando uno cambia, esegue solo
+# le fasi che ne dipendono. Ogni fase gira nel proprio processo, così consolidamento e
+# report possono procedere insieme e le cache in memoria (es. carica_mensile) restano calde.
+# La dashboard non va riavviata: ricarica da sola i dati quando il file Excel cambia.
+PARAMETRI_SERVIZIO = {
+    'intervallo_secondi': 2,
+    'attesa_secondi': 5,
+    'riprova_secondi': 60,
+}
+
+
+def parametri_servizio(config):
+    """Parametri dalla sezione 'servizio' di config.yaml, con i valori predefiniti."""
+    parametri = dict(PARAMETRI_SERVIZIO)
+    parametri.update({k: v for k, v in ((config or {}).get('servizio') or {}).items() if k in parametri})
+    return parametri
+
+
+def fasi_servizio(config):
+    """
+    File di input di ogni fase. Per i report, le uscite che dipendono da ciascun file: se
+    cambia solo la bolletta viene riscritto solo il report globale. `scrive` indica che la
+    fase riscrive il file stesso (il Consolidato è un foglio del workbook di input).
+    """
+    percorsi = percorsi_report(config)
+    fasi = {}
+    if config.get('file_excel'):
+        fasi['consolidato'] = [{'percorso': config['file_excel'], 'obbligatorio': True, 'scrive': True}]
+    fasi['report'] = [
+        {'percorso': percorsi['file_quantita'], 'obbligatorio': True, 'uscite': USCITE},
+        {'percorso': percorsi['file_consumo'], 'obbligatorio': True, 'uscite': USCITE},
+        {'percorso': percorsi['file_bollette'], 'obbligatorio': False, 'uscite': ('globale',)},
+    ]
+    return fasi
+
+
+def esegui_fase(fase, uscite=None):
+    """Eseguita nel processo della fase: esito 'completata', 'interrotta', 'rimandata' o 'errore'."""
+    if fase == 'consolidato':
+        return crea_foglio_consolidato()
+    esegui_pipeline(list(uscite), carica_config())
+    return 'completata'
+
+
+def firma_ingresso(percorso):
+    """(mtime_ns, dimensione) del file, None se non esiste."""
+    try:
+        stat = os.stat(percorso)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def file_bloccato(percorso):
+    """True se il file è aperto in Excel o LibreOffice (file di blocco nella stessa cartella)."""
+    cartella, nome = os.path.split(os.path.abspath(percorso))
+    return any(os.path.exists(os.path.join(cartella, blocco)) for blocco in (f"~${nome}", f".~lock.{nome}#"))
+
+
+def xlsx_completo(percorso):
+    """False se l'archivio .xlsx è incompleto, ad esempio perché il salvataggio è ancora in corso."""
+    try:
+        with zipfile.ZipFile(percorso) as archivio:
+            return '[Content_Types].xml' in archivio.namelist()
+    except (OSError, zipfile.BadZipFile):
+        return False
+
+
+class ServizioAggiornamento:
+    """
+    Esegue le fasi (consolidato, report) quando cambiano i loro file di input.
+
+    Un file viene elaborato solo quando è stabile: data di modifica più vecchia di
+    `attesa_secondi` (così più salvataggi ravvicinati producono una sola esecuzione) e
+    archivio .xlsx completo. Il workbook principale, che il consolidamento riscrive, viene
+    elaborato solo quando non è aperto in Excel. Le fasi pubblicano i risultati in modo
+    atomico (file temporaneo + rinomina), quindi chi legge vede sempre la versione
+    precedente o quella nuova; se il workbook viene salvato mentre il consolidamento è in
+    corso, il risultato viene scartato e il file rielaborato. Se una fase fallisce i file
+    restano invariati e si riprova al cambiamento successivo o dopo `riprova_secondi`.
+    Alla partenza tutte le fasi vengono eseguite una volta (il consolidamento rilegge
+    comunque solo i fogli modificati).
+    """
+
+    def __init__(self, config=None):
+        self.config = carica_config() if config is None else config
+        self.parametri = parametri_servizio(self.config)
+        self.fasi = fasi_servizio(self.config)
+        # Firme degli input all'ultima esecuzione riuscita di ogni fase
+        self._elaborate = {fase: {} for fase in self.fasi}
+        self._in_corso = {}
+        self._errori = {}
+        self._avvisi = set()
+        # Un processo per fase: la stessa fase non gira mai due volte in parallelo
+        self._processi = {fase: ProcessPoolExecutor(max_workers=1) for fase in self.fasi}
+
+    def _avviso(self, fase, testo):
+        """Stampa un messaggio di attesa una sola volta finché la fase non viene eseguita."""
+        if (fase, testo) not in self._avvisi:
+            self._avvisi.add((fase, testo))
+            _stampa(f"{fase}: {testo}")
+
+    def _attesa(self, fase, ingresso, firma, adesso):
+        """
+        None se il file si può elaborare, altrimenti il motivo dell'attesa: 'stabilità' se
+        il file sta ancora cambiando, 'file' se manca o è aperto in Excel.
+        """
+        percorso = ingresso['percorso']
+        if firma is None:
+            if ingresso['obbligatorio']:
+                self._avviso(fase, f"in attesa del file '{percorso}'")
+                return 'file'
+            return None
+        if adesso - firma[0] / 1e9 < self.parametri['attesa_secondi']:
+            return 'stabilità'
+        if ingresso.get('scrive') and file_bloccato(percorso):
+            self._avviso(fase, f"'{percorso}' è aperto in Excel: aggiornamento rimandato alla chiusura")
+            return 'file'
+        if not xlsx_completo(percorso):
+            self._avviso(fase, f"'{percorso}' non è un file .xlsx completo (salvataggio in corso?)")
+            return 'stabilità'
+        return None
+
+    def _raccogli(self, adesso):
+        """Registra l'esito delle fasi terminate."""
+        for fase, (futuro, firme) in list(self._in_corso.items()):
+            if not futuro.done():
+                continue
+            del self._in_corso[fase]
+            try:
+                esito = futuro.result()
+            except Exception as e:
+                esito = 'errore'
+                _stampa(f"{fase}: errore {type(e).__name__}: {e}")
+            if esito == 'errore':
+                self._errori[fase] = (firme, adesso)
+                _stampa(f"{fase}: non riuscito, i file pubblicati sono invariati")
+                continue
+            if esito == 'rimandata':
+                # Il file è stato salvato durante l'elaborazione: le firme elaborate restano
+                # quelle precedenti, quindi il nuovo salvataggio viene elaborato appena stabile
+                _stampa(f"{fase}: file modificato durante l'elaborazione, verrà rielaborato")
+                continue
+            self._errori.pop(fase, None)
+            for ingresso in self.fasi[fase]:
+                if ingresso.get('scrive'):
+                    # La firma nuova è quella del salvataggio appena fatto, non una modifica da
+                    # elaborare; se nel frattempo il file è stato aperto si ricontrolla alla chiusura
+                    percorso = ingresso['percorso']
+                    firme[percorso] = None if file_bloccato(percorso) else firma_ingresso(percorso)
+            self._elaborate[fase] = firme
+            _stampa(f"{fase}: {esito}")
+
+    def controlla(self):
+        """
+        Un passaggio del servizio: raccoglie le fasi terminate e avvia quelle con input
+        cambiati e stabili. Restituisce True se c'è una fase in corso o in attesa che un
+        file finisca di cambiare (non se manca o è aperto in Excel).
+        """
+        adesso = time.time()
+        self._raccogli(adesso)
+        in_attesa = False
+        for fase, ingressi in self.fasi.items():
+            if fase in self._in_corso:
+                continue
+            firme = {i['percorso']: firma_ingresso(i['percorso']) for i in ingressi}
+            elaborate = self._elaborate[fase]
+            cambiati = [i for i in ingressi
+                        if i['percorso'] not in elaborate or firme[i['percorso']] != elaborate[i['percorso']]]
+            if not cambiati:
+                continue
+            errore = self._errori.get(fase)
+            if errore is not None and errore[0] == firme and adesso - errore[1] < self.parametri['riprova_secondi']:
+                continue
+            attese = {self._attesa(fase, i, firme[i['percorso']], adesso) for i in cambiati} - {None}
+            if attese:
+                in_attesa = in_attesa or 'stabilità' in attese
+                continue
+
+            uscite = None
+            if fase == 'report':
+                dipendenti = {u for i in cambiati for u in i['uscite']}
+                uscite = [u for u in USCITE if u in dipendenti]
+            self._avvisi = {a for a in self._avvisi if a[0] != fase}
+            _stampa(f"{fase}: avvio" + (f" ({', '.join(uscite)})" if uscite else '')
+                    + f", file cambiati: {', '.join(i['percorso'] for i in cambiati)}")
+            self._in_corso[fase] = (self._processi[fase].submit(esegui_fase, fase, uscite), firme)
+        return bool(self._in_corso) or in_attesa
+
+    def esegui(self, una_volta=False):
+        """Ciclo del servizio; con una_volta=True termina quando tutto è aggiornato."""
+        _stampa(f"Servizio avviato: controllo ogni {self.parametri['intervallo_secondi']} s "
+                f"({', '.join(self.fasi)}). Ctrl+C per fermarlo.")
+        try:
+            while True:
+                attivo = self.controlla()
+                if una_volta and not attivo:
+                    break
+                time.sleep(self.parametri['intervallo_secondi'])
+        except KeyboardInterrupt:
+            _stampa("Servizio interrotto: attendo la fine delle fasi in corso...")
+        finally:
+            for processo in self._processi.values():
+                processo.shutdown(wait=True, cancel_futures=True)
+            self._raccogli(time.time())
+
+
+def _stampa(testo):
+    print(f"[{time.strftime('%H:%M:%S')}] {testo}", flush=True)
@@ -0,0 +1,277 @@
+import cProfile
+import io
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+# Impostazioni della sezione 'strumentazione' di config.yaml
+PARAMETRI_STRUMENTAZIONE = {
+    'cartella': '.esecuzioni',
+    'memoria': False,
+    'profilo': None,
+}
+# Variabile d'ambiente che attiva il profilo senza modificare config.yaml ('cprofile' o 'pyinstrument')
+VARIABILE_PROFILO = 'ENERGIA_PROFILO'
+PROFILATORI = ('cprofile', 'pyinstrument')
+
+# Misure di memoria aperte in questo processo: una misura annidata (es. un foglio dentro
+# la fase di lettura) azzera il picco di tracemalloc, quindi il picco raggiunto fino a quel
+# momento viene prima riportato su tutte le misure ancora aperte
+_misure_aperte = []
+_lock_misure = threading.Lock()
+# True se tracemalloc è stato avviato da misura(): lo ferma l'ultima misura che si chiude
+_tracemalloc_avviato = False
+
+
+def parametri_strumentazione(config):
+    """Impostazioni dalla sezione 'strumentazione' di config.yaml; ENERGIA_PROFILO ha la precedenza."""
+    parametri = dict(PARAMETRI_STRUMENTAZIONE)
+    parametri.update({k: v for k, v in ((config or {}).get('strumentazione') or {}).items() if k in parametri})
+    profilo = os.environ.get(VARIABILE_PROFILO, '').strip().lower()
+    if profilo:
+        parametri['profilo'] = None if profilo in ('0', 'no', 'off') else profilo
+    if parametri['profilo'] in (True, '1', 'si', 'on'):
+        parametri['profilo'] = 'cprofile'
+    return parametri
+
+
+class _Picco:
+    # Confronto per identità: due misure aperte non sono mai la stessa
+    def __init__(self):
+        self.byte = 0
+
+
+def _riporta_picco():
+    picco = tracemalloc.get_traced_memory()[1]
+    for misura in _misure_aperte:
+        misura.byte = max(misura.byte, picco)
+
+
+@contextmanager
+def misura(memoria=False):
+    """
+    Misura durata (secondi) e, se richiesto, picco di memoria (MB, con tracemalloc) del blocco.
+
+    Il dizionario restituito viene completato all'uscita dal blocco. tracemalloc rallenta
+    sensibilmente il codice Python, per questo la memoria si misura solo su richiesta.
+    Con più thread in parallelo i picchi includono anche la memoria degli altri thread.
+    """
+    global _tracemalloc_avviato
+    risultato = {'secondi': None, 'picco_mb': None}
+    picco = None
+    if memoria:
+        with _lock_misure:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                _tracemalloc_avviato = True
+            picco = _Picco()
+            # Se tracemalloc è stato avviato da altri (es. un benchmark) il suo picco non va
+            # azzerato: la misura diventa un limite superiore
+            if _tracemalloc_avviato:
+                _riporta_picco()
+                tracemalloc.reset_peak()
+            _misure_aperte.append(picco)
+    inizio = time.perf_counter()
+    try:
+        yield risultato
+    finally:
+        risultato['secondi'] = time.perf_counter() - inizio
+        if picco is not None:
+            with _lock_misure:
+                if tracemalloc.is_tracing():
+                    _riporta_picco()
+                _misure_aperte.remove(picco)
+                if _tracemalloc_avviato and not _misure_aperte:
+                    tracemalloc.stop()
+                    _tracemalloc_avviato = False
+            risultato['picco_mb'] = round(picco.byte / 2**20, 2)
+
+
+def _picco_processo_mb():
+    """Picco di memoria residente del processo, se il sistema lo fornisce (non su Windows)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    picco = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux lo riporta in KB, macOS in byte
+    return round(picco / (2**20 if sys.platform == 'darwin' else 2**10), 1)
+
+
+class Esecuzione:
+    """
+    Registro delle prestazioni di un'esecuzione (consolidamento, report, caricamento dashboard).
+
+    Per ogni fase registra durata, righe elaborate e picco di memoria; per il
+    consolidamento anche il dettaglio di ogni foglio. Al termine il resoconto viene
+    scritto in JSON nella cartella configurata (<procedura>_ultima.json, più una riga in
+    <procedura>_storico.jsonl). Con il profilo attivo (config o ENERGIA_PROFILO) viene
+    salvato anche il profilo dell'intera esecuzione.
+
+        with Esecuzione('consolidato', config) as esecuzione:
+            with esecuzione.fase('lettura') as fase:
+                ...
+                fase['righe'] = len(df)
+    """
+
+    def __init__(self, procedura, config=None):
+        self.procedura = procedura
+        self.parametri = parametri_strumentazione(config)
+        self.fasi = []
+        self.fogli = []
+        self.info = {}
+        self.esito = 'interrotta'
+        self.rapporto = None
+        self._profilatore = None
+        self._misura_totale = None
+        self._inizio = None
+
+    # --- Fasi ---
+
+    @contextmanager
+    def fase(self, nome, **dettagli):
+        """Misura una fase; il dizionario restituito accetta 'righe' e altri dettagli."""
+        voce = {'fase': nome, **dettagli}
+        with misura(self.parametri['memoria']) as misurato:
+            yield voce
+        voce.update(misurato)
+        self.fasi.append(voce)
+
+    def aggiungi_foglio(self, foglio, **valori):
+        """Misure di un foglio (anche prese in un processo worker)."""
+        self.fogli.append({'foglio': foglio, **valori})
+
+    def tempi(self):
+        """Durata di ogni fase in secondi, nell'ordine in cui sono terminate."""
+        return {voce['fase']: voce['secondi'] for voce in self.fasi}
+
+    # --- Inizio e fine ---
+
+    def __enter__(self):
+        self._inizio = datetime.now()
+        self._avvia_profilo()
+        self._misura_totale = misura(self.parametri['memoria'])
+        self._totale = self._misura_totale.__enter__()
+        return self
+
+    def __exit__(self, tipo, errore, traceback):
+        self._misura_totale.__exit__(tipo, errore, traceback)
+        if errore is not None:
+            self.esito = 'errore'
+            self.info['errore'] = f"{tipo.__name__}: {errore}"
+        profilo = self._ferma_profilo()
+        self.rapporto = {
+            'procedura': self.procedura,
+            'inizio': self._inizio.isoformat(timespec='seconds'),
+            'fine': datetime.now().isoformat(timespec='seconds'),
+            'esito': self.esito,
+            'secondi_totali': round(self._totale['secondi'], 4),
+            'picco_mb': self._totale['picco_mb'],
+            'picco_processo_mb': _picco_processo_mb(),
+            'pid': os.getpid(),
+            **self.info,
+            'fasi': [_arrotonda(voce) for voce in self.fasi],
+            'fogli': [_arrotonda(voce) for voce in self.fogli],
+            'profilo': profilo,
+        }
+        try:
+            self._salva()
+        except OSError as e:
+            # Il resoconto non deve mai far fallire l'esecuzione
+            print(f"Resoconto delle prestazioni non salvato: {e}")
+        return False
+
+    def _percorso(self, suffisso):
+        return os.path.join(self.parametri['cartella'], f"{self.procedura}{suffisso}")
+
+    def _salva(self):
+        if not self.parametri['cartella']:
+            return
+        os.makedirs(self.parametri['cartella'], exist_ok=True)
+        percorso = self._percorso('_ultima.json')
+        temporaneo = f"{percorso}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temporaneo, 'w', encoding='utf-8') as f:
+            json.dump(self.rapporto, f, indent=2, ensure_ascii=False)
+        os.replace(temporaneo, percorso)
+        with open(self._percorso('_storico.jsonl'), 'a', encoding='utf-8') as f:
+            f.write(json.dumps(self.rapporto, ensure_ascii=False) + '\n')
+
+    # --- Profilo (cProfile o pyinstrument) ---
+
+    def _avvia_profilo(self):
+        tipo = self.parametri['profilo']
+        if not tipo:
+            return
+        if tipo not in PROFILATORI:
+            print(f"Profilatore '{tipo}' non riconosciuto (valori ammessi: {', '.join(PROFILATORI)}): uso cprofile.")
+            tipo = 'cprofile'
+        if tipo == 'pyinstrument':
+            try:
+                from pyinstrument import Profiler
+                self._profilatore = ('pyinstrument', Profiler())
+                self._profilatore[1].start()
+                return
+            except ImportError:
+                print("pyinstrument non installato: uso cProfile.")
+        profilatore = cProfile.Profile()
+        try:
+            profilatore.enable()
+        except ValueError as e:
+            # Un altro profilatore è già attivo (es. un'altra esecuzione nello stesso processo)
+            print(f"Profilo non avviato: {e}")
+            return
+        self._profilatore = ('cprofile', profilatore)
+
+    def _ferma_profilo(self):
+        """Ferma il profilatore, salva il profilo e ne restituisce il percorso."""
+        if self._profilatore is None:
+            return None
+        tipo, profilatore = self._profilatore
+        self._profilatore = None
+        cartella = self.parametri['cartella'] or '.'
+        os.makedirs(cartella, exist_ok=True)
+        if tipo == 'pyinstrument':
+            profilatore.stop()
+            percorso = os.path.join(cartella, f"{self.procedura}_profilo.html")
+            with open(percorso, 'w', encoding='utf-8') as f:
+                f.write(profilatore.output_html())
+        else:
+            profilatore.disable()
+            percorso = os.path.join(cartella, f"{self.procedura}.prof")
+            profilatore.dump_stats(percorso)
+            testo = io.StringIO()
+            pstats.Stats(profilatore, stream=testo).sort_stats('cumulative').print_stats(15)
+            print(testo.getvalue())
+        print(f"Profilo salvato in: {percorso}")
+        return percorso
+
+
+def _arrotonda(voce):
+    return {k: round(v, 4) if isinstance(v, float) else v for k, v in voce.items()}
+
+
+def leggi_ultima_esecuzione(procedura, config=None):
+    """Resoconto dell'ultima esecuzione della procedura, o None se non disponibile."""
+    cartella = parametri_strumentazione(config)['cartella']
+    if not cartella:
+        return None
+    try:
+        with open(os.path.join(cartella, f"{procedura}_ultima.json"), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def stampa_fasi(esecuzione):
+    """Tabella delle fasi a console, con righe e memoria quando disponibili."""
+    print("\nTempi delle fasi:")
+    for voce in esecuzione.fasi:
+        righe = f"  {voce['righe']:>10,} righe" if voce.get('righe') is not None else ''
+        memoria = f"  picco {voce['picco_mb']:8.1f} MB" if voce.get('picco_mb') is not None else ''
+        print(f"  {voce['fase']:<28} {voce['secondi']:8.2f} s{righe}{memoria}")
@@ -0,0 +1,179 @@
+import numpy as np
+import pandas as pd
+from typing import Optional
+from pydantic import BaseModel, ValidationError, field_validator
+
+# --- Modello di Dati con Pydantic ---
+class DatiMacchinaRow(BaseModel):
+    """Definisce la struttura e i tipi di una riga di dati valida."""
+    macchina_o_impianto: str
+    anno: int
+    mese: int
+    ore_produzione_macchina: Optional[float] = None
+    pezzi_prodotti: Optional[float] = None
+    consumo: Optional[float] = None
+    lettura: Optional[float] = None
+    costo_energia: Optional[float] = None
+    costo_macchina: Optional[float] = None
+    consumo_da_bolletta: Optional[float] = None
+    totale_bolletta: Optional[float] = None
+
+    @field_validator('*', mode='before')
+    def empty_str_to_none(cls, v):
+        if isinstance(v, str) and v.strip() in ('', '-'):
+            return None
+        return v
+
+# Campi del modello nell'ordine in cui Pydantic li valida (e li riporta negli errori)
+CAMPI_MODELLO = list(DatiMacchinaRow.model_fields)
+CAMPI_INTERI = ['anno', 'mese']
+CAMPI_DECIMALI = [c for c in CAMPI_MODELLO if c not in ('macchina_o_impianto', *CAMPI_INTERI)]
+VALORI_VUOTI = ('', '-')
+
+
+def normalizza_colonne(df):
+    """Standardizza i nomi delle colonne per la validazione ('ore produzione ' -> 'ore_produzione')."""
+    df.columns = df.columns.astype(str).str.strip().str.replace(' ', '_')
+    return df
+
+
+def _righe_da_saltare(df):
+    """Righe senza macchina: vengono ignorate in silenzio, come nel flusso originale."""
+    if 'macchina_o_impianto' not in df.columns:
+        return pd.Series(True, index=df.index)
+    macchina = df['macchina_o_impianto']
+    return macchina.isna() | (macchina.astype(str).str.strip() == '')
+
+
+def _errore_pydantic(errore: ValidationError):
+    dettagli = errore.errors()[0]
+    return f"{dettagli['msg']} (colonna: {dettagli['loc'][0]})"
+
+
+def valida_righe(df):
+    """
+    Validazione riga per riga con il modello Pydantic (percorso originale).
+
+    Restituisce il DataFrame delle righe valide e la lista degli errori
+    come tuple (numero_riga_excel, messaggio).
+    """
+    valid_rows = []
+    errori = []
+    da_saltare = _righe_da_saltare(df)
+
+    for index, row in df.iterrows():
+        if da_saltare[index]:
+            continue
+        try:
+            validated_row = DatiMacchinaRow(**row.to_dict())
+            valid_rows.append(validated_row.model_dump())
+        except ValidationError as e:
+            errori.append((index + 2, _errore_pydantic(e)))
+
+    return pd.DataFrame(valid_rows, columns=CAMPI_MODELLO), errori
+
+
+def _tipi_valori(serie):
+    """Per le colonne 'object' individua stringhe e booleani (vettoriale solo sui tipi numerici)."""
+    if serie.dtype != object:
+        is_str = pd.Series(pd.api.types.is_string_dtype(serie.dtype), index=serie.index)
+        is_bool = pd.Series(pd.api.types.is_bool_dtype(serie.dtype), index=serie.index)
+        return is_str & serie.notna(), is_bool
+    tipi = serie.map(type)
+    return tipi.eq(str), tipi.eq(bool) | tipi.eq(np.bool_)
+
+
+def _stringhe_vuote(serie, is_str):
+    """Celle che empty_str_to_none trasforma in None ('' o '-', spazi esclusi)."""
+    if not is_str.any():
+        return pd.Series(False, index=serie.index)
+    return is_str & serie.where(is_str).str.strip().isin(VALORI_VUOTI)
+
+
+def _colonna_numerica(serie):
+    """
+    Converte una colonna in float e indica le celle che il percorso veloce non sa
+    trattare con certezza (stringhe non vuote, booleani, date...).
+    """
+    is_str, is_bool = _tipi_valori(serie)
+    vuota = _stringhe_vuote(serie, is_str)
+
+    if not (serie.dtype == object or pd.api.types.is_string_dtype(serie.dtype)
+            or pd.api.types.is_numeric_dtype(serie.dtype)):
+        # Date, durate...: to_numeric le renderebbe interi, Pydantic le rifiuta
+        return pd.Series(np.nan, index=serie.index), vuota, serie.notna()
+
+    if pd.api.types.is_numeric_dtype(serie.dtype) and not pd.api.types.is_bool_dtype(serie.dtype):
+        valori = serie.astype('float64')
+    else:
+        valori = pd.to_numeric(serie.where(~is_str & ~is_bool), errors='coerce').astype('float64')
+
+    sospetta = (serie.notna() & valori.isna() & ~vuota) | is_bool | (is_str & ~vuota)
+    return valori.where(~vuota), vuota, sospetta
+
+
+def valida_colonne(df):
+    """
+    Validazione vettoriale, colonna per colonna, con le stesse regole di DatiMacchinaRow.
+
+    Le celle numeriche e le stringhe vuote ('' o '-') vengono risolte sull'intera colonna.
+    Le righe che contengono valori non riconducibili con certezza (stringhe da
+    interpretare, booleani, valori mancanti nei campi obbligatori...) vengono passate
+    al modello Pydantic, che resta l'unico arbitro: così righe valide ed errori
+    registrati coincidono con quelli di valida_righe().
+    """
+    da_saltare = _righe_da_saltare(df)
+    df = df.loc[~da_saltare]
+    sospette = pd.Series(False, index=df.index)
+    colonne = {}
+
+    for campo in CAMPI_MODELLO:
+        if campo not in df.columns:
+            if campo in CAMPI_DECIMALI:
+                colonne[campo] = np.full(len(df), np.nan)
+            else:
+                sospette[:] = True  # 'Field required': il messaggio lo produce Pydantic
+            continue
+
+        serie = df[campo]
+        if campo == 'macchina_o_impianto':
+            is_str, _ = _tipi_valori(serie)
+            sospette |= ~is_str | _stringhe_vuote(serie, is_str)
+            colonne[campo] = serie.astype(object)
+            continue
+
+        valori, vuota, sospetta = _colonna_numerica(serie)
+        if campo in CAMPI_INTERI:
+            interi = valori.notna() & np.isfinite(valori) & (valori == valori.round())
+            sospette |= sospetta | vuota | ~interi
+            colonne[campo] = valori
+        else:
+            sospette |= sospetta
+            colonne[campo] = valori
+
+    righe_valide = pd.Series(True, index=df.index)
+    errori = []
+    recuperate = []
+
+    if sospette.any():
+        # Il modello Pydantic decide sulle sole righe che il percorso veloce non ha risolto
+        righe_valide = ~sospette
+        for index, row in df.loc[sospette].iterrows():
+            try:
+                recuperate.append((index, DatiMacchinaRow(**row.to_dict()).model_dump()))
+            except ValidationError as e:
+                errori.append((index + 2, _errore_pydantic(e)))
+
+    if len(colonne) < len(CAMPI_MODELLO):
+        # Manca un campo obbligatorio: nessuna riga può superare il percorso veloce
+        validi = pd.DataFrame(columns=CAMPI_MODELLO)
+    else:
+        validi = pd.DataFrame(colonne, index=df.index, columns=CAMPI_MODELLO).loc[righe_valide]
+        for campo in CAMPI_INTERI:
+            validi[campo] = validi[campo].astype('int64')
+
+    if recuperate:
+        extra = pd.DataFrame([r for _, r in recuperate], index=[i for i, _ in recuperate], columns=CAMPI_MODELLO)
+        validi = pd.concat([validi, extra]).sort_index() if not validi.empty else extra
+
+    return validi.reset_index(drop=True), errori